@@ -1,141 +1,215 @@
-from flask import Flask, render_template, request, jsonify
+from flask import (
+    Blueprint, Flask, Response, current_app, render_template, request, jsonify, stream_template, stream_with_context,
+    url_for
+)
+from jinja2 import FileSystemBytecodeCache
+import io
+import math
 import os
-import numpy as np
-import google.generativeai as genai
 from dotenv import load_dotenv
-import markdown2  # Add this import
-from utils.prompt_builder import generate_prompt
-from utils.biological_age import calculate_biological_age
+from utils.prompt_builder import generate_prompt, generation_config
+from utils.aging_clocks import CLOCKS, PRIMARY_CLOCK, panel_clocks
+from utils.api import API_VERSION, analyze_panels, parse_panels
+from utils.assets import CACHE_CONTROL, AssetPipeline, choose_encoding
+from utils.bulk_ingest import DEFAULT_CHUNK_SIZE, detect_format, iter_chunks, iter_result_csv, pq
+from utils.gemini import get_model
+from utils.health_analysis import analyze_health
+from utils.history_store import HistoryStore, panel_user_data
+from utils.incremental import plan_sections
+from utils.llm_cache import ResponseCache, generate_text
+from utils.jobs import DONE, FAILED, JobQueue, job_key
+from utils.llm_client import ADVICE, BATCH, INTERACTIVE, with_priority
+from utils.llm_combined import generate_combined, iter_combined_events
+from utils.llm_fanout import AI_SECTIONS, generate_sections, iter_section_events
+from utils.markdown_render import MarkdownRenderer
+from utils.metrics import RULE_FALLBACKS, SECTIONS_REUSED, Trace, render_metrics
+from utils.panel import PanelError, marker_values, parse_panel, user_data_for
+from utils.percentiles import PercentileIndex
+from utils.rule_advice import FALLBACK_LEAD, rule_sections, rule_sections_html
+from utils.reference import ABOVE, BELOW, MARKER_INFO, REFERENCE, UNKNOWN_MARKER_INFO, WITHIN
 
-# Load environment variables and configure Gemini
-load_dotenv()
-api_key = os.getenv("GEMINI_API_KEY")
-if not api_key:
-    raise RuntimeError("GEMINI_API_KEY not found in .env file")
-genai.configure(api_key=api_key)
+# Routes are registered on the app by create_app()
+views = Blueprint('views', __name__)
 
-# Initialize Flask and Gemini model
-app = Flask(__name__)
-model = genai.GenerativeModel('gemini-1.5-flash')
+# Versioned JSON API, registered at /api/v<API_VERSION> and, for the current version, at /api
+api = Blueprint('api', __name__)
+
+# Marker-table label and CSS class for each ReferenceTable.range_status code
+MARKER_STATUS_LABELS = {
+    BELOW: ("Below Normal", "status-low"),
+    WITHIN: ("Normal", "status-normal"),
+    ABOVE: ("Above Normal", "status-high")
+}
+
+# Stored panel fields /history leaves out: internal ids, result tokens and the generated text
+HISTORY_HIDDEN_FIELDS = ('id', 'token', 'patient_id', 'analysis', 'ai_sections', 'prompt_version')
 
 def get_marker_info(marker):
     """Get reference ranges and descriptions for biomarkers"""
-    info = {
-        'albumin': {
-            'range': '3.4-5.4 g/dL',
-            'optimal': (4.3, 5.2),
-            'unit': 'g/dL',
-            'description': 'Protein made by liver; low levels can indicate malnutrition or liver/kidney disease',
-            'thresholds': {'low': 3.4, 'high': 5.4}
-        },
-        'glucose': {
-            'range': '70-99 mg/dL',
-            'optimal': (70, 90),
-            'unit': 'mg/dL',
-            'description': 'Blood sugar level; high levels indicate diabetes risk or metabolic issues',
-            'thresholds': {'low': 70, 'high': 99}
-        },
-        'crp': {
-            'range': '0-3.0 mg/L',
-            'optimal': (0, 1),
-            'unit': 'mg/L',
-            'description': 'Inflammation marker; elevated levels indicate systemic inflammation',
-            'thresholds': {'low': 0, 'high': 3.0}
-        },
-        'lymph_pct': {
-            'range': '20-40%',
-            'optimal': (25, 35),
-            'unit': '%',
-            'description': 'Percentage of white blood cells that are lymphocytes; immune system indicator',
-            'thresholds': {'low': 20, 'high': 40}
-        },
-        'mcv': {
-            'range': '80-100 fL',
-            'optimal': (85, 95),
-            'unit': 'fL',
-            'description': 'Mean Corpuscular Volume; size of red blood cells',
-            'thresholds': {'low': 80, 'high': 100}
-        },
-        'rdw': {
-            'range': '11.5-14.5%',
-            'optimal': (12.0, 13.5),
-            'unit': '%',
-            'description': 'Red Cell Distribution Width; variation in red blood cell size',
-            'thresholds': {'low': 11.5, 'high': 14.5}
-        },
-        'alk_phos': {
-            'range': '44-147 U/L',
-            'optimal': (50, 120),
-            'unit': 'U/L',
-            'description': 'Alkaline Phosphatase; enzyme related to liver and bone health',
-            'thresholds': {'low': 44, 'high': 147}
-        },
-        'wbc': {
-            'range': '4.5-11.0 K/µL',
-            'optimal': (5.0, 8.0),
-            'unit': 'K/µL',
-            'description': 'White Blood Cell count; immune system activity indicator',
-            'thresholds': {'low': 4.5, 'high': 11.0}
-        },
-        'creatinine': {
-            'range': '0.6-1.3 mg/dL',
-            'optimal': (0.7, 1.2),
-            'unit': 'mg/dL',
-            'description': 'Kidney function marker; filtered waste product from muscles',
-            'thresholds': {'low': 0.6, 'high': 1.3}
+    return MARKER_INFO.get(marker, UNKNOWN_MARKER_INFO)
+
+def format_markdown(text):
+    """Convert markdown to HTML with specific extras enabled (memoized; see utils.markdown_render)"""
+    return current_app.extensions['markdown_renderer'].render(text)
+
+def asset_url(name):
+    """URL of static/<name> under its content-hashed name; a template global"""
+    return url_for('views.asset', name=current_app.extensions['assets'].name_for(name))
+
+def response_cache():
+    return current_app.extensions['response_cache']
+
+def history_store():
+    """The panel history store, or None when BLOODIQ_HISTORY_PATH is not set"""
+    return current_app.extensions['history_store']
+
+def percentile_index():
+    """The population percentile index, or None when BLOODIQ_PERCENTILE_INDEX is not set"""
+    return current_app.extensions['percentiles']
+
+def panel_percentiles(panel, biological_age):
+    index = percentile_index()
+    return index.panel_percentiles(panel, biological_age) if index is not None else None
+
+def secondary_clocks(clocks):
+    """(label, years) for each aging clock in `clocks` besides the primary one, shown under biological age"""
+    return [(CLOCKS[name].label, years) for name, years in clocks.items() if name != PRIMARY_CLOCK and years is not None]
+
+def job_queue():
+    return current_app.extensions['jobs']
+
+def build_marker_insights(biomarkers):
+    """Marker table rows for every biomarker with a value (a Panel or a dict), in its order"""
+    # Classify the whole panel against the shared reference table in one comparison
+    values = marker_values(biomarkers)
+    statuses = REFERENCE.range_status(values).tolist()
+    values = values.tolist()
+
+    marker_insights = {}
+    for marker in biomarkers:
+        i = REFERENCE.index.get(marker)  # None for age, which is not a biomarker
+        if i is None or math.isnan(values[i]):
+            continue
+        info = get_marker_info(marker)
+        status, status_class = MARKER_STATUS_LABELS[statuses[i]]
+        marker_insights[marker] = {
+            'value': values[i],
+            'unit': info['unit'],
+            'range': info['range'],
+            'description': info['description'],
+            'status': status,
+            'status_class': status_class,
+            'reference': info  # Include full reference data
         }
+    return marker_insights
+
+def combined_mode():
+    """True when AI sections come from one combined call rather than one call per section"""
+    return request.args.get('ai_mode', current_app.config['AI_MODE']) == 'combined'
+
+def rules_mode():
+    """True for the fast tier: AI sections come from utils.rule_advice and Gemini is not called"""
+    return request.args.get('ai_mode', current_app.config['AI_MODE']) == 'rules'
+
+def fallback_sections(user_data, slots):
+    """Rule-based HTML for sections the LLM did not deliver, each under FALLBACK_LEAD"""
+    for slot in slots:
+        RULE_FALLBACKS.labels(slot).inc()
+    return rule_sections_html(user_data, {slot: AI_SECTIONS[slot] for slot in slots}, lead=FALLBACK_LEAD)
+
+def stream_ai_sections(model, user_data, trace, combined=False, panel_id=None, reused=None, pending=AI_SECTIONS):
+    """
+    Yield (slot, 'html', rendered) for each `reused` section at once, then (slot, 'chunk', text)
+    while tokens arrive and (slot, 'html', rendered) per `pending` section
+    """
+    texts = dict(reused or {})
+    for slot, text in texts.items():
+        yield slot, 'html', format_markdown(text)
+
+    if pending:
+        iter_events = iter_combined_events if combined else iter_section_events
+        events = iter_events(model, user_data, pending, cache=response_cache(), stream_tokens=True, trace=trace)
+        for slot, kind, payload in events:
+            if kind == 'chunk':
+                yield slot, kind, payload
+            else:
+                texts[slot] = payload
+                with trace.stage('format_markdown'):
+                    html = format_markdown(payload) if payload else fallback_sections(user_data, [slot])[slot]
+                yield slot, 'html', html
+    if panel_id is not None:
+        history_store().set_ai_sections(panel_id, {slot: texts.get(slot) for slot in AI_SECTIONS})
+
+def render_ai_sections(texts, user_data):
+    """HTML per slot of `texts`; slots without text get rule-based advice instead"""
+    html = fallback_sections(user_data, [slot for slot, text in texts.items() if not text])
+    html.update((slot, format_markdown(text)) for slot, text in texts.items() if text)
+    return html
+
+def queue_mode():
+    """True when /results answers at once and the page polls the job queue for its AI sections"""
+    return request.args.get('queue', '1' if current_app.config['QUEUE_RESULTS'] else '0') == '1'
+
+def enqueue_ai_sections(user_data, priority, panel_id=None, reused=None, combined=False):
+    """Queue an 'ai_sections' job for every AI section not in `reused`; returns the job id"""
+    payload = {
+        'user_data': dict(user_data, biomarkers=dict(user_data['biomarkers'])),
+        'sections': AI_SECTIONS,
+        'combined': combined,
+        'panel_id': panel_id,
+        'priority': priority
     }
-    return info.get(marker, {
-        'range': 'N/A',
-        'optimal': (0, 0),
-        'unit': '',
-        'description': 'No reference data available',
-        'thresholds': {'low': 0, 'high': 999999}
-    })
+    return job_queue().enqueue('ai_sections', payload, key=job_key('ai_sections', payload), progress=reused)
 
-def calculate_biological_age(blood_markers):
-    chronological_age = float(blood_markers.get('age', 0))
-    age_modifier = 0
-    
-    if 'glucose' in blood_markers:
-        glucose = float(blood_markers['glucose'])
-        if glucose > 100:
-            age_modifier += (glucose - 100) / 10
-        elif glucose < 70:
-            age_modifier += (70 - glucose) / 5
-
-    if 'cholesterol' in blood_markers:
-        cholesterol = float(blood_markers['cholesterol'])
-        if cholesterol > 200:
-            age_modifier += (cholesterol - 200) / 20
-
-    if 'blood_pressure' in blood_markers:
-        bp = float(blood_markers['blood_pressure'])
-        if bp > 120:
-            age_modifier += (bp - 120) / 10
-
-    biological_age = chronological_age + age_modifier
-    return round(biological_age, 1)
+def ai_sections_job(job):
+    """
+    Queue handler for 'ai_sections' jobs: generates the sections not yet in the job's progress,
+    reporting each as it finishes, so a retry only redoes the ones that failed
+    """
+    payload = job.payload
+    pending = {slot: prompt_type for slot, prompt_type in payload['sections'].items() if slot not in job.progress}
+    if pending:
+        model = with_priority(get_model(), payload['priority'])
+        iter_events = iter_combined_events if payload['combined'] else iter_section_events
+        for slot, kind, text in iter_events(model, payload['user_data'], pending, cache=response_cache()):
+            if kind == 'done' and text:
+                job.report({slot: text})
 
-def format_markdown(text):
-    """Convert markdown to HTML with specific extras enabled"""
-    # First, ensure numbers in bold are properly formatted
-    text = text.replace('**(', '** (')  # Add space after bold start if followed by parenthesis
-    return markdown2.markdown(text.strip(), extras=[
-        'break-on-newline',
-        'tables',
-        'fenced-code-blocks',
-        'header-ids',
-        'strike',
-        'target-blank-links'
-    ])
-
-@app.route('/')
+    texts = {slot: job.progress.get(slot) for slot in payload['sections']}
+    if payload['panel_id'] is not None and history_store() is not None:
+        history_store().set_ai_sections(payload['panel_id'], texts)
+    missing = [slot for slot, text in texts.items() if text is None]
+    if missing:
+        raise RuntimeError(f"No text for {', '.join(missing)}")
+    return texts
+
+@views.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/get_advice', methods=['POST'])
+@views.route('/metrics')
+def metrics():
+    """Prometheus exposition of stage timings, LLM latency/tokens and cache outcomes"""
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+@views.route('/assets/<path:name>')
+def asset(name):
+    """A fingerprinted static file, pre-compressed and cacheable for a year"""
+    found = current_app.extensions['assets'].get(name)
+    if found is None:
+        return "Not found", 404
+    encoding = choose_encoding(found, request.accept_encodings)
+    response = Response(found.bodies[encoding], mimetype=found.mimetype,
+                        headers={'Cache-Control': CACHE_CONTROL, 'Vary': 'Accept-Encoding'})
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.set_etag(f"{found.etag}-{encoding}")
+    return response.make_conditional(request)
+
+@views.route('/get_advice', methods=['POST'])
 def get_advice():
+    trace = Trace('get_advice')
     try:
         advice_type = request.form.get('type')
         user_data = request.form.get('user_data')
@@ -144,102 +218,402 @@ def get_advice():
             return jsonify({'error': 'Missing required fields: type or user_data'}), 400
 
         prompt = generate_prompt(user_data, advice_type)
-        response = model.generate_content(prompt)
-        return jsonify({'advice': response.text})
+        with trace.stage('ai'):
+            # Queued behind interactive /results calls when the LLM quota is tight
+            config = generation_config(advice_type)
+            advice = generate_text(with_priority(get_model(), ADVICE), prompt, advice_type, response_cache(),
+                                   **({'generation_config': config} if config else {}))
+        trace.finish(type=advice_type)
+        return jsonify({'advice': advice})
     except Exception as e:
+        trace.finish(error=str(e))
         return jsonify({'error': f"Failed to generate advice: {str(e)}"}), 500
 
-@app.route('/results', methods=['POST'])
+@views.route('/bulk', methods=['POST'])
+def bulk():
+    """Score an uploaded CSV/Parquet file of panels, streaming the result CSV back chunk by chunk"""
+    trace = Trace('bulk')
+    upload = request.files.get('file')
+    if not upload:
+        trace.finish(error='no file')
+        return jsonify({'error': 'Missing required file upload: file'}), 400
+
+    fmt = request.form.get('format') or detect_format(upload.filename)
+    if fmt == 'parquet' and pq is None:
+        trace.finish(error='no pyarrow')
+        return jsonify({'error': 'Parquet upload requires pyarrow on the server'}), 400
+    chunk_size = request.form.get('chunk_size', DEFAULT_CHUNK_SIZE, type=int)
+    if chunk_size < 1:
+        # Zero or less would read the whole file as one chunk
+        trace.finish(error='bad chunk_size')
+        return jsonify({'error': 'chunk_size must be a positive integer'}), 400
+
+    # Werkzeug closes uploaded files when the view returns, before the response is streamed;
+    # detach the stream from the request and close it once the last chunk is written
+    source, upload.stream = upload.stream, io.BytesIO()
+
+    def generate():
+        stats = {}
+        try:
+            with trace.stage('ingest'):
+                yield from iter_result_csv(iter_chunks(source, fmt, chunk_size), stats)
+        finally:
+            source.close()
+            trace.finish(rows=stats.get('rows', 0), rows_per_sec=round(stats.get('rows_per_sec', 0.0)))
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/csv',
+        headers={'Content-Disposition': 'attachment; filename=bloodiq_results.csv'}
+    )
+
+@views.route('/results', methods=['POST'])
 def results():
+    trace = Trace('results')
     try:
-        # Collect general info
-        age = request.form.get('age')
-        sex = request.form.get('sex')
-        height = request.form.get('height')
-        weight = request.form.get('weight')
-
-        # Prepare all biomarkers
-        biomarkers = {
-            "age": age,
-            "albumin": request.form.get('albumin'),
-            "creatinine": request.form.get('creatinine'),
-            "glucose": request.form.get('glucose'),
-            "crp": request.form.get('crp'),
-            "lymph_pct": request.form.get('lymph_pct'),
-            "mcv": request.form.get('mcv'),
-            "rdw": request.form.get('rdw'),
-            "alk_phos": request.form.get('alk_phos'),
-            "wbc": request.form.get('wbc')
-        }
+        with trace.stage('parse_form'):
+            # One typed, unit-normalized panel; every step below reads it without casting again
+            patient_key = request.form.get('patient_key', '').strip() or None
+            patient_label = request.form.get('patient_id') or None
+            panel = parse_panel(request.form, required=('age', 'height_cm', 'weight_kg'))
+            user_data = user_data_for(panel)
 
-        # Calculate biological age (will be included in AI analysis)
-        biological_age = calculate_biological_age(biomarkers)
-
-        # Prepare user data with metric units
-        user_data = {
-            "age": int(age),
-            "sex": sex,
-            "height_cm": float(height),
-            "weight_kg": float(weight),
-            "biomarkers": biomarkers,
-            "phenotypic_age": biological_age
-        }
+        # Every registered aging clock in one pass; the primary one is the biological age used throughout
+        with trace.stage('biological_age'):
+            clocks = panel_clocks(panel)
+            user_data["phenotypic_age"] = clocks[PRIMARY_CLOCK]
+            aging_clocks = secondary_clocks(clocks)
 
         # Generate marker insights
-        marker_insights = {}
-        for marker, value in biomarkers.items():
-            if value and marker != 'age':  # Skip age from biomarker analysis
-                info = get_marker_info(marker)
-                try:
-                    value_float = float(value)
-                    
-                    if value_float < info['thresholds']['low']:
-                        status = "Below Normal"
-                        status_class = "status-low"
-                    elif value_float > info['thresholds']['high']:
-                        status = "Above Normal"
-                        status_class = "status-high"
-                    else:
-                        status = "Normal"
-                        status_class = "status-normal"
-
-                    marker_insights[marker] = {
-                        'value': value_float,
-                        'unit': info['unit'],
-                        'range': info['range'],
-                        'description': info['description'],
-                        'status': status,
-                        'status_class': status_class,
-                        'reference': info  # Include full reference data
-                    }
-                except (ValueError, TypeError):
-                    continue
-
-        # Generate AI insights with markdown formatting
-        try:
-            analysis = format_markdown(model.generate_content(generate_prompt(user_data, "analysis")).text)
-            meal_plan = format_markdown(model.generate_content(generate_prompt(user_data, "meal_plan")).text)
-            exercise_plan = format_markdown(model.generate_content(generate_prompt(user_data, "exercise_plan")).text)
-            supplements = format_markdown(model.generate_content(generate_prompt(user_data, "supplement_advice")).text)
-            risks = format_markdown(model.generate_content(generate_prompt(user_data, "risk_assessment")).text)
-        except Exception as e:
-            print(f"❌ Gemini API error: {str(e)}")
-            analysis = meal_plan = exercise_plan = supplements = risks = "AI insights temporarily unavailable"
-
-        return render_template(
-            'results.html',
-            user_data=user_data,
-            marker_insights=marker_insights,
-            analysis=analysis,
-            meal_plan=meal_plan,
-            exercise_plan=exercise_plan,
-            supplements=supplements,
-            risks=risks
-        )
+        with trace.stage('marker_insights'):
+            marker_insights = build_marker_insights(panel)
+        with trace.stage('percentiles'):
+            percentiles = panel_percentiles(panel, user_data["phenotypic_age"])
+
+        # A returning patient presents their key; naming a new patient issues one. Only the key
+        # holder's stored sections are reused, and only their history is appended to: an unknown
+        # key stores the panel untracked rather than issuing a fresh key for it
+        panel_id, reused, pending = None, {}, AI_SECTIONS
+        result_url, issued_key, unknown_key = None, None, False
+        if history_store() is not None:
+            with trace.stage('history'):
+                patient_id = history_store().patient_for_key(patient_key) if patient_key else None
+                unknown_key = patient_key is not None and patient_id is None
+                if patient_key is None and patient_label:
+                    patient_id, issued_key = history_store().issue_key(patient_label)
+                previous = history_store().latest_panel(patient_id) if patient_id else None
+                if previous is not None:
+                    reused, pending = plan_sections(user_data, panel_user_data(previous), previous['ai_sections'],
+                                                    previous_version=previous['prompt_version'])
+                    for slot in reused:
+                        SECTIONS_REUSED.labels(slot).inc()
+                analysis = analyze_health(panel, biological_age=user_data["phenotypic_age"])
+                panel_id = history_store().add_panel(patient_id, user_data, user_data["phenotypic_age"], analysis)
+                result_url = url_for('views.stored_results', token=history_store().get_panel(panel_id)['token'])
+        saved = {'result_url': result_url, 'patient_key': issued_key, 'unknown_patient_key': unknown_key}
+
+        if rules_mode():
+            # Fast tier: nothing is stored for the pending sections, so a later AI request generates them
+            with trace.stage('rule_advice'):
+                ai_sections = rule_sections_html(user_data, pending)
+            with trace.stage('format_markdown'):
+                ai_sections.update((slot, format_markdown(text)) for slot, text in reused.items())
+            with trace.stage('render'):
+                page = render_template('results.html', user_data=user_data, marker_insights=marker_insights,
+                                       percentiles=percentiles, aging_clocks=aging_clocks, **saved, **ai_sections)
+            trace.finish(rules=True, reused=len(reused))
+            return page
+
+        # Streamed and queued pages show rule-based advice until each AI section arrives
+        with trace.stage('rule_advice'):
+            quick_sections = rule_sections_html(user_data)
+
+        if queue_mode():
+            with trace.stage('enqueue'):
+                job_id = enqueue_ai_sections(user_data, INTERACTIVE, panel_id, reused, combined_mode())
+            with trace.stage('render'):
+                page = render_template(
+                    'results.html',
+                    user_data=user_data,
+                    marker_insights=marker_insights,
+                    percentiles=percentiles,
+                    aging_clocks=aging_clocks,
+                    ai_job=url_for('api_current.job', job_id=job_id),
+                    quick_sections=quick_sections,
+                    **saved
+                )
+            trace.finish(queued=True, reused=len(reused))
+            return page
+
+        model = get_model()
+        if request.args.get('stream', '1' if current_app.config['STREAM_RESULTS'] else '0') == '1':
+            page = stream_template(
+                'results.html',
+                user_data=user_data,
+                marker_insights=marker_insights,
+                percentiles=percentiles,
+                aging_clocks=aging_clocks,
+                ai_stream=stream_ai_sections(model, user_data, trace, combined_mode(), panel_id, reused, pending),
+                quick_sections=quick_sections,
+                **saved
+            )
+            response = Response(page, mimetype='text/html', headers={'X-Accel-Buffering': 'no'})
+            response.call_on_close(lambda: trace.finish(streamed=True, reused=len(reused)))
+            return response
+
+        # Generate AI insights concurrently; a failed or slow section only degrades itself
+        texts = dict(reused)
+        if pending:
+            with trace.stage('ai_sections'):
+                generate = generate_combined if combined_mode() else generate_sections
+                texts.update(generate(model, user_data, pending, cache=response_cache(), trace=trace))
+        texts = {slot: texts.get(slot) for slot in AI_SECTIONS}
+        if panel_id is not None:
+            history_store().set_ai_sections(panel_id, texts)
+        with trace.stage('format_markdown'):
+            ai_sections = render_ai_sections(texts, user_data)
 
+        with trace.stage('render'):
+            page = render_template(
+                'results.html',
+                user_data=user_data,
+                marker_insights=marker_insights,
+                percentiles=percentiles,
+                aging_clocks=aging_clocks,
+                **saved,
+                **ai_sections
+            )
+        trace.finish(streamed=False, reused=len(reused))
+        return page
+
+    except PanelError as e:
+        trace.finish(error=str(e))
+        return f"Invalid panel: {str(e)}", 400
     except Exception as e:
         print(f"❌ Error in results route: {str(e)}")
+        trace.finish(error=str(e))
         return f"An error occurred: {str(e)}"
 
+@views.route('/results/<token>')
+def stored_results(token):
+    """
+    Re-render a stored submission from history without recomputing anything or calling Gemini.
+    Panels are looked up by their random token, never by the sequential row id.
+    """
+    store = history_store()
+    panel = store.get_panel_by_token(token) if store is not None else None
+    if panel is None:
+        return "Result not found", 404
+
+    user_data = panel_user_data(panel)
+    texts = panel['ai_sections'] or {}
+    return render_template(
+        'results.html',
+        user_data=user_data,
+        marker_insights=build_marker_insights(user_data['biomarkers']),
+        percentiles=panel_percentiles(user_data['biomarkers'], user_data['phenotypic_age']),
+        aging_clocks=secondary_clocks(panel_clocks(user_data['biomarkers'])),
+        **render_ai_sections({slot: texts.get(slot) for slot in AI_SECTIONS}, user_data)
+    )
+
+@views.route('/history/<patient_key>')
+def history(patient_key):
+    """
+    A patient's panels and trends as JSON, for the holder of the patient key issued on their first
+    submission; ?since= / ?until= are Unix timestamps. An unknown key gets a 404, and nothing in the
+    response (row ids, result tokens) leads to other stored data.
+    """
+    store = history_store()
+    if store is None:
+        return jsonify({'error': 'History is disabled; set BLOODIQ_HISTORY_PATH'}), 404
+    patient_id = store.patient_for_key(patient_key)
+    if patient_id is None:
+        return jsonify({'error': 'Unknown patient key'}), 404
+    since = request.args.get('since', type=float)
+    until = request.args.get('until', type=float)
+    metrics = request.args.getlist('metric') or None
+    panels = [
+        {key: value for key, value in panel.items() if key not in HISTORY_HIDDEN_FIELDS}
+        for panel in store.panels(patient_id, since, until)
+    ]
+    trends = {
+        metric: [{key: value for key, value in point.items() if key != 'panel_id'} for point in points]
+        for metric, points in store.trends(patient_id, metrics, since, until).items()
+    }
+    return jsonify({'panels': panels, 'trends': trends})
+
+def api_error(message, status, **fields):
+    return jsonify({'api_version': API_VERSION, 'error': message, **fields}), status
+
+@api.route('/analyze', methods=['POST'])
+def api_analyze():
+    """
+    Score one panel (a JSON object, flat or with "biomarkers" and "units") without the LLM.
+    With "ai": true the AI sections are generated in the background: the response is a 202 with
+    an ai_job whose status_url the client polls. "ai": "rules" returns rule-based sections inline.
+    """
+    trace = Trace('api_analyze')
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        trace.finish(error='not a JSON object')
+        return api_error("Expected a JSON object", 400)
+    want_ai = bool(body.get('ai')) and body['ai'] != 'rules'
+    try:
+        with trace.stage('parse'):
+            # The AI prompts also describe the patient's build
+            panel = parse_panel(body, required=('age', 'height_cm', 'weight_kg') if want_ai else ('age',))
+    except PanelError as e:
+        trace.finish(error=str(e))
+        return api_error("Invalid panel", 400, fields=e.errors)
+    with trace.stage('analyze'):
+        result = dict(analyze_panels([panel], percentile_index())[0], api_version=API_VERSION)
+
+    if body.get('ai') == 'rules':
+        result['sections'] = rule_sections(user_data_for(panel, result['biological_age']))
+    if not want_ai:
+        trace.finish(ai=False)
+        return jsonify(result)
+    # Queued behind interactive /results and /get_advice calls when the LLM quota is tight; an
+    # identical request while the job is pending or finished gets the same job
+    job_id = enqueue_ai_sections(user_data_for(panel, result['biological_age']), BATCH)
+    result['ai_job'] = {'id': job_id, 'status_url': url_for('.job', job_id=job_id)}
+    trace.finish(ai=True)
+    return jsonify(result), 202
+
+@api.route('/analyze/batch', methods=['POST'])
+def api_analyze_batch():
+    """
+    Score {"panels": [...]} in one vectorized pass. results[i] answers panels[i]; a panel that
+    fails validation gets {"error", "fields"} in its place without failing the rest.
+    """
+    trace = Trace('api_analyze_batch')
+    body = request.get_json(silent=True)
+    panels = body.get('panels') if isinstance(body, dict) else None
+    if not isinstance(panels, list):
+        trace.finish(error='no panels list')
+        return api_error('Expected a JSON object with a "panels" list', 400)
+    if len(panels) > current_app.config['API_MAX_BATCH']:
+        trace.finish(error='batch too large')
+        return api_error(f"At most {current_app.config['API_MAX_BATCH']} panels per request", 413)
+    if body.get('ai'):
+        trace.finish(error='ai in batch')
+        return api_error("AI sections are only available per panel, on /api/analyze", 400)
+
+    with trace.stage('parse'):
+        parsed, errors = parse_panels(panels)
+    with trace.stage('analyze'):
+        results = [None] * len(panels)
+        for i, result in zip(parsed, analyze_panels(parsed.values(), percentile_index())):
+            results[i] = result
+        for i, fields in errors.items():
+            results[i] = {'error': "Invalid panel", 'fields': fields}
+    trace.finish(panels=len(panels), invalid=len(errors))
+    return jsonify({'api_version': API_VERSION, 'count': len(panels), 'invalid': len(errors), 'results': results})
+
+@api.route('/jobs/<job_id>')
+def job(job_id):
+    """
+    Status of a background job. "sections" holds each AI section's markdown as soon as it is
+    generated; with ?format=html it is rendered HTML, and once the job has finished a section
+    that could not be generated gets the fallback text.
+    """
+    queue = job_queue()
+    queue.ensure_started()  # a poll landing on a freshly forked worker starts its threads
+    found = queue.get(job_id)
+    if found is None:
+        return api_error("Unknown or expired job", 404)
+    sections = found['result'] or found['progress']
+    if request.args.get('format') == 'html':
+        html = {slot: format_markdown(text) for slot, text in sections.items() if text}
+        missing = [slot for slot in AI_SECTIONS if slot not in html]
+        if missing and found['status'] in (DONE, FAILED):
+            html.update(fallback_sections(found['payload']['user_data'], missing))
+        sections = html
+    response = jsonify({
+        'api_version': API_VERSION,
+        'id': found['id'],
+        'status': found['status'],
+        'attempts': found['attempts'],
+        'sections': sections,
+        'error': found['error']
+    })
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+def create_app():
+    """
+    Application factory. Reads .env and wires configuration; the Gemini client itself is created
+    lazily by utils.gemini.get_model() on the first request that needs it.
+    """
+    load_dotenv()
+    app = Flask(__name__)
+
+    # Stream results.html: local sections flush immediately, AI sections follow as they generate.
+    # ?stream=1 / ?stream=0 overrides this per request.
+    app.config['STREAM_RESULTS'] = os.getenv('BLOODIQ_STREAM_RESULTS', '0') == '1'
+
+    # 'sections': one Gemini call per AI section; 'combined': one structured-output call for all
+    # of them (?ai_mode= overrides per request)
+    app.config['AI_MODE'] = os.getenv('BLOODIQ_AI_MODE', 'sections')
+
+    # Identical panels build byte-identical prompts; set BLOODIQ_CACHE_PATH to share entries across workers
+    app.extensions['response_cache'] = ResponseCache(
+        maxsize=int(os.getenv('BLOODIQ_CACHE_SIZE', 1024)),
+        ttl=float(os.getenv('BLOODIQ_CACHE_TTL', 24 * 3600)),
+        path=os.getenv('BLOODIQ_CACHE_PATH')
+    )
+    # Submitted panels, their analysis and AI sections, for /results/<token> and /history/<patient_key>
+    history_path = os.getenv('BLOODIQ_HISTORY_PATH')
+    app.extensions['history_store'] = HistoryStore(history_path) if history_path else None
+
+    # Peer percentiles per marker and for biological age, from an index built with `python -m
+    # utils.percentiles`; memory-mapped, so every worker shares one copy in the page cache
+    percentiles_path = os.getenv('BLOODIQ_PERCENTILE_INDEX')
+    app.extensions['percentiles'] = PercentileIndex(percentiles_path) if percentiles_path else None
+
+    # Rendered AI sections, memoized by content hash and stored beside the LLM responses they came from
+    app.extensions['markdown_renderer'] = MarkdownRenderer(
+        max_bytes=int(os.getenv('BLOODIQ_HTML_CACHE_BYTES', 8 * 1024 * 1024)),
+        shared=app.extensions['response_cache'].shared
+    )
+
+    # static/ is fingerprinted and pre-compressed once, served from memory by /assets/<name>
+    app.extensions['assets'] = AssetPipeline(app.static_folder)
+    app.add_template_global(asset_url)
+
+    # Compile every template now, in the gunicorn master under preload_app, so no request pays for
+    # it; BLOODIQ_JINJA_CACHE_DIR keeps the compiled bytecode across restarts and deploys
+    jinja_cache_dir = os.getenv('BLOODIQ_JINJA_CACHE_DIR')
+    if jinja_cache_dir:
+        os.makedirs(jinja_cache_dir, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(jinja_cache_dir)
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+    # Background AI section jobs (/api/analyze with "ai", queued /results). Every worker must share
+    # one queue file, or a poll landing on another worker finds no job: BLOODIQ_JOBS_PATH defaults
+    # to one in the instance folder. BLOODIQ_JOB_WORKERS=0 leaves draining it to a dedicated
+    # `python -m utils.jobs` process. ?queue=1 / ?queue=0 overrides QUEUE_RESULTS.
+    app.config['QUEUE_RESULTS'] = os.getenv('BLOODIQ_QUEUE_RESULTS', '0') == '1'
+    jobs_path = os.getenv('BLOODIQ_JOBS_PATH')
+    if not jobs_path:
+        os.makedirs(app.instance_path, exist_ok=True)
+        jobs_path = os.path.join(app.instance_path, 'jobs.sqlite')
+    app.extensions['jobs'] = JobQueue(
+        jobs_path,
+        workers=int(os.getenv('BLOODIQ_JOB_WORKERS', 4)),
+        max_attempts=int(os.getenv('BLOODIQ_JOB_ATTEMPTS', 3)),
+        context=app.app_context
+    )
+    app.extensions['jobs'].register('ai_sections', ai_sections_job)
+    app.config['API_MAX_BATCH'] = int(os.getenv('BLOODIQ_API_MAX_BATCH', 5000))
+
+    app.register_blueprint(views)
+    app.register_blueprint(api, url_prefix=f'/api/v{API_VERSION}')
+    app.register_blueprint(api, url_prefix='/api', name='api_current')
+    return app
+
+app = create_app()
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,40 @@
+"""
+JSON API throughput: per-panel cost of POST /api/analyze/batch (request parsing, validation,
+vectorized scoring and JSON encoding, through the Flask test client) against one
+/api/analyze request per panel.
+
+    python -m benchmarks.bench_api --panels 5000
+"""
+import argparse
+import time
+
+from app import create_app
+from benchmarks.bench_biological_age import synthetic_panels
+from utils.panel import PANEL_COLUMNS
+
+
+def run(panels, single=500):
+    columns = synthetic_panels(panels, seed=8)
+    bodies = [{column: float(columns[column][i]) for column in PANEL_COLUMNS} for i in range(panels)]
+    client = create_app().test_client()
+
+    start = time.perf_counter()
+    response = client.post('/api/analyze/batch', json={'panels': bodies})
+    batch_seconds = time.perf_counter() - start
+    assert response.status_code == 200 and response.get_json()['invalid'] == 0
+
+    start = time.perf_counter()
+    for body in bodies[:single]:
+        assert client.post('/api/analyze', json=body).status_code == 200
+    single_seconds = (time.perf_counter() - start) / single
+
+    print(f"batch of {panels:,}: {batch_seconds * 1000:.0f} ms, {batch_seconds / panels * 1e6:.0f} µs/panel")
+    print(f"one request per panel: {single_seconds * 1e6:.0f} µs/panel")
+    return batch_seconds / panels, single_seconds
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--panels', type=int, default=5000)
+    args = parser.parse_args()
+    run(args.panels)
@@ -0,0 +1,50 @@
+"""
+Scalar calculate_biological_age loop vs calculate_biological_age_batch.
+
+    python -m benchmarks.bench_biological_age --rows 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from utils.biological_age import (
+    AGE_MODEL_MARKERS, AGE_MODEL_RANGES, PANEL_COLUMNS,
+    calculate_biological_age, calculate_biological_age_batch
+)
+
+
+def synthetic_panels(rows, seed=0):
+    """Columnar panels spread around each marker's optimal range, rounded like lab output"""
+    rng = np.random.default_rng(seed)
+    columns = {'age': rng.integers(18, 90, rows).astype(np.float64)}
+    for marker, (low, high) in zip(AGE_MODEL_MARKERS, AGE_MODEL_RANGES):
+        columns[marker] = np.round(rng.uniform(low * 0.5, high * 1.5 + 0.5, rows), 2)
+    return columns
+
+
+def run(rows):
+    columns = synthetic_panels(rows)
+    records = [dict(zip(PANEL_COLUMNS, row)) for row in np.column_stack([columns[c] for c in PANEL_COLUMNS]).tolist()]
+
+    start = time.perf_counter()
+    scalar = [calculate_biological_age(record) for record in records]
+    scalar_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = calculate_biological_age_batch(columns)
+    batch_seconds = time.perf_counter() - start
+
+    identical = np.array_equal(np.array(scalar, dtype=np.float64).view(np.int64), batch.view(np.int64))
+    print(f"rows: {rows:,}")
+    print(f"scalar: {scalar_seconds:.3f}s ({rows / scalar_seconds:,.0f} rows/s)")
+    print(f"batch:  {batch_seconds:.3f}s ({rows / batch_seconds:,.0f} rows/s, {scalar_seconds / batch_seconds:.0f}x)")
+    print(f"bit-for-bit identical: {identical}")
+    return scalar_seconds, batch_seconds, identical
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+    run(args.rows)
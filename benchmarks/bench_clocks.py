@@ -0,0 +1,42 @@
+"""
+Cost of each registered aging clock, alone and scored together: on one panel through panel_clocks
+(the scalar forms) and as a batch of one, and per row of a large batch.
+
+    python -m benchmarks.bench_clocks --rows 1000000
+"""
+import argparse
+import time
+
+from benchmarks.bench_biological_age import synthetic_panels
+from benchmarks.suite import FORM, measure
+from utils.aging_clocks import CLOCKS, panel_clocks, score_clocks
+from utils.biological_age import calculate_biological_age, panel_matrix
+from utils.panel import parse_panel
+
+
+def run(rows, rounds=5):
+    panel = parse_panel(FORM)
+    single = panel.values[None, :]
+    matrix = panel_matrix(synthetic_panels(rows))
+
+    scalar_us = measure(lambda: calculate_biological_age(panel), rounds)['best_us']
+    print(f"rows: {rows:,}")
+    print(f"{'scalar calculate_biological_age':<32} {scalar_us:>8.1f} µs/panel")
+    results = {}
+    for label, clocks in [(name, [name]) for name in CLOCKS] + [('all clocks', None)]:
+        panel_us = measure(lambda: panel_clocks(panel, clocks), rounds)['best_us']
+        batch_of_one_us = measure(lambda: score_clocks(single, clocks), rounds)['best_us']
+        start = time.perf_counter()
+        score_clocks(matrix, clocks)
+        row_ns = (time.perf_counter() - start) / rows * 1e9
+        results[label] = (panel_us, batch_of_one_us, row_ns)
+        print(f"{label:<32} {panel_us:>8.1f} µs/panel {batch_of_one_us:>8.1f} µs as a batch of one "
+              f"{row_ns:>8.1f} ns/row in a batch")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+    run(args.rows)
@@ -0,0 +1,48 @@
+"""
+Cohort re-scoring throughput from 1 to N worker processes over one memory-mapped matrix.
+
+    python -m benchmarks.bench_cohort_scoring --rows 10000000 --workers 1 2 4 8 16 32
+"""
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+
+from benchmarks.bench_biological_age import synthetic_panels
+from utils.biological_age import panel_matrix
+from utils.cohort_scoring import DEFAULT_TASK_ROWS, pack, score
+
+PACK_CHUNK_ROWS = 1_000_000
+
+
+def run(rows, workers, task_rows=DEFAULT_TASK_ROWS, directory=None):
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        matrix_path = os.path.join(tmp, 'cohort.npy')
+        start = time.perf_counter()
+        chunks = (panel_matrix(synthetic_panels(min(PACK_CHUNK_ROWS, rows - offset), seed=offset))
+                  for offset in range(0, rows, PACK_CHUNK_ROWS))
+        pack(chunks, matrix_path)
+        print(f"rows: {rows:,}  packed in {time.perf_counter() - start:.1f}s  cpus: {os.cpu_count()}")
+
+        results, digests = {}, set()
+        for count in workers:
+            out, stats = score(matrix_path, os.path.join(tmp, f'scores-{count}.npy'), count, task_rows)
+            digests.add(hashlib.sha256(out).hexdigest())
+            results[count] = stats['seconds']
+            print(f"{count:>3} workers: {stats['seconds']:7.2f}s  {stats['rows_per_sec']:>12,.0f} rows/s  "
+                  f"speedup {results[workers[0]] / stats['seconds']:5.2f}x")
+            del out
+            os.remove(os.path.join(tmp, f'scores-{count}.npy'))
+        print(f"identical output for every worker count: {len(digests) == 1}")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count()])
+    parser.add_argument('--task-rows', type=int, default=DEFAULT_TASK_ROWS)
+    parser.add_argument('--dir', help="directory for the temporary files (default: the system temp dir)")
+    args = parser.parse_args()
+    run(args.rows, sorted(set(args.workers)), args.task_rows, args.dir)
@@ -0,0 +1,37 @@
+"""
+Per-section vs combined generation of the AI sections against a stub model: round-trips,
+prompt tokens and wall time. Stub tokens are estimated at four characters each.
+
+    python -m benchmarks.bench_combined --latency 0.3
+"""
+import argparse
+import time
+
+from benchmarks.bench_fanout import SAMPLE_USER
+from utils.llm_combined import generate_combined
+from utils.llm_fanout import generate_sections
+from utils.stub_model import StubModel
+
+
+def run_mode(generate, latency):
+    model = StubModel(latency=latency)
+    start = time.perf_counter()
+    sections = generate(model, SAMPLE_USER)
+    elapsed = time.perf_counter() - start
+    assert all(sections.values())
+    return model.calls, model.prompt_tokens, model.output_tokens, elapsed
+
+
+def run(latency):
+    results = {'sections': run_mode(generate_sections, latency), 'combined': run_mode(generate_combined, latency)}
+    print(f"{'mode':<10}{'round-trips':>12}{'prompt tokens':>15}{'output tokens':>15}{'wall':>9}")
+    for mode, (calls, prompt_tokens, output_tokens, elapsed) in results.items():
+        print(f"{mode:<10}{calls:>12}{prompt_tokens:>15}{output_tokens:>15}{elapsed:>8.3f}s")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.3)
+    args = parser.parse_args()
+    run(args.latency)
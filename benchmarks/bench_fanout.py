@@ -0,0 +1,53 @@
+"""
+Sequential vs concurrent generation of the five AI sections against a stub model.
+
+    python -m benchmarks.bench_fanout --latency 0.2 --slowest 0.5
+"""
+import argparse
+import time
+
+from utils.llm_fanout import AI_SECTIONS, generate_sections
+from utils.prompt_builder import generate_prompt
+from utils.stub_model import StubModel
+
+SAMPLE_USER = {
+    "age": 45,
+    "sex": "male",
+    "height_cm": 178.0,
+    "weight_kg": 82.0,
+    "biomarkers": {
+        "age": "45", "albumin": "4.2", "creatinine": "1.0", "glucose": "104",
+        "crp": "2.1", "lymph_pct": "28", "mcv": "91", "rdw": "13.1",
+        "alk_phos": "80", "wbc": "6.4"
+    },
+    "phenotypic_age": 47.3
+}
+
+
+def run(latency, slowest):
+    # Risk assessment is the slow section; everything else answers in `latency` seconds
+    model = StubModel(latency=lambda prompt: slowest if 'preventive health' in prompt else latency)
+
+    start = time.perf_counter()
+    for prompt_type in AI_SECTIONS.values():
+        model.generate_content(generate_prompt(SAMPLE_USER, prompt_type)).text
+    sequential = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sections = generate_sections(model, SAMPLE_USER)
+    concurrent = time.perf_counter() - start
+    assert all(sections.values())
+
+    expected_sum = latency * (len(AI_SECTIONS) - 1) + slowest
+    print(f"per-call latency {latency:.2f}s, slowest call {slowest:.2f}s (sum {expected_sum:.2f}s)")
+    print(f"sequential: {sequential:.3f}s")
+    print(f"concurrent: {concurrent:.3f}s ({sequential / concurrent:.1f}x faster)")
+    return sequential, concurrent
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--slowest', type=float, default=0.5)
+    args = parser.parse_args()
+    run(args.latency, args.slowest)
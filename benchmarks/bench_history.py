@@ -0,0 +1,69 @@
+"""
+History store at scale: bulk-load N panels across many patients, then time the indexed queries
+(one patient's panels in a time range, their trends, the latest panel) and an incremental add.
+
+    python -m benchmarks.bench_history --rows 1000000 --patients 10000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.bench_biological_age import synthetic_panels
+from utils.history_store import HistoryStore
+
+DAY = 86400.0
+
+
+def timed_ms(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def run(rows, patients, repeat=200, path=None):
+    with tempfile.TemporaryDirectory() as tmp:
+        store = HistoryStore(path or os.path.join(tmp, 'history.sqlite'))
+        columns = synthetic_panels(rows, seed=3)
+        columns['patient_id'] = np.char.add('patient-', (np.arange(rows) % patients).astype(str))
+        columns['taken_at'] = (np.arange(rows) // patients) * 30 * DAY  # one panel a month each
+
+        start = time.perf_counter()
+        for first in range(0, rows, 100000):
+            store.add_panels({name: column[first:first + 100000] for name, column in columns.items()})
+        load = time.perf_counter() - start
+        print(f"bulk load: {rows:,} panels, {patients:,} patients in {load:.1f}s ({rows / load:,.0f} panels/s)")
+
+        per_patient = rows // patients
+        rng = random.Random(0)
+        pick = lambda: f"patient-{rng.randrange(patients)}"  # noqa: E731
+        since, until = (per_patient // 4) * 30 * DAY, (per_patient // 2) * 30 * DAY
+        results = {
+            'panels in time range': timed_ms(lambda: store.panels(pick(), since, until), repeat),
+            'all trends, full history': timed_ms(lambda: store.trends(pick()), repeat),
+            'biological_age trend in range': timed_ms(lambda: store.trends(pick(), ['biological_age'], since, until),
+                                                      repeat),
+            'latest panel': timed_ms(lambda: store.panels(pick(), since=(per_patient - 1) * 30 * DAY), repeat),
+        }
+        user = {'age': 45, 'sex': 'Male', 'height_cm': 178, 'weight_kg': 80,
+                'biomarkers': {name: columns[name][0] for name in columns if name not in ('patient_id', 'taken_at')}}
+        results['incremental add_panel'] = timed_ms(
+            lambda: store.add_panel(pick(), user, 47.0, {'overall_health_score': 80}, taken_at=per_patient * 30 * DAY),
+            repeat
+        )
+        for name, ms in results.items():
+            print(f"{name:<32}{ms:8.3f} ms")
+        return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--patients', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+    run(args.rows, args.patients, args.repeat)
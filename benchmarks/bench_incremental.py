@@ -0,0 +1,68 @@
+"""
+Incremental re-analysis: replay realistic edits of a submitted panel and count the AI sections
+(LLM calls) that have to be regenerated, against regenerating all of them every time.
+
+    python -m benchmarks.bench_incremental --trials 2000
+"""
+import argparse
+import random
+
+from benchmarks.bench_fanout import SAMPLE_USER
+from utils.biological_age import calculate_biological_age
+from utils.incremental import plan_sections
+from utils.llm_fanout import AI_SECTIONS
+from utils.reference import REFERENCE
+
+TEXTS = {slot: f"previous {slot}" for slot in AI_SECTIONS}
+
+
+def edit(user, rng, markers=(), drift=0.0, weight=0.0, age=0):
+    """Copy of `user` with `markers` scaled by up to ±drift, weight shifted by up to ±weight kg"""
+    biomarkers = dict(user['biomarkers'])
+    for marker in markers:
+        biomarkers[marker] = round(float(biomarkers[marker]) * (1 + rng.uniform(-drift, drift)), 2)
+    edited = dict(user, biomarkers=biomarkers, age=user['age'] + age,
+                  weight_kg=round(user['weight_kg'] + rng.uniform(-weight, weight), 1))
+    edited['phenotypic_age'] = calculate_biological_age(dict(biomarkers, age=edited['age']))
+    return edited
+
+
+# (name, edit arguments): what a returning patient typically changes between submissions
+SCENARIOS = (
+    ('resubmit unchanged', {}),
+    ('fix one typo (±1%)', {'markers': 1, 'drift': 0.01}),
+    ('weigh-in (±1 kg)', {'weight': 1.0}),
+    ('weight change (±5 kg)', {'weight': 5.0}),
+    ('one marker retested (±10%)', {'markers': 1, 'drift': 0.10}),
+    ('follow-up panel (±5% all)', {'markers': len(REFERENCE.markers), 'drift': 0.05, 'weight': 2.0}),
+    ('next year (±15% all)', {'markers': len(REFERENCE.markers), 'drift': 0.15, 'weight': 4.0, 'age': 1}),
+)
+
+
+def run(trials, seed=0):
+    rng = random.Random(seed)
+    markers = [marker for marker in REFERENCE.markers if marker in SAMPLE_USER['biomarkers']]
+    base = edit(SAMPLE_USER, rng)
+    print(f"{'scenario':<30}{'LLM calls':>10}{'full':>8}{'avoided':>9}")
+    totals = [0, 0]
+    results = {}
+    for name, spec in SCENARIOS:
+        calls = 0
+        for _ in range(trials):
+            changed = rng.sample(markers, spec.get('markers', 0))
+            user = edit(base, rng, changed, spec.get('drift', 0.0), spec.get('weight', 0.0), spec.get('age', 0))
+            calls += len(plan_sections(user, base, TEXTS)[1])
+        full = trials * len(AI_SECTIONS)
+        totals[0] += calls
+        totals[1] += full
+        results[name] = calls / full
+        print(f"{name:<30}{calls:>10,}{full:>8,}{1 - calls / full:>9.0%}")
+    print(f"{'all scenarios':<30}{totals[0]:>10,}{totals[1]:>8,}{1 - totals[0] / totals[1]:>9.0%}")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--trials', type=int, default=2000)
+    args = parser.parse_args()
+    run(args.trials)
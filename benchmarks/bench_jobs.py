@@ -0,0 +1,55 @@
+"""
+Job queue throughput: report jobs (all five AI sections each, against a stub model with fixed
+latency) drained from a SQLite queue file by 1 to 16 worker threads.
+
+    python -m benchmarks.bench_jobs --jobs 200 --latency 0.05
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from app import ai_sections_job, create_app
+from utils import gemini
+from utils.jobs import DONE, JobQueue, job_key
+from utils.llm_client import BATCH
+from utils.llm_fanout import AI_SECTIONS
+from utils.stub_model import StubModel
+
+USER = {'age': 40, 'sex': 'Male', 'height_cm': 180, 'weight_kg': 80, 'phenotypic_age': 38.2,
+        'biomarkers': {'albumin': 4.5, 'glucose': 90, 'crp': 1, 'lymph_pct': 30, 'mcv': 90, 'rdw': 13, 'wbc': 6,
+                       'alk_phos': 70, 'creatinine': 1}}
+
+
+def run(jobs, latency, worker_counts=(1, 2, 4, 8, 16)):
+    os.environ['BLOODIQ_CACHE_PATH'] = ''
+    os.environ['BLOODIQ_JOB_WORKERS'] = '0'
+    app = create_app()
+    results = {}
+    for workers in worker_counts:
+        gemini._model = StubModel(latency=latency)
+        with tempfile.TemporaryDirectory() as tmp:
+            queue = JobQueue(os.path.join(tmp, "jobs.sqlite"), {'ai_sections': ai_sections_job}, workers=workers,
+                             context=app.app_context)
+            start = time.perf_counter()
+            for i in range(jobs):
+                # Distinct panels, so neither the queue nor the response cache can deduplicate them
+                user = dict(USER, biomarkers=dict(USER['biomarkers'], glucose=80 + i * 0.01 + workers * 1000))
+                payload = {'user_data': user, 'sections': AI_SECTIONS, 'combined': False, 'panel_id': None,
+                           'priority': BATCH}
+                queue.enqueue('ai_sections', payload, key=job_key('ai_sections', payload))
+            while queue.counts().get(DONE, 0) < jobs:
+                time.sleep(0.01)
+            seconds = time.perf_counter() - start
+            queue.stop()
+        results[workers] = jobs / seconds
+        print(f"{workers:>2} workers: {jobs} jobs in {seconds:.2f}s, {jobs / seconds:.1f} jobs/s")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05)
+    args = parser.parse_args()
+    run(args.jobs, args.latency)
@@ -0,0 +1,109 @@
+"""
+Load test /results under each gunicorn serving mode against the stub model.
+
+    python -m benchmarks.bench_load --modes sync gthread gevent --requests 400 --concurrency 200
+
+Each mode runs one gunicorn worker so the numbers are per process. Every response is unique
+(the age varies) so the response cache does not flatten the load.
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+FORM = {
+    'sex': 'female', 'height': '165', 'weight': '60', 'albumin': '4.4', 'creatinine': '0.9',
+    'glucose': '92', 'crp': '0.8', 'lymph_pct': '30', 'mcv': '90', 'rdw': '12.8', 'alk_phos': '70',
+    'wbc': '6.0'
+}
+
+
+def _percentile(sorted_values, pct):
+    return sorted_values[min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))]
+
+
+def _post(url, i):
+    body = urllib.parse.urlencode(dict(FORM, age=str(20 + i))).encode()
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, data=body, timeout=300) as response:
+            response.read()
+            ok = response.status == 200
+    except (urllib.error.URLError, OSError):
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+def _wait_until_up(url, process, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("gunicorn exited during startup")
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn did not start in time")
+
+
+def run_mode(mode, requests, concurrency, latency, port):
+    env = dict(os.environ, BLOODIQ_SERVER_MODE=mode, BLOODIQ_STUB_LATENCY=str(latency), PORT=str(port),
+               WEB_CONCURRENCY='1', BLOODIQ_THREADS=str(concurrency), BLOODIQ_WORKER_CONNECTIONS=str(concurrency))
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'benchmarks.stub_app:app', '--config', 'gunicorn.conf.py',
+         '--log-level', 'warning'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        _wait_until_up(base + '/', process)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(lambda i: _post(base + '/results', i), range(requests)))
+        elapsed = time.perf_counter() - start
+    finally:
+        process.send_signal(signal.SIGINT)  # quick shutdown; no need to drain a benchmark server
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    latencies = sorted(seconds for seconds, ok in results if ok)
+    failed = sum(1 for _, ok in results if not ok)
+    report = {
+        'mode': mode,
+        'requests': requests,
+        'failed': failed,
+        'rps': len(latencies) / elapsed,
+        'p50': _percentile(latencies, 50) if latencies else None,
+        'p95': _percentile(latencies, 95) if latencies else None,
+        'p99': _percentile(latencies, 99) if latencies else None
+    }
+    print(f"{mode:8s} {report['rps']:8.1f} req/s  p50 {report['p50'] or 0:6.2f}s  p95 {report['p95'] or 0:6.2f}s  "
+          f"p99 {report['p99'] or 0:6.2f}s  failed {failed}")
+    return report
+
+
+def run(modes, requests, concurrency, latency, port):
+    print(f"{requests} requests, {concurrency} concurrent clients, stub latency {latency}s per call, 1 worker")
+    # A fresh port per mode so a server still releasing its socket cannot collide with the next one
+    return [run_mode(mode, requests, concurrency, latency, port + i) for i, mode in enumerate(modes)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--modes', nargs='+', default=['sync', 'gthread', 'gevent'])
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.5)
+    parser.add_argument('--port', type=int, default=5099)
+    args = parser.parse_args()
+    run(args.modes, args.requests, args.concurrency, args.latency, args.port)
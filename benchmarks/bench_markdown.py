@@ -0,0 +1,56 @@
+"""
+Markdown rendering of typical 2-5 KB AI sections: a fresh markdown2.markdown() call per section
+(the old format_markdown), a reused per-thread converter, and a memo hit.
+
+    python -m benchmarks.bench_markdown --repeat 200
+"""
+import argparse
+import time
+
+import markdown2
+
+from utils.markdown_render import EXTRAS, MarkdownRenderer, _prepare
+
+
+def sample_section(size, seed=0):
+    """Markdown shaped like a Gemini section (headings, bullets, bold, a table) of about `size` bytes"""
+    blocks = []
+    i = seed
+    while sum(len(block) for block in blocks) < size:
+        blocks.append(
+            f"### 🎯 Finding {i}\n"
+            f"- **Glucose (104 mg/dL)** is slightly above the optimal range of 70-90 mg/dL.\n"
+            f"- **CRP (2.1 mg/L)**: mild inflammation; see [guidance](https://example.com/{i}).\n"
+            f"- Aim for ~~sugary drinks~~ water and *30 minutes* of walking after meals.\n\n"
+            f"| Day | Breakfast | Lunch |\n|---|---|---|\n| {i} | Oats with berries | Lentil salad |\n\n"
+        )
+        i += 1
+    return ''.join(blocks)[:size]
+
+
+def per_call(fn, texts, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            fn(text)
+    return (time.perf_counter() - start) / (repeat * len(texts)) * 1e6
+
+
+def run(repeat):
+    for size in (2048, 5120):
+        texts = [sample_section(size, seed) for seed in range(5)]
+        fresh = per_call(lambda text: markdown2.markdown(_prepare(text), extras=list(EXTRAS)), texts, repeat)
+        renderer = MarkdownRenderer()
+        reused = per_call(renderer.convert, texts, repeat)
+        for text in texts:
+            renderer.render(text)
+        memo = per_call(renderer.render, texts, repeat)
+        print(f"{size // 1024} KB section: fresh {fresh:,.0f}µs  reused converter {reused:,.0f}µs  "
+              f"memo hit {memo:,.1f}µs ({fresh / memo:,.0f}x)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+    run(args.repeat)
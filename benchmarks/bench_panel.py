@@ -0,0 +1,68 @@
+"""
+Per-request panel handling: the form-string dict every step used to cast again vs one parse into
+a Panel that the biological-age, marker-table and analyze_health steps read directly; and bulk
+chunk scoring, which now parses each chunk into one matrix instead of once per scorer.
+
+    python -m benchmarks.bench_panel --repeat 20000
+"""
+import argparse
+import time
+
+from werkzeug.datastructures import ImmutableMultiDict
+
+from app import build_marker_insights
+from benchmarks.bench_biological_age import synthetic_panels
+from utils.biological_age import calculate_biological_age
+from utils.bulk_ingest import process_chunk
+from utils.health_analysis import analyze_health
+from utils.panel import PANEL_COLUMNS, parse_panel
+
+FORM = ImmutableMultiDict({'age': '40', 'sex': 'Male', 'height': '180', 'weight': '80', 'albumin': '4.5', 'glucose': '90',
+        'crp': '1', 'lymph_pct': '30', 'mcv': '90', 'rdw': '13', 'wbc': '6', 'alk_phos': '70', 'creatinine': '1'})
+
+
+def per_request_dict(form):
+    # What /results did before: read request.form field by field, cast again in every step
+    biomarkers = {column: form.get(column) for column in PANEL_COLUMNS}
+    int(form.get('age')), float(form.get('height')), float(form.get('weight'))
+    age = calculate_biological_age(biomarkers)
+    return build_marker_insights(biomarkers), analyze_health(biomarkers, biological_age=age)
+
+
+def per_request_panel(form):
+    panel = parse_panel(form, required=('age', 'height_cm', 'weight_kg'))
+    age = calculate_biological_age(panel)
+    return build_marker_insights(panel), analyze_health(panel, biological_age=age)
+
+
+def timed_us(fn, arg, repeat, rounds=3):
+    """Best of `rounds` mean per-call times"""
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn(arg)
+        best = min(best, time.perf_counter() - start)
+    return best / repeat * 1e6
+
+
+def run(repeat, rows=10000):
+    assert per_request_dict(FORM) == per_request_panel(FORM)
+    results = {'request, dict of strings (µs)': timed_us(per_request_dict, FORM, repeat),
+               'request, Panel (µs)': timed_us(per_request_panel, FORM, repeat)}
+
+    columns = synthetic_panels(rows, seed=1)
+    chunk = [{column: str(columns[column][i]) for column in PANEL_COLUMNS} for i in range(rows)]
+    start = time.perf_counter()
+    process_chunk(chunk)
+    results[f'bulk chunk of {rows:,} rows (ms)'] = (time.perf_counter() - start) * 1000
+    for name, value in results.items():
+        print(f"{name:<34}{value:>10.1f}")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20000)
+    args = parser.parse_args()
+    run(args.repeat)
@@ -0,0 +1,70 @@
+"""
+Percentile index: build time and size for a synthetic reference cohort, resident memory of a
+worker that opens it, and lookup cost for one panel and per panel in a batch.
+
+    python -m benchmarks.bench_percentiles --rows 10000000
+"""
+import argparse
+import os
+import resource
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.bench_biological_age import synthetic_panels
+from utils.biological_age import calculate_biological_age_batch, panel_matrix
+from utils.panel import parse_panel
+from utils.percentiles import PercentileIndex, build
+
+CHUNK_ROWS = 1000000
+
+
+def cohort(rows, seed=9):
+    """(matrix, biological ages, sexes) chunks of a synthetic cohort"""
+    for start in range(0, rows, CHUNK_ROWS):
+        n = min(CHUNK_ROWS, rows - start)
+        matrix = panel_matrix(synthetic_panels(n, seed=seed + start))
+        sexes = np.where(np.random.default_rng(start).random(n) < 0.5, 'male', 'female').tolist()
+        yield matrix, calculate_biological_age_batch(matrix), sexes
+
+
+def rss_mb():
+    with open(f'/proc/{os.getpid()}/statm') as f:
+        return int(f.read().split()[1]) * resource.getpagesize() / 1e6
+
+
+def run(rows, lookups=2000):
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        build(cohort(rows), tmp)
+        build_seconds = time.perf_counter() - start
+        size_mb = sum(os.path.getsize(os.path.join(tmp, name)) for name in os.listdir(tmp)) / 1e6
+
+        before = rss_mb()
+        index = PercentileIndex(tmp)
+        panel = parse_panel({'age': 52, 'sex': 'Female', 'albumin': 4.4, 'glucose': 97, 'crp': 2.2, 'lymph_pct': 31,
+                             'mcv': 88, 'rdw': 13.4, 'wbc': 6.1, 'alk_phos': 81, 'creatinine': 0.8})
+        start = time.perf_counter()
+        for _ in range(lookups):
+            index.panel_percentiles(panel, 50.0)
+        single_us = (time.perf_counter() - start) / lookups * 1e6
+        resident = rss_mb() - before
+
+        batch = panel_matrix(synthetic_panels(10000, seed=1))
+        sexes = ['male', 'female'] * 5000
+        start = time.perf_counter()
+        index.lookup(batch, calculate_biological_age_batch(batch), sexes)
+        batch_us = (time.perf_counter() - start) / len(batch) * 1e6
+
+    print(f"rows: {rows:,}  build: {build_seconds:.1f}s  index: {size_mb:,.0f} MB")
+    print(f"worker memory after open + {lookups} lookups: +{resident:.1f} MB")
+    print(f"one panel: {single_us:.0f} µs   batch of 10,000: {batch_us:.1f} µs/panel")
+    return build_seconds, size_mb, resident, single_us, batch_us
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    args = parser.parse_args()
+    run(args.rows)
@@ -0,0 +1,212 @@
+"""
+Prompt compaction on a corpus of sample panels: estimated prompt tokens per section type and the
+stubbed latency of a five-section request before and after, with an output-token cap, plus a
+check that no out-of-range or below-optimal marker is ever left out of a prompt, even at a budget
+of one token.
+
+    python -m benchmarks.bench_prompts --panels 1000 --requests 5 --output-cap 400
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from utils import prompt_builder
+from utils.biological_age import calculate_biological_age
+from utils.llm_client import estimate_tokens
+from utils.llm_fanout import AI_SECTIONS
+from utils.panel import PANEL_COLUMNS, parse_panel, user_data_for
+from utils.prompt_builder import generate_prompt, generation_config
+from utils.reference import NORMAL, OUTSIDE_RANGE, REFERENCE
+from utils.stub_model import StubModel
+
+# Stub model timing: a fixed overhead plus a prefill cost per prompt token and a decode cost per
+# answer token; an uncapped answer is ANSWER_TOKENS long
+CALL_OVERHEAD = 0.05
+PREFILL_SECONDS_PER_TOKEN = 0.0002
+DECODE_SECONDS_PER_TOKEN = 0.001
+ANSWER_TOKENS = 700
+
+# Share of panels missing each marker
+MISSING_RATE = 0.15
+
+
+def _legacy_format_value(value):
+    # Parsed panels hold floats; print 90.0 as 90 like the submitted form did
+    return f'{value:g}' if isinstance(value, float) else value
+
+
+def _legacy_base_info(user_data):
+    return f"""Patient Info:
+- Age: {user_data['age']} (Biological Age: {user_data.get('phenotypic_age', 'N/A')})
+- Sex: {user_data['sex']}
+- Height: {user_data['height_cm']} cm
+- Weight: {user_data['weight_kg']} kg
+
+Blood Panel Results:
+{chr(10).join([f'- {marker}: {_legacy_format_value(value)}' for marker, value in user_data['biomarkers'].items()])}"""
+
+
+def legacy_prompt(user_data, prompt_type="analysis"):
+    """The prompts as generate_prompt built them before compaction (PROMPT_TEMPLATE_VERSION 1)"""
+    base_info = _legacy_base_info(user_data)
+
+    prompts = {
+        "analysis": f"""You are an expert health analyst interpreting blood test results. 
+First, note that this person's calculated biological age is {user_data.get('phenotypic_age')} years 
+compared to their chronological age of {user_data['age']} years. 
+Include this in your analysis and what it might mean for their health.
+
+Provide a clear, structured analysis using this format:
+
+🎯 SUMMARY
+• Start with biological age comparison and what it means
+• Give 2-3 sentence overview of general health indicators
+• Mention if any values are notably good or concerning
+
+📊 KEY FINDINGS
+• List 3-4 most important observations
+• Compare values to normal ranges where relevant
+• Use everyday language, not medical jargon
+
+💡 PRACTICAL RECOMMENDATIONS
+• Suggest 3-4 specific lifestyle or dietary changes
+• Keep suggestions realistic and actionable
+• Base recommendations on the actual blood values
+
+{base_info}""",
+
+        "meal_plan": f"""As a nutrition expert, create a personalized 3-day meal plan based on this blood panel:
+
+{base_info}
+
+Consider:
+- Foods that could help improve any out-of-range values
+- The person's age and weight
+- Include specific portions and timing
+- Focus on practical, everyday foods
+- Include scientific reasoning for key recommendations
+
+Format as a clear, day-by-day plan with meals and snacks.""",
+
+        "exercise_plan": f"""As a fitness expert, create a personalized exercise plan based on this health profile:
+
+{base_info}
+
+Consider:
+- Current health markers and any limitations they suggest
+- Age-appropriate activities
+- Progressive difficulty
+- Mix of cardio and strength training
+- Recovery recommendations
+
+Provide a weekly plan with specific exercises, durations, and intensities.""",
+
+        "supplement_advice": f"""As a nutrition scientist, recommend evidence-based supplements based on these blood markers:
+
+{base_info}
+
+For each recommendation:
+- Explain why it's needed based on the blood values
+- Specify dosage and timing
+- Note any interactions or contraindications
+- Prioritize by importance
+- Include both essential nutrients and optional supplements""",
+
+        "risk_assessment": f"""As a preventive health specialist, analyze potential health risks based on:
+
+{base_info}
+
+Provide:
+• Current risk factors based on blood values
+• Long-term health implications if not addressed
+• Early warning signs to watch for
+• Preventive measures prioritized by importance
+• Timeline for recommended follow-up tests"""
+    }
+
+    return prompts.get(prompt_type, prompts["analysis"])
+
+
+
+def sample_panels(count, seed=0):
+    """
+    user_data dicts for `count` panels: values drawn around the middle of each normal range so
+    that roughly one marker in six is out of range, with markers missing at MISSING_RATE
+    """
+    rng = np.random.default_rng(seed)
+    middle, width = (REFERENCE.low + REFERENCE.high) / 2, REFERENCE.high - REFERENCE.low
+    values = rng.normal(middle, width * 0.35, (count, len(REFERENCE.markers))).round(2).clip(0.01)
+    values[rng.random(values.shape) < MISSING_RATE] = np.nan
+    panels = []
+    for i in range(count):
+        form = dict(zip(PANEL_COLUMNS, [int(rng.integers(20, 85))] + values[i].tolist()),
+                    sex=('Male', 'Female')[i % 2], height=int(rng.integers(150, 195)), weight=int(rng.integers(50, 120)))
+        panel = parse_panel({key: '' if value != value else value for key, value in form.items()})
+        panels.append(user_data_for(panel, calculate_biological_age(panel)))
+    return panels
+
+
+def flagged_lines_dropped(user_data, prompt):
+    """Markers of `user_data` short of optimal (or out of range) with no value line in `prompt`"""
+    values = REFERENCE.values(user_data['biomarkers'])
+    flagged = np.flatnonzero(np.isin(REFERENCE.health_status(values), (OUTSIDE_RANGE, NORMAL))).tolist()
+    return [REFERENCE.markers[i] for i in flagged if not np.isnan(values[i])
+            and f"- {REFERENCE.markers[i]} {prompt_builder._format_value(values[i].item())} " not in prompt]
+
+
+def request_seconds(model, prompts, configs):
+    """Wall time of one request that sends its section prompts concurrently, as /results does"""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(len(prompts)) as pool:
+        list(pool.map(lambda args: model.generate_content(args[0], **args[1]), zip(prompts, configs)))
+    return time.perf_counter() - start
+
+
+def run(panels, requests, output_cap):
+    corpus = sample_panels(panels)
+    if output_cap:
+        prompt_builder.OUTPUT_TOKEN_LIMITS.update(dict.fromkeys(AI_SECTIONS.values(), output_cap))
+    print(f"panels: {panels:,} ({sum(len(u['biomarkers']) - 1 for u in corpus) / panels:.1f} markers each)  "
+          f"output cap: {output_cap or 'none'}")
+
+    print(f"{'prompt type':<18} {'before':>8} {'after':>8} {'change':>8}   (mean estimated prompt tokens)")
+    for prompt_type in AI_SECTIONS.values():
+        before = np.mean([estimate_tokens(legacy_prompt(u, prompt_type)) for u in corpus])
+        after = np.mean([estimate_tokens(generate_prompt(u, prompt_type)) for u in corpus])
+        print(f"{prompt_type:<18} {before:>8.0f} {after:>8.0f} {after / before - 1:>+8.0%}")
+
+    dropped = 0
+    budgets = dict(prompt_builder.PROMPT_TOKEN_BUDGETS)
+    for tight in (False, True):
+        if tight:
+            prompt_builder.PROMPT_TOKEN_BUDGETS.update(dict.fromkeys(budgets, 1))
+        for user_data in corpus:
+            for prompt_type in AI_SECTIONS.values():
+                dropped += len(flagged_lines_dropped(user_data, generate_prompt(user_data, prompt_type)))
+    prompt_builder.PROMPT_TOKEN_BUDGETS.update(budgets)
+    print(f"flagged markers left out of a prompt (default and 1-token budgets): {dropped}")
+
+    model = StubModel(latency=lambda prompt: CALL_OVERHEAD + estimate_tokens(prompt) * PREFILL_SECONDS_PER_TOKEN,
+                      answer_tokens=ANSWER_TOKENS, token_latency=DECODE_SECONDS_PER_TOKEN)
+    before = [request_seconds(model, [legacy_prompt(u, t) for t in AI_SECTIONS.values()], [{}] * len(AI_SECTIONS))
+              for u in corpus[:requests]]
+    after = [request_seconds(model, [generate_prompt(u, t) for t in AI_SECTIONS.values()],
+                             [{'generation_config': generation_config(t)} if generation_config(t) else {}
+                              for t in AI_SECTIONS.values()])
+             for u in corpus[:requests]]
+    print(f"stubbed request latency: before {np.mean(before):.3f}s  after {np.mean(after):.3f}s "
+          f"({np.mean(after) / np.mean(before) - 1:+.0%})")
+    return dropped
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--panels', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=5, help="requests timed against the stub model")
+    parser.add_argument('--output-cap', type=int, default=400, help="max output tokens per section (0: none)")
+    args = parser.parse_args()
+    if run(args.panels, args.requests, args.output_cap):
+        sys.exit(1)
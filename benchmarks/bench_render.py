@@ -0,0 +1,71 @@
+"""
+Template and asset pipeline: template compile time with and without the bytecode cache, warm
+render time of results.html, and page weight on a first and a repeat visit (CSS served from
+/assets/ is cached by the browser, so a repeat visit downloads only the HTML).
+
+    python -m benchmarks.bench_render --repeat 500
+"""
+import argparse
+import gzip
+import tempfile
+import time
+
+from flask import render_template
+from jinja2 import FileSystemBytecodeCache
+
+from app import build_marker_insights, create_app
+from benchmarks.bench_fanout import SAMPLE_USER
+from utils.llm_fanout import AI_SECTIONS
+
+SECTION_HTML = '<p>' + 'Insight text. ' * 60 + '</p>'
+
+
+def compile_ms(app, bytecode_cache=None):
+    """Fresh environment compiling (or loading from `bytecode_cache`) every template"""
+    env = app.create_jinja_environment()
+    env.bytecode_cache = bytecode_cache
+    start = time.perf_counter()
+    for name in env.list_templates():
+        env.get_template(name)
+    return (time.perf_counter() - start) * 1000
+
+
+def page_weight(app, html):
+    """(first visit, repeat visit) bytes over the wire for a gzip/brotli capable browser"""
+    assets = app.extensions['assets']
+    linked = [asset for name, asset in assets.assets.items() if name in html]
+    html_bytes = len(gzip.compress(html.encode('utf-8')))
+    asset_bytes = sum(min(len(body) for body in asset.bodies.values()) for asset in linked)
+    return html_bytes + asset_bytes, html_bytes
+
+
+def run(repeat):
+    app = create_app()
+    user = dict(SAMPLE_USER, biomarkers={k: float(v) for k, v in SAMPLE_USER['biomarkers'].items() if k != 'age'})
+    context = dict(user_data=user, marker_insights=build_marker_insights(user['biomarkers']),
+                   **dict.fromkeys(AI_SECTIONS, SECTION_HTML))
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = FileSystemBytecodeCache(tmp)
+        results = {'compile, no cache (ms)': compile_ms(app)}
+        compile_ms(app, cache)
+        results['compile, bytecode cache (ms)'] = compile_ms(app, cache)
+
+    with app.test_request_context('/results'):
+        render_template('results.html', **context)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            html = render_template('results.html', **context)
+        results['results.html render (ms)'] = (time.perf_counter() - start) / repeat * 1000
+        results['results.html bytes'] = len(html.encode('utf-8'))
+        results['first visit bytes (compressed)'], results['repeat visit bytes (compressed)'] = \
+            page_weight(app, html)
+    for name, value in results.items():
+        print(f"{name:<34}{value:>10.2f}" if isinstance(value, float) else f"{name:<34}{value:>10,}")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=500)
+    args = parser.parse_args()
+    run(args.repeat)
@@ -0,0 +1,45 @@
+"""
+Identical panels submitted at once (double-clicks, retries, the demo-fill button): upstream
+calls with and without single-flight, within one worker and across workers sharing a cache file.
+
+    python -m benchmarks.bench_single_flight --submissions 4 --workers 2
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.bench_fanout import SAMPLE_USER
+from utils.llm_cache import ResponseCache
+from utils.llm_fanout import AI_SECTIONS, generate_sections
+from utils.stub_model import StubModel
+
+
+def run(submissions, workers, latency):
+    model = StubModel(latency=latency)
+    with tempfile.TemporaryDirectory() as tmp:
+        # One ResponseCache per simulated gunicorn worker, all on the same SQLite file
+        caches = [ResponseCache(path=os.path.join(tmp, 'llm_cache.sqlite')) for _ in range(workers)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=submissions) as pool:
+            list(pool.map(lambda i: generate_sections(model, SAMPLE_USER, cache=caches[i % workers]),
+                          range(submissions)))
+        elapsed = time.perf_counter() - start
+
+    without = submissions * len(AI_SECTIONS)
+    coalesced = sum(cache.stats()['coalesced'] for cache in caches)
+    shared = sum(cache.stats()['shared_coalesced'] for cache in caches)
+    print(f"{submissions} identical submissions over {workers} worker(s), {latency:.2f}s per call")
+    print(f"upstream calls: {model.calls} (without single-flight: {without})")
+    print(f"saved: {coalesced} in-worker, {shared} cross-worker; wall time {elapsed:.3f}s")
+    return model.calls
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--submissions', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--latency', type=float, default=0.3)
+    args = parser.parse_args()
+    run(args.submissions, args.workers, args.latency)
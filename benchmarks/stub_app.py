@@ -0,0 +1,14 @@
+"""
+The real Flask app with Gemini replaced by StubModel, for load tests:
+
+    BLOODIQ_STUB_LATENCY=0.5 gunicorn benchmarks.stub_app:app --config gunicorn.conf.py
+"""
+import os
+
+from app import create_app
+from utils.gemini import set_model
+from utils.llm_client import LLMClient
+from utils.stub_model import StubModel
+
+set_model(LLMClient.from_env(StubModel(latency=float(os.getenv('BLOODIQ_STUB_LATENCY', 0.5)))))
+app = create_app()
@@ -0,0 +1,146 @@
+"""
+Offline regression suite for the per-request hot paths: biological age, the aging clocks,
+analyze_health, the marker table, prompt building, rule-based advice, markdown rendering and the
+whole /results route against a stub model. Results are written as JSON; --compare exits non-zero
+when a case is slower than a stored baseline by more than --threshold.
+
+    python -m benchmarks.suite --output bench.json
+    python -m benchmarks.suite --compare bench.json --threshold 0.25
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+
+from app import build_marker_insights, create_app
+from utils import gemini
+from utils.aging_clocks import CLOCKS, panel_clocks
+from utils.biological_age import calculate_biological_age
+from utils.health_analysis import analyze_health
+from utils.markdown_render import MarkdownRenderer
+from utils.panel import parse_panel, user_data_for
+from utils.prompt_builder import generate_prompt
+from utils.rule_advice import rule_sections_html
+from utils.stub_model import StubModel
+
+FORM = {'age': '45', 'sex': 'Male', 'height': '178', 'weight': '82', 'albumin': '4.2', 'creatinine': '1.0',
+        'glucose': '104', 'crp': '2.1', 'lymph_pct': '28', 'mcv': '91', 'rdw': '13.1', 'alk_phos': '80',
+        'wbc': '6.4'}
+
+SECTION_MARKDOWN = (
+    "## 🎯 SUMMARY\n\nYour **glucose** (104 mg/dL) is slightly above range.\n\n"
+    "| Marker | Value | Status |\n|---|---|---|\n| Glucose | 104 | High |\n| CRP | 2.1 | High |\n\n"
+    + "- Eat more fibre and walk after meals.\n" * 20
+)
+
+
+def cases():
+    """{name: callable} for every case; results_route calls whichever model is installed"""
+    panel = parse_panel(FORM, required=('age', 'height_cm', 'weight_kg'))
+    record = dict(panel)
+    user_data = user_data_for(panel, calculate_biological_age(panel))
+    renderer = MarkdownRenderer()
+    renderer.render(SECTION_MARKDOWN)
+    client = create_app().test_client()
+
+    return {
+        'calculate_biological_age[panel]': lambda: calculate_biological_age(panel),
+        'calculate_biological_age[dict]': lambda: calculate_biological_age(record),
+        'panel_clocks': lambda: panel_clocks(panel),
+        # One case per registered clock, so a clock that slows the single-panel path fails --compare
+        **{f'panel_clocks[{name}]': (lambda name=name: panel_clocks(panel, (name,))) for name in CLOCKS},
+        'analyze_health': lambda: analyze_health(panel),
+        'build_marker_insights': lambda: build_marker_insights(panel),
+        'parse_panel': lambda: parse_panel(FORM, required=('age', 'height_cm', 'weight_kg')),
+        'generate_prompt': lambda: generate_prompt(user_data, 'analysis'),
+        'rule_sections_html': lambda: rule_sections_html(user_data),
+        'format_markdown[memoized]': lambda: renderer.render(SECTION_MARKDOWN),
+        'format_markdown[convert]': lambda: renderer.convert(SECTION_MARKDOWN),
+        # Same form every call: after the first round the stub's answers come from the response cache
+        'results_route': lambda: client.post('/results?stream=0', data=FORM),
+    }
+
+
+def measure(fn, rounds, min_round=0.05):
+    """
+    Per-call µs over `rounds` timing rounds, best and median. Each round repeats the call enough
+    times to last `min_round` seconds, so microsecond cases are not dominated by timer noise.
+    """
+    fn()
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if time.perf_counter() - start >= min_round:
+            break
+        number *= 2
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        timings.append((time.perf_counter() - start) / number)
+    return {'best_us': min(timings) * 1e6, 'median_us': statistics.median(timings) * 1e6}
+
+
+def run(rounds=7, latency=0.0, only=None):
+    results = {}
+    # The stub is only installed while the suite runs, so it does not leak into the rest of the process
+    with gemini.model_override(StubModel(latency=latency)):
+        for name, fn in cases().items():
+            if only and not any(pattern in name for pattern in only):
+                continue
+            results[name] = measure(fn, rounds)
+            print(f"{name:<34} best {results[name]['best_us']:>10.2f} µs   "
+                  f"median {results[name]['median_us']:>10.2f} µs")
+    return {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'rounds': rounds,
+        'results': results
+    }
+
+
+def compare(current, baseline, threshold, min_delta_us=2.0):
+    """
+    [(case, baseline µs, current µs, ratio)] for cases whose best time grew by more than
+    `threshold` (a fraction) and by at least `min_delta_us`: below that, runs of the same code in
+    different processes already differ by a few tenths on the microsecond cases
+    """
+    regressions = []
+    for name, timing in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        ratio = timing['best_us'] / before['best_us']
+        if ratio > 1 + threshold and timing['best_us'] - before['best_us'] >= min_delta_us:
+            regressions.append((name, before['best_us'], timing['best_us'], ratio))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=7)
+    parser.add_argument('--latency', type=float, default=0.0, help="stub model seconds per call")
+    parser.add_argument('--only', nargs='*', help="run only cases whose name contains one of these")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--compare', help="baseline JSON file from an earlier --output")
+    parser.add_argument('--threshold', type=float, default=0.25, help="allowed slowdown, 0.25 = 25%%")
+    parser.add_argument('--min-delta-us', type=float, default=2.0, help="ignore slowdowns smaller than this")
+    args = parser.parse_args()
+
+    current = run(args.rounds, args.latency, args.only)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(current, json.load(f), args.threshold, args.min_delta_us)
+        for name, before, after, ratio in regressions:
+            print(f"❌ {name}: {before:.2f} µs -> {after:.2f} µs ({ratio - 1:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"✅ No case slower than the baseline by more than {args.threshold:.0%}")
@@ -0,0 +1,12 @@
+import os
+
+import pytest
+
+# test_gemini.py and test_geminiapi.py are live-API smoke scripts; only collect them with a key
+collect_ignore = [] if os.getenv("GEMINI_API_KEY") else ["test_gemini.py", "test_geminiapi.py"]
+
+
+@pytest.fixture(autouse=True)
+def job_queue_file(tmp_path, monkeypatch):
+    # The app's job queue defaults to a file in its instance folder; give each test its own
+    monkeypatch.setenv('BLOODIQ_JOBS_PATH', str(tmp_path / "jobs.sqlite"))
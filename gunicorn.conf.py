@@ -0,0 +1,51 @@
+"""
+Gunicorn settings for BloodIQ. Flask is a WSGI app and every /results request spends most of its
+time waiting on Gemini, so workers must overlap many blocked requests per process:
+
+    BLOODIQ_SERVER_MODE=gthread  (default) OS threads; BLOODIQ_THREADS requests in flight per worker
+    BLOODIQ_SERVER_MODE=gevent   greenlets; BLOODIQ_WORKER_CONNECTIONS requests in flight per worker
+    BLOODIQ_SERVER_MODE=sync     one request per worker (the old effective behaviour; for comparison)
+"""
+import multiprocessing
+import os
+
+mode = os.getenv('BLOODIQ_SERVER_MODE', 'gthread')
+if mode not in ('gthread', 'gevent', 'sync'):
+    raise RuntimeError(f"Unknown BLOODIQ_SERVER_MODE: {mode}")
+
+if mode == 'gevent':
+    # preload_app imports the app (and the LLM thread pool's threading/queue primitives) in the
+    # master, so patch here, before that import, rather than in the worker after it
+    from gevent import monkey
+    monkey.patch_all()
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', min(4, multiprocessing.cpu_count())))
+worker_class = mode
+threads = int(os.getenv('BLOODIQ_THREADS', 64))
+worker_connections = int(os.getenv('BLOODIQ_WORKER_CONNECTIONS', 500))
+timeout = 120
+preload_app = True
+max_requests = 1200
+max_requests_jitter = 100
+
+# Each in-flight page fans out to five Gemini calls; size the per-process LLM pool to match
+in_flight = {'gthread': threads, 'gevent': worker_connections, 'sync': 1}[mode]
+os.environ.setdefault('BLOODIQ_LLM_WORKERS', str(in_flight * 5))
+
+
+def post_worker_init(worker):
+    if mode == 'gevent':
+        # gRPC (used by google-generativeai) must cooperate with gevent's patched sockets
+        try:
+            from grpc.experimental import gevent as grpc_gevent
+        except ImportError:
+            return
+        grpc_gevent.init_gevent()
+
+
+def child_exit(server, worker):
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        # Stop aggregating the dead worker's live gauges into /metrics
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,67 @@
+import math
+import re
+
+import numpy as np
+import pytest
+
+from app import create_app
+from benchmarks.bench_biological_age import synthetic_panels
+from utils.aging_clocks import CLOCKS, PRIMARY_CLOCK, panel_clocks, score_clocks
+from utils.biological_age import calculate_biological_age_batch, panel_matrix
+from utils.panel import parse_panel
+from utils.phenotypic_age import mortality_score, phenotypic_age
+
+PANEL = {'age': 45, 'sex': 'Female', 'albumin': 4.5, 'glucose': 90, 'crp': 1, 'lymph_pct': 30, 'mcv': 90, 'rdw': 13,
+         'wbc': 6, 'alk_phos': 70, 'creatinine': 1}
+
+
+def test_batch_scores_every_clock_and_single_panels_match():
+    matrix = panel_matrix(synthetic_panels(5000, seed=3))
+    matrix[7, 3] = np.nan
+    clocks = score_clocks(matrix)
+    assert list(clocks) == list(CLOCKS)
+    assert np.array_equal(clocks['deviation'], calculate_biological_age_batch(matrix), equal_nan=True)
+    assert all(np.isnan(ages[7]) and not np.isnan(np.delete(ages, 7)).any() for ages in clocks.values())
+
+    panel = parse_panel(PANEL)
+    single = panel_clocks(panel)
+    assert single == {name: ages[0] for name, ages in score_clocks([panel]).items()}
+    assert panel_clocks(parse_panel({'age': 30})) == dict.fromkeys(CLOCKS)
+    with pytest.raises(ValueError):
+        score_clocks(matrix, ['horvath'])
+
+
+def test_scalar_forms_agree_with_the_batch_scores():
+    matrix = panel_matrix(synthetic_panels(20000, seed=11))
+    batch = score_clocks(matrix)
+    for name, clock in CLOCKS.items():
+        assert clock.scalar is not None, name
+        scalar = np.array([round(clock.scalar(row), 1) for row in matrix.tolist()])
+        assert np.array_equal(scalar, batch[name]), name
+
+
+def test_phenoage_matches_the_published_formula():
+    inputs = {'age': 45, 'albumin': 45, 'creatinine': 88.42, 'glucose': 90 / 18.016, 'log_crp': math.log(0.1),
+              'lymph_pct': 30, 'mcv': 90, 'rdw': 13, 'alk_phos': 70, 'wbc': 6}
+    xb = -19.9067 + 0.0804 * 45 - 0.0336 * 45 + 0.0095 * 88.42 + 0.1953 * 90 / 18.016 + 0.0954 * math.log(0.1) \
+        - 0.0120 * 30 + 0.0268 * 90 + 0.3306 * 13 + 0.00188 * 70 + 0.0554 * 6
+    published = 141.50225 + math.log(-0.00553 * math.log(1 - mortality_score(xb))) / 0.090165
+    assert phenotypic_age(inputs) == pytest.approx(published, abs=1e-9)
+    assert panel_clocks(parse_panel(PANEL))['phenoage'] == round(published, 1)
+
+
+def test_registered_clock_reaches_the_api_and_results_page(monkeypatch):
+    # No scalar form: single panels score it as a batch of one alongside the others' scalar forms
+    monkeypatch.setitem(CLOCKS, 'ten_years', CLOCKS[PRIMARY_CLOCK]._replace(
+        name='ten_years', label='Ten years on', score=lambda inputs: inputs.age + 10, scalar=None))
+    client = create_app().test_client()
+
+    result = client.post('/api/analyze', json=PANEL).get_json()
+    assert result['aging_clocks']['ten_years'] == 55.0
+    assert result['aging_clocks'][PRIMARY_CLOCK] == result['biological_age']
+
+    form = {key: str(value) for key, value in dict(PANEL, height=170, weight=60).items()}
+    page = client.post('/results?ai_mode=rules', data=form).get_data(as_text=True)
+    assert 'Ten years on: 55.0 years' in page and 'PhenoAge: ' in page
+    shown = re.search(r'Biological Age</h3>\s*<div class="value-highlight"[^>]*>([^<]*)</div>', page).group(1)
+    assert float(shown) == panel_clocks(parse_panel(form))[PRIMARY_CLOCK] == result['biological_age']
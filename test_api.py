@@ -0,0 +1,62 @@
+import time
+
+from app import create_app
+from utils import gemini
+from utils.llm_fanout import AI_SECTIONS
+from utils.stub_model import StubModel
+
+PANEL = {'age': 40, 'sex': 'Male', 'height_cm': 180, 'weight_kg': 80, 'albumin': 4.5, 'glucose': 90, 'crp': 1,
+         'lymph_pct': 30, 'mcv': 90, 'rdw': 13, 'wbc': 6, 'alk_phos': 70, 'creatinine': 1}
+
+
+def test_analyze_and_batch_agree_and_report_invalid_panels_per_entry(monkeypatch):
+    monkeypatch.setenv('BLOODIQ_API_MAX_BATCH', '3')
+    client = create_app().test_client()
+
+    single = client.post('/api/analyze', json=dict(PANEL, crp=4)).get_json()
+    assert single['api_version'] == 1 and single['markers']['crp'] == {
+        'value': 4.0, 'unit': 'mg/L', 'status': 'outside_range', 'range': 'above'
+    }
+    assert single['concerns'] == ['crp is outside normal range'] and single['missing'] == []
+
+    batch = client.post('/api/v1/analyze/batch', json={'panels': [
+        dict(PANEL, crp=4), {'age': 50, 'glucose': 'high'}, {'age': 50, 'biomarkers': {'glucose': 5.5}, 'units': {'glucose': 'mmol/L'}}
+    ]}).get_json()
+    assert batch['count'] == 3 and batch['invalid'] == 1
+    assert batch['results'][0] == {key: value for key, value in single.items() if key != 'api_version'}
+    assert batch['results'][1]['fields'] == {'glucose': "not a number: 'high'"}
+    assert batch['results'][2]['markers']['glucose']['value'] == 5.5 * 18.016
+    assert batch['results'][2]['biological_age'] is None and len(batch['results'][2]['missing']) == 8
+
+    assert client.post('/api/analyze', json={'glucose': 90}).get_json()['fields'] == {'age': 'required'}
+    assert client.post('/api/analyze', json={'age': 50, 'biomarkers': [90]}).get_json()['fields'] == {
+        'biomarkers': 'must be an object'
+    }
+    batch = client.post('/api/analyze/batch', json={'panels': [
+        {'age': 50, 'units': 'mmol/L'}, {'age': 50, 'glucose': True}, PANEL
+    ]}).get_json()
+    assert batch['invalid'] == 2 and batch['results'][0]['fields'] == {'units': 'must be an object'}
+    assert batch['results'][1]['fields'] == {'glucose': 'not a number: True'} and 'markers' in batch['results'][2]
+    assert client.post('/api/analyze/batch', json={'panels': [PANEL] * 4}).status_code == 413
+    assert client.post('/api/analyze/batch', data='[]', content_type='application/json').status_code == 400
+
+
+def test_ai_sections_are_generated_in_a_job_the_client_polls(tmp_path, monkeypatch):
+    monkeypatch.setenv('BLOODIQ_JOBS_PATH', str(tmp_path / "jobs.sqlite"))
+    model = StubModel(latency=0.05)
+    monkeypatch.setattr(gemini, '_model', model)
+    app = create_app()
+
+    response = app.test_client().post('/api/analyze', json=dict(PANEL, ai=True))
+    assert response.status_code == 202 and response.get_json()['overall_health_score'] == 100
+    status_url = response.get_json()['ai_job']['status_url']
+
+    # Any worker sharing the jobs file can answer the poll
+    other_worker = create_app().test_client()
+    deadline = time.monotonic() + 5
+    while (job := other_worker.get(status_url).get_json())['status'] in ('pending', 'running'):
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+    assert job['status'] == 'done' and set(job['sections']) == set(AI_SECTIONS)
+    assert all('Stub response' in text for text in job['sections'].values())
+    assert other_worker.get('/api/jobs/unknown').status_code == 404
@@ -0,0 +1,39 @@
+import gzip
+import re
+
+from app import create_app
+from utils import assets, gemini
+from utils.stub_model import StubModel
+
+
+def test_pages_link_fingerprinted_css_served_compressed_and_immutable():
+    client = create_app().test_client()
+    page = client.get('/').get_data(as_text=True)
+    url = re.search(r'href="(/assets/css/index\.[0-9a-f]{10}\.css)"', page).group(1)
+    assert '<style>' not in page
+
+    plain = client.get(url, headers={'Accept-Encoding': 'identity'})
+    assert plain.mimetype == 'text/css' and 'Content-Encoding' not in plain.headers
+    assert 'immutable' in plain.headers['Cache-Control']
+
+    zipped = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert zipped.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(zipped.get_data()) == plain.get_data()
+    if assets.brotli is not None:
+        encoded = client.get(url, headers={'Accept-Encoding': 'gzip, br'})
+        assert encoded.headers['Content-Encoding'] == 'br'
+        assert assets.brotli.decompress(encoded.get_data()) == plain.get_data()
+
+    revalidated = client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': zipped.headers['ETag']})
+    assert revalidated.status_code == 304
+    assert client.get('/assets/css/index.css').status_code == 404
+
+
+def test_results_page_loads_bootstrap_scripts_once(monkeypatch):
+    monkeypatch.setattr(gemini, '_model', StubModel())
+    client = create_app().test_client()
+    form = {'age': '40', 'sex': 'Male', 'height': '180', 'weight': '80', 'albumin': '4.5', 'glucose': '90',
+            'crp': '1', 'lymph_pct': '30', 'mcv': '90', 'rdw': '13', 'wbc': '6', 'alk_phos': '70', 'creatinine': '1'}
+    page = client.post('/results?stream=0', data=form).get_data(as_text=True)
+    assert page.count('popper.min.js') == 1 and page.count('bootstrap.min.js') == 1
+    assert re.search(r'/assets/css/results\.[0-9a-f]{10}\.css', page)
@@ -0,0 +1,30 @@
+from benchmarks import suite
+from utils import gemini
+from utils.aging_clocks import CLOCKS
+
+
+def timings(**best_us):
+    return {'results': {name: {'best_us': us, 'median_us': us} for name, us in best_us.items()}}
+
+
+def test_suite_runs_offline_and_compare_flags_only_real_regressions():
+    installed = gemini._model
+    current = suite.run(rounds=2, only=['generate_prompt', 'results_route'])
+    assert set(current['results']) == {'generate_prompt', 'results_route'}
+    assert gemini._model is installed  # the suite's stub model is not left behind
+    assert suite.compare(current, current, threshold=0.25) == []
+
+    baseline = timings(parse_panel=10.0, generate_prompt=4.0, results_route=2000.0)
+    regressions = suite.compare(timings(parse_panel=14.0, generate_prompt=5.5, results_route=2400.0, new_case=1.0),
+                                baseline, threshold=0.25)
+    # generate_prompt is 38% slower but by under 2 µs; new_case has no baseline
+    assert regressions == [('parse_panel', 10.0, 14.0, 1.4)]
+
+
+def test_a_clock_losing_its_scalar_form_fails_the_comparison(monkeypatch):
+    baseline = suite.run(rounds=2, only=['panel_clocks['])
+    assert set(baseline['results']) == {f'panel_clocks[{name}]' for name in CLOCKS}
+
+    monkeypatch.setitem(CLOCKS, 'phenoage', CLOCKS['phenoage']._replace(scalar=None))
+    regressed = suite.run(rounds=2, only=['panel_clocks[phenoage]'])
+    assert [name for name, *_ in suite.compare(regressed, baseline, threshold=0.25)] == ['panel_clocks[phenoage]']
@@ -0,0 +1,50 @@
+import re
+
+import numpy as np
+
+from app import create_app
+from benchmarks.bench_biological_age import synthetic_panels
+from utils.biological_age import PANEL_COLUMNS, calculate_biological_age, calculate_biological_age_batch
+from utils.panel import parse_panel
+
+PANEL = {
+    "age": "45", "albumin": "4.2", "creatinine": "1.0", "glucose": "104", "crp": "2.1",
+    "lymph_pct": "28", "mcv": "91", "rdw": "13.1", "alk_phos": "80", "wbc": "6.4"
+}
+
+
+def test_batch_is_bit_for_bit_identical_to_scalar():
+    columns = synthetic_panels(20000, seed=1)
+    batch = calculate_biological_age_batch(columns)
+    scalar = [
+        calculate_biological_age({column: columns[column][i] for column in PANEL_COLUMNS})
+        for i in range(20000)
+    ]
+    assert np.array_equal(np.array(scalar, dtype=np.float64).view(np.int64), batch.view(np.int64))
+
+
+def test_batch_accepts_form_strings_and_masks_missing_rows():
+    incomplete = dict(PANEL, crp="")
+    columns = {column: [PANEL[column], incomplete[column], None if column == 'wbc' else PANEL[column]]
+               for column in PANEL_COLUMNS}
+    ages = calculate_biological_age_batch(columns)
+
+    assert ages[0] == calculate_biological_age(PANEL)
+    assert np.isnan(ages[1]) and np.isnan(ages[2])
+
+
+def test_batch_accepts_matrix_in_panel_column_order():
+    matrix = np.array([[float(PANEL[column]) for column in PANEL_COLUMNS]] * 3)
+    assert list(calculate_biological_age_batch(matrix)) == [calculate_biological_age(PANEL)] * 3
+
+
+def test_results_page_shows_the_biological_age_it_scored():
+    client = create_app().test_client()
+    form = dict(PANEL, sex='Female', height='170', weight='60')
+    page = client.post('/results?ai_mode=rules', data=form).get_data(as_text=True)
+    shown = re.search(r'Biological Age</h3>\s*<div class="value-highlight"[^>]*>([^<]*)</div>', page).group(1)
+    assert float(shown) == calculate_biological_age(parse_panel(form))
+    assert f'your biological age is calculated to be {shown} years' in page
+
+    page = client.post('/results?ai_mode=rules', data=dict(form, crp='')).get_data(as_text=True)
+    assert 'Your biological age could not be calculated' in page
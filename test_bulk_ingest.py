@@ -0,0 +1,50 @@
+import csv
+import io
+
+from app import create_app
+from utils.biological_age import calculate_biological_age
+from utils.bulk_ingest import OUTPUT_COLUMNS, ingest
+
+HEADER = "patient_id,age,albumin,creatinine,glucose,crp,lymph_pct,mcv,rdw,alk_phos,wbc\n"
+ROW = "p{i},45,4.2,1.0,{glucose},2.1,28,91,13.1,80,6.4\n"
+
+
+def panels_csv(rows):
+    lines = [HEADER] + [ROW.format(i=i, glucose=90 + i % 40) for i in range(rows)]
+    return io.BytesIO(''.join(lines).encode('utf-8'))
+
+
+def test_ingest_scores_every_row_across_chunks():
+    out = io.StringIO()
+    stats = ingest(panels_csv(25), out, chunk_size=10)
+    rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+
+    assert stats['rows'] == 25 and stats['rows_per_sec'] > 0
+    assert list(rows[0]) == OUTPUT_COLUMNS
+    assert [row['id'] for row in rows] == [f"p{i}" for i in range(25)]
+    expected = calculate_biological_age({
+        "age": "45", "albumin": "4.2", "creatinine": "1.0", "glucose": "95", "crp": "2.1",
+        "lymph_pct": "28", "mcv": "91", "rdw": "13.1", "alk_phos": "80", "wbc": "6.4"
+    })
+    assert float(rows[5]['biological_age']) == expected
+    assert rows[5]['glucose_status'] == 'normal'
+
+
+def test_incomplete_rows_are_reported_not_fatal():
+    source = io.BytesIO((HEADER + "p0,45,,,,,,,,,\n").encode('utf-8'))
+    out = io.StringIO()
+    ingest(source, out)
+    row = next(csv.DictReader(io.StringIO(out.getvalue())))
+
+    assert row['biological_age'] == '' and row['overall_health_score'] == ''
+    assert row['glucose_status'] == 'missing'
+
+
+def test_bulk_upload_streams_results_and_rejects_a_bad_chunk_size():
+    client = create_app().test_client()
+    response = client.post('/bulk', data={'file': (panels_csv(25), 'panels.csv'), 'chunk_size': '10'})
+    assert response.status_code == 200 and len(response.get_data(as_text=True).splitlines()) == 26
+
+    for chunk_size in ('0', '-5'):
+        response = client.post('/bulk', data={'file': (panels_csv(5), 'panels.csv'), 'chunk_size': chunk_size})
+        assert response.status_code == 400 and 'chunk_size' in response.get_json()['error']
@@ -0,0 +1,48 @@
+import numpy as np
+
+from benchmarks.bench_biological_age import synthetic_panels
+from utils.aging_clocks import CLOCKS, score_clocks
+from utils.biological_age import panel_matrix
+from utils.cohort_scoring import file_matrices, history_matrices, pack, score
+from utils.health_analysis import analyze_health_batch
+from utils.history_store import HistoryStore
+from utils.panel import PANEL_COLUMNS
+
+
+def test_parallel_scores_equal_one_process_in_input_order(tmp_path):
+    matrix = panel_matrix(synthetic_panels(5003, seed=8))
+    matrix[[3, 4000], 2] = np.nan
+    matrix[10, 1:] = np.nan
+    rows = pack(np.array_split(matrix, 7), str(tmp_path / "cohort.npy"))
+    assert rows == 5003 and np.array_equal(np.load(tmp_path / "cohort.npy"), matrix, equal_nan=True)
+
+    seen = []
+    parallel, stats = score(str(tmp_path / "cohort.npy"), str(tmp_path / "parallel.npy"), workers=3, task_rows=700,
+                            progress=lambda stats: seen.append(stats['rows']))
+    serial, _ = score(str(tmp_path / "cohort.npy"), str(tmp_path / "serial.npy"), workers=1, task_rows=5003)
+    assert parallel.tobytes() == serial.tobytes()
+    assert len(seen) == 8 and seen[-1] == stats['total'] == 5003
+
+    statuses, overall = analyze_health_batch(matrix)
+    for name, ages in score_clocks(matrix).items():
+        assert np.array_equal(parallel[name], ages, equal_nan=True)
+    assert np.array_equal(parallel['statuses'], statuses)
+    assert np.array_equal(parallel['overall_health_score'], overall, equal_nan=True)
+    assert set(CLOCKS) < set(parallel.dtype.names)
+
+
+def test_pack_reads_cohort_files_and_the_history(tmp_path):
+    columns = synthetic_panels(300, seed=9)
+    with open(tmp_path / "cohort.csv", 'w') as f:
+        f.write(','.join(PANEL_COLUMNS) + '\n')
+        for row in zip(*(columns[column] for column in PANEL_COLUMNS)):
+            f.write(','.join(map(str, row)) + '\n')
+    pack(file_matrices(str(tmp_path / "cohort.csv"), chunk_size=128), str(tmp_path / "from_file.npy"))
+
+    store = HistoryStore(str(tmp_path / "history.sqlite"))
+    store.add_panels(dict(columns, patient_id=['p'] * 300, taken_at=np.arange(300.0)))
+    pack(history_matrices(store, chunk_size=128), str(tmp_path / "from_history.npy"))
+
+    expected = panel_matrix(columns)
+    assert np.array_equal(np.load(tmp_path / "from_file.npy"), expected)
+    assert np.array_equal(np.load(tmp_path / "from_history.npy"), expected)
@@ -0,0 +1,128 @@
+import re
+import sqlite3
+
+import numpy as np
+
+from app import create_app
+from benchmarks.bench_biological_age import synthetic_panels
+from utils import gemini
+from utils.biological_age import PANEL_COLUMNS, calculate_biological_age
+from utils.health_analysis import analyze_health
+from utils.history_store import HistoryStore, new_token
+from utils.stub_model import StubModel
+
+FORM = {'patient_id': 'p-1', 'age': '40', 'sex': 'Male', 'height': '180', 'weight': '80', 'albumin': '4.5',
+        'glucose': '90', 'crp': '1', 'lymph_pct': '30', 'mcv': '90', 'rdw': '13', 'wbc': '6', 'alk_phos': '70',
+        'creatinine': '1'}
+
+
+def add(store, patient_id, glucose, taken_at):
+    return store.add_panel(patient_id, {'age': 40, 'biomarkers': {'glucose': glucose}}, taken_at=taken_at)
+
+
+def issued_key(page):
+    return re.search(r'Patient key:</strong> <code>([^<]+)</code>', page).group(1)
+
+
+def test_back_dated_panel_refreshes_only_the_trend_points_after_it(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.sqlite"))
+    for taken_at, glucose in ((1, 90), (2, 96), (4, 102), (5, 108)):
+        add(store, 'p-1', glucose, taken_at)
+    add(store, 'p-1', 99, 3)
+
+    points = store.trends('p-1', ['glucose'])['glucose']
+    assert [p['value'] for p in points] == [90, 96, 99, 102, 108]
+    assert [p['delta'] for p in points] == [None, 6, 3, 3, 6]
+    assert [p['rolling_mean'] for p in points] == [90, 93, 95, 99, 103]
+    assert [p['taken_at'] for p in store.trends('p-1', ['glucose'], since=2, until=4)['glucose']] == [2, 3, 4]
+
+
+def test_bulk_import_matches_one_by_one_inserts(tmp_path):
+    columns = synthetic_panels(300, seed=4)
+    columns['crp'][::5] = np.nan
+    columns['patient_id'] = np.array([f"p-{i % 7}" for i in range(300)])
+    columns['taken_at'] = np.arange(300, dtype=np.float64)
+
+    bulk = HistoryStore(str(tmp_path / "bulk.sqlite"))
+    bulk.add_panels({name: column[:150] for name, column in columns.items()})
+    bulk.add_panels({name: column[150:] for name, column in columns.items()})
+
+    single = HistoryStore(str(tmp_path / "single.sqlite"))
+    for i in range(300):
+        panel = {column: None if np.isnan(columns[column][i]) else columns[column][i] for column in PANEL_COLUMNS}
+        age = calculate_biological_age(panel)
+        single.add_panel(columns['patient_id'][i], {'age': panel['age'], 'biomarkers': panel}, age,
+                         analyze_health(panel, biological_age=age), taken_at=columns['taken_at'][i])
+
+    for metric, points in bulk.trends('p-3').items():
+        expected = single.trends('p-3')[metric]
+        assert [p['taken_at'] for p in points] == [p['taken_at'] for p in expected], metric
+        assert np.allclose([p['rolling_mean'] for p in points], [p['rolling_mean'] for p in expected])
+        assert [p['delta'] is None for p in points] == [p['delta'] is None for p in expected]
+
+
+def test_results_are_stored_and_re_rendered_without_the_model(tmp_path, monkeypatch):
+    monkeypatch.setenv('BLOODIQ_HISTORY_PATH', str(tmp_path / "history.sqlite"))
+    monkeypatch.setattr(gemini, '_model', StubModel())
+    client = create_app().test_client()
+    page = client.post('/results?stream=0', data=FORM).get_data(as_text=True)
+
+    history = client.get(f'/history/{issued_key(page)}').get_json()
+    assert [panel['glucose'] for panel in history['panels']] == [90]
+    assert history['trends']['biological_age'][0]['rolling_mean'] == history['panels'][0]['biological_age']
+
+    # Stored results are reached by their random token, linked from the results page; neither the
+    # sequential row id nor the token is in the history
+    assert not {'id', 'token', 'patient_id'} & set(history['panels'][0])
+    assert 'panel_id' not in history['trends']['glucose'][0]
+    token = re.search(r'href="/results/([^"]+)"', page).group(1)
+    assert len(token) >= 22 and client.get('/results/1').status_code == 404
+    monkeypatch.setattr(gemini, '_model', StubModel(fail_on='Patient'))
+    page = client.get(f'/results/{token}').get_data(as_text=True)
+    assert 'Stub response' in page and 'temporarily unavailable' not in page
+
+
+def test_panels_stored_before_tokens_get_one(tmp_path):
+    path = str(tmp_path / "history.sqlite")
+    store = HistoryStore(path)
+    add(store, 'p-1', 90, 1)
+    conn = sqlite3.connect(path)
+    conn.execute("DROP INDEX panels_token")
+    conn.execute("ALTER TABLE panels DROP COLUMN token")
+    conn.commit()
+    conn.close()
+
+    token = HistoryStore(path).panels('p-1')[0]['token']
+    assert token and HistoryStore(path).get_panel_by_token(token)['glucose'] == 90
+
+
+def test_history_needs_the_issued_patient_key(tmp_path, monkeypatch):
+    monkeypatch.setenv('BLOODIQ_HISTORY_PATH', str(tmp_path / "history.sqlite"))
+    monkeypatch.setattr(gemini, '_model', StubModel())
+    client = create_app().test_client()
+    key = issued_key(client.post('/results?stream=0', data=FORM).get_data(as_text=True))
+
+    # The typed-in name, a guessed key and a near miss get nothing back
+    for guess in (FORM['patient_id'], new_token(), key[:-1] + ('A' if key[-1] != 'A' else 'B')):
+        response = client.get(f'/history/{guess}')
+        assert response.status_code == 404 and 'panels' not in response.get_json()
+    assert len(client.get(f'/history/{key}').get_json()['panels']) == 1
+
+    # The same name again is a new patient with a key of its own
+    other = issued_key(client.post('/results?stream=0', data=FORM).get_data(as_text=True))
+    assert other != key and len(client.get(f'/history/{key}').get_json()['panels']) == 1
+
+
+def test_keys_are_stored_hashed_and_can_be_issued_for_imported_patients(tmp_path):
+    path = str(tmp_path / "history.sqlite")
+    store = HistoryStore(path)
+    add(store, 'imported-7', 90, 1)
+    assert store.patient_for_key('imported-7') is None
+
+    patient_id, key = store.issue_key(patient_id='imported-7')
+    assert patient_id == 'imported-7' and store.patient_for_key(key) == 'imported-7'
+    assert key not in str(sqlite3.connect(path).execute("SELECT * FROM patients").fetchall())
+
+    # Reissuing replaces the lost key
+    _, replacement = store.issue_key(patient_id='imported-7')
+    assert store.patient_for_key(key) is None and store.patient_for_key(replacement) == 'imported-7'
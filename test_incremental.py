@@ -0,0 +1,101 @@
+import re
+
+from app import create_app
+from utils import gemini
+from utils.incremental import plan_sections
+from utils.history_store import new_token
+from utils.llm_fanout import AI_SECTIONS
+from utils.prompt_builder import PROMPT_DEPENDENCIES, PROMPT_TEMPLATE_VERSION
+from utils.stub_model import StubModel
+
+USER = {'age': 40, 'sex': 'Male', 'height_cm': 180, 'weight_kg': 80, 'phenotypic_age': 38.2,
+        'biomarkers': {'albumin': 4.5, 'glucose': 90, 'crp': 1, 'lymph_pct': 30, 'mcv': 90, 'rdw': 13, 'wbc': 6,
+                       'alk_phos': 70, 'creatinine': 1}}
+TEXTS = {slot: f"previous {slot}" for slot in AI_SECTIONS}
+
+FORM = {'patient_id': 'p-1', 'age': '40', 'sex': 'Male', 'height': '180', 'weight': '80', 'albumin': '4.5',
+        'glucose': '90', 'crp': '1', 'lymph_pct': '30', 'mcv': '90', 'rdw': '13', 'wbc': '6', 'alk_phos': '70',
+        'creatinine': '1'}
+
+
+def edited(**changes):
+    user = dict(USER, biomarkers=dict(USER['biomarkers']))
+    for name, value in changes.items():
+        (user['biomarkers'] if name in user['biomarkers'] else user)[name] = value
+    return user
+
+
+def test_small_drift_reuses_every_section_and_a_status_flip_regenerates_its_dependents():
+    reused, pending = plan_sections(edited(glucose=89.5, weight_kg=80.5), USER, TEXTS)
+    assert reused == TEXTS and pending == {}
+
+    # Glucose 90 -> 105 leaves the 70-99 range: every section that reads glucose is regenerated
+    reused, pending = plan_sections(edited(glucose=105), USER, TEXTS)
+    assert set(pending) == {'analysis', 'meal_plan', 'exercise_plan', 'supplements', 'risks'}
+
+    # MCV is not an input of the meal plan
+    reused, pending = plan_sections(edited(mcv=101), USER, TEXTS)
+    assert reused == {'meal_plan': TEXTS['meal_plan']}
+
+    reused, pending = plan_sections(USER, USER, dict(TEXTS, risks=None))
+    assert pending == {'risks': AI_SECTIONS['risks']}
+
+
+def test_leaving_the_optimal_band_regenerates_its_dependents_within_one_bucket():
+    # Albumin 4.35 -> 4.25 g/dL stays in the normal range and in one bucket, but drops below optimal (4.3)
+    optimal = edited(albumin=4.35)
+    reused, pending = plan_sections(edited(albumin=4.25), optimal, TEXTS)
+    assert set(pending) == {slot for slot, prompt_type in AI_SECTIONS.items()
+                            if 'albumin' in PROMPT_DEPENDENCIES[prompt_type]['markers']}
+    assert pending and reused
+
+    reused, pending = plan_sections(edited(albumin=4.38), optimal, TEXTS)
+    assert reused == TEXTS
+
+
+def test_sections_from_an_older_prompt_template_are_not_reused():
+    reused, pending = plan_sections(USER, USER, TEXTS, previous_version=PROMPT_TEMPLATE_VERSION - 1)
+    assert reused == {} and pending == AI_SECTIONS
+    reused, pending = plan_sections(USER, USER, TEXTS, previous_version=None)
+    assert reused == {}
+
+
+def test_a_repeat_submission_only_calls_the_model_for_changed_sections(tmp_path, monkeypatch):
+    monkeypatch.setenv('BLOODIQ_HISTORY_PATH', str(tmp_path / "history.sqlite"))
+    monkeypatch.setenv('BLOODIQ_CACHE_PATH', '')
+    model = StubModel()
+    monkeypatch.setattr(gemini, '_model', model)
+    client = create_app().test_client()
+
+    page = client.post('/results?stream=0', data=FORM).get_data(as_text=True)
+    assert model.calls == len(AI_SECTIONS)
+    returning = dict(FORM, patient_id='', patient_key=re.search(r'<code>([^<]+)</code>', page).group(1))
+
+    client.post('/results?stream=0', data=dict(returning, crp='0.99', weight='80.5'))
+    assert model.calls == len(AI_SECTIONS)
+
+    page = client.post('/results?stream=1', data=dict(returning, mcv='101')).get_data(as_text=True)
+    assert model.calls == len(AI_SECTIONS) + 4
+    assert 'temporarily unavailable' not in page
+    assert len(client.get(f"/history/{returning['patient_key']}").get_json()['panels']) == 3
+    token = re.search(r'href="/results/([^"]+)"', page).group(1)
+    assert client.get(f'/results/{token}').status_code == 200
+
+
+def test_only_the_patient_key_holder_reuses_sections_or_joins_the_history(tmp_path, monkeypatch):
+    monkeypatch.setenv('BLOODIQ_HISTORY_PATH', str(tmp_path / "history.sqlite"))
+    monkeypatch.setenv('BLOODIQ_CACHE_PATH', '')
+    model = StubModel()
+    monkeypatch.setattr(gemini, '_model', model)
+    client = create_app().test_client()
+    key = re.search(r'<code>([^<]+)</code>', client.post('/results?stream=0', data=FORM).get_data(as_text=True))[1]
+
+    # The victim's name, their name as a key and a guessed key: every section is generated afresh, for
+    # edits small enough that the key holder would have reused them all (each new to the response cache)
+    for crp, guess in (('0.99', {}), ('0.98', {'patient_key': FORM['patient_id']}),
+                       ('0.97', {'patient_key': new_token()})):
+        calls = model.calls
+        page = client.post('/results?stream=0', data=dict(FORM, crp=crp, **guess)).get_data(as_text=True)
+        assert model.calls == calls + len(AI_SECTIONS)
+        assert ('not recognised' in page) == bool(guess)
+    assert len(client.get(f'/history/{key}').get_json()['panels']) == 1
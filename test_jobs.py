@@ -0,0 +1,78 @@
+import re
+
+from flask import Flask
+
+from app import create_app
+from utils import gemini
+from utils.jobs import DONE, FAILED, JobQueue, job_key
+from utils.llm_fanout import AI_SECTIONS
+from utils.stub_model import StubModel
+
+FORM = {'age': '40', 'sex': 'Male', 'height': '180', 'weight': '80', 'albumin': '4.5', 'glucose': '90', 'crp': '1',
+        'lymph_pct': '30', 'mcv': '90', 'rdw': '13', 'wbc': '6', 'alk_phos': '70', 'creatinine': '1'}
+
+
+def test_enqueue_is_idempotent_and_a_retry_resumes_from_reported_progress(tmp_path):
+    attempts = []
+
+    def handler(job):
+        attempts.append(dict(job.progress))
+        for part in job.payload['parts']:
+            if part not in job.progress:
+                if part == 'b' and job.attempt == 1:
+                    raise RuntimeError("flaky")
+                job.report({part: part.upper()})
+        return job.progress
+
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"), {'parts': handler}, workers=2, retry_delay=0.01)
+    payload = {'parts': ['a', 'b']}
+    job_id = queue.enqueue('parts', payload, key=job_key('parts', payload))
+    assert queue.enqueue('parts', payload, key=job_key('parts', payload)) == job_id
+
+    job = queue.wait(job_id, timeout=5)
+    assert job['status'] == DONE and job['attempts'] == 2 and job['result'] == {'a': 'A', 'b': 'B'}
+    assert attempts == [{}, {'a': 'A'}]
+    # A finished job is still the answer for its key; nothing is generated again
+    assert queue.enqueue('parts', payload, key=job_key('parts', payload)) == job_id
+    assert len(attempts) == 2 and queue.counts() == {DONE: 1}
+    queue.stop()
+
+
+def test_a_job_whose_worker_died_is_reclaimed_until_its_attempts_run_out():
+    queue = JobQueue(workers=0, max_attempts=2, lease=0)
+    job_id = queue.enqueue('report', {})
+
+    assert queue.claim().attempt == 1
+    # The lease expired without the job finishing, as if its worker had been killed
+    assert queue.claim().attempt == 2
+    assert queue.claim() is None
+    assert queue.get(job_id)['status'] == FAILED
+
+
+def test_queued_results_page_is_filled_in_by_polling_the_job(monkeypatch):
+    monkeypatch.setenv('BLOODIQ_QUEUE_RESULTS', '1')
+    model = StubModel(latency=0.05)
+    monkeypatch.setattr(gemini, '_model', model)
+    app = create_app()
+    client = app.test_client()
+
+    page = client.post('/results', data=FORM).get_data(as_text=True)
+    assert page.count('Generating insights') == len(AI_SECTIONS)
+    status_url = re.search(r'var url = "([^"]+)"', page).group(1)
+
+    job = app.extensions['jobs'].wait(status_url.rsplit('/', 1)[1], timeout=5)
+    assert job['status'] == DONE and model.calls == len(AI_SECTIONS)
+    sections = client.get(status_url + '?format=html').get_json()['sections']
+    assert set(sections) == set(AI_SECTIONS) and all('<strong>Stub response</strong>' in html for html in sections.values())
+
+
+def test_workers_share_the_default_queue_file(tmp_path, monkeypatch):
+    monkeypatch.delenv('BLOODIQ_JOBS_PATH')
+    monkeypatch.setenv('BLOODIQ_JOB_WORKERS', '0')
+    monkeypatch.setattr(Flask, 'auto_find_instance_path', lambda self: str(tmp_path / 'instance'))
+    app = create_app()
+    assert app.extensions['jobs'].path == str(tmp_path / 'instance' / 'jobs.sqlite')
+
+    # A poll landing on another worker finds the job
+    job_id = app.extensions['jobs'].enqueue('ai_sections', {'panel': 1})
+    assert create_app().test_client().get(f'/api/jobs/{job_id}').status_code == 200
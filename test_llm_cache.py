@@ -0,0 +1,83 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.llm_cache import ResponseCache, cache_key, generate_text, stream_text
+from utils.stub_model import StubModel
+
+
+def test_key_ignores_whitespace_noise_but_not_content():
+    key = cache_key("Panel:\n- glucose: 90\n", "models/stub", "analysis")
+    assert key == cache_key("  Panel:  \n- glucose: 90", "models/stub", "analysis")
+    assert key != cache_key("Panel:\n- glucose: 91", "models/stub", "analysis")
+    assert key != cache_key("Panel:\n- glucose: 90", "models/stub", "meal_plan")
+    assert key != cache_key("Panel:\n- glucose: 90", "models/other", "analysis")
+
+
+def test_repeat_prompt_is_served_from_cache():
+    model = StubModel()
+    cache = ResponseCache()
+    first = generate_text(model, "prompt", "analysis", cache)
+    second = generate_text(model, "prompt", "analysis", cache)
+
+    assert first == second
+    assert model.calls == 1
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_lru_and_ttl_evictions_are_counted():
+    cache = ResponseCache(maxsize=2, ttl=0.05)
+    for i in range(3):
+        cache.set(cache.key(f"prompt {i}", "m", "analysis"), f"text {i}")
+    assert cache.stats()['evictions'] == 1
+
+    time.sleep(0.1)
+    assert cache.get(cache.key("prompt 2", "m", "analysis")) is None
+    assert cache.stats()['evictions'] == 3
+
+
+def test_shared_backend_is_visible_to_other_processes_caches(tmp_path):
+    path = str(tmp_path / "llm_cache.sqlite")
+    writer = ResponseCache(path=path)
+    reader = ResponseCache(path=path)
+    key = writer.key("prompt", "m", "analysis")
+    writer.set(key, "shared text")
+
+    assert reader.get(key) == "shared text"
+    assert reader.stats()['shared_hits'] == 1
+
+
+def test_invalidate_by_template_version(tmp_path):
+    path = str(tmp_path / "llm_cache.sqlite")
+    old = ResponseCache(path=path, version=1)
+    key = old.key("prompt", "m", "analysis")
+    old.set(key, "stale text")
+
+    assert old.invalidate_version(1) == 2
+    assert old.get(key) is None
+    assert ResponseCache(path=path, version=2).key("prompt", "m", "analysis") != key
+
+
+def test_concurrent_identical_prompts_share_one_upstream_call():
+    model = StubModel(latency=0.2)
+    cache = ResponseCache()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        texts = list(pool.map(lambda _: generate_text(model, "prompt", "analysis", cache), range(8)))
+
+    assert len(set(texts)) == 1
+    assert model.calls == 1
+    assert cache.stats()['upstream_calls'] == 1
+    assert cache.stats()['coalesced'] == 7
+
+
+def test_workers_wait_on_the_lease_holder_instead_of_calling_upstream(tmp_path):
+    # Two ResponseCaches on one file stand in for two gunicorn workers
+    path = str(tmp_path / "llm_cache.sqlite")
+    model = StubModel(latency=0.3)
+    workers = [ResponseCache(path=path), ResponseCache(path=path)]
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        texts = list(pool.map(lambda cache: ''.join(stream_text(model, "prompt", "analysis", cache)), workers))
+
+    assert texts[0] == texts[1]
+    assert model.calls == 1
+    assert sum(cache.stats()['shared_coalesced'] for cache in workers) == 1
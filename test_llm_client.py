@@ -0,0 +1,78 @@
+import threading
+import time
+
+import pytest
+
+from utils.llm_client import BATCH, INTERACTIVE, CircuitBreaker, CircuitOpenError, LLMClient, TokenBucket
+from utils.stub_model import StubModel
+
+
+class UpstreamError(Exception):
+    def __init__(self, code):
+        super().__init__(f"upstream error {code}")
+        self.code = code
+
+
+class FlakyModel(StubModel):
+    """Raises `code` for the first `failures` calls, then answers normally"""
+
+    def __init__(self, failures, code=429):
+        super().__init__(model_name='models/flaky')
+        self.failures = failures
+        self.code = code
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        if self.calls < self.failures:
+            with self._lock:
+                self.calls += 1
+            raise UpstreamError(self.code)
+        return super().generate_content(prompt, stream, **kwargs)
+
+
+def test_rate_limited_calls_are_retried_with_backoff():
+    model = FlakyModel(failures=2)
+    client = LLMClient(model, max_retries=3, base_delay=0.01)
+
+    assert client.generate_content("prompt").text.startswith("**Stub response**")
+    assert ''.join(chunk.text for chunk in LLMClient(FlakyModel(failures=1), base_delay=0.01)
+                   .generate_content("prompt", stream=True))
+    assert model.calls == 3
+    assert client.model_name == 'models/flaky'
+
+
+def test_interactive_callers_overtake_waiting_batch_callers():
+    bucket = TokenBucket(rpm=240, tpm=0)  # one request every 0.25s once drained
+    for _ in range(240):
+        bucket.acquire(1)
+
+    order = []
+
+    def take(priority):
+        bucket.acquire(1, priority)
+        order.append(priority)
+
+    batch = threading.Thread(target=take, args=(BATCH,))
+    batch.start()
+    time.sleep(0.05)
+    interactive = threading.Thread(target=take, args=(INTERACTIVE,))
+    interactive.start()
+    batch.join()
+    interactive.join()
+
+    assert order == [INTERACTIVE, BATCH]
+
+
+def test_open_circuit_fails_fast_then_recovers():
+    model = FlakyModel(failures=2, code=503)
+    client = LLMClient(model, max_retries=0, breaker=CircuitBreaker(threshold=2, cooldown=0.1))
+    for _ in range(2):
+        with pytest.raises(UpstreamError):
+            client.generate_content("prompt")
+
+    with pytest.raises(CircuitOpenError):
+        client.generate_content("prompt")
+    assert model.calls == 2
+
+    time.sleep(0.15)
+    client.generate_content("prompt")  # trial call succeeds and closes the breaker
+    assert not client.breaker.is_open
@@ -0,0 +1,50 @@
+import json
+
+from benchmarks.bench_fanout import SAMPLE_USER
+from utils.llm_cache import ResponseCache
+from utils.llm_combined import generate_combined, parse_sections
+from utils.llm_fanout import AI_SECTIONS
+from utils.stub_model import StubModel
+
+
+class TruncatingModel(StubModel):
+    """Cuts combined (JSON) responses off partway through the third field"""
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        response = super().generate_content(prompt, stream, **kwargs)
+        if 'generation_config' in kwargs:
+            text = response.text
+            response.text = text[:text.index('"exercise_plan"') + 30]
+        return response
+
+
+def test_combined_mode_fills_every_section_in_one_call():
+    model = StubModel()
+    sections = generate_combined(model, SAMPLE_USER)
+
+    assert model.calls == 1
+    assert list(sections) == list(AI_SECTIONS)
+    assert all(text.startswith(f"**Stub {slot}**") for slot, text in sections.items())
+
+
+def test_truncated_response_keeps_complete_fields_and_regenerates_the_rest():
+    model = TruncatingModel()
+    cache = ResponseCache()
+    sections = generate_combined(model, SAMPLE_USER, cache=cache)
+
+    assert sections['analysis'].startswith("**Stub analysis**")
+    assert sections['meal_plan'].startswith("**Stub meal_plan**")
+    assert all(sections[slot].startswith("**Stub response**") for slot in ('exercise_plan', 'supplements', 'risks'))
+    assert model.calls == 4
+
+    # The incomplete combined response was not cached, so the next request retries it
+    generate_combined(model, SAMPLE_USER, cache=cache)
+    assert model.calls == 5
+
+
+def test_parse_tolerates_fences_and_rejects_non_string_fields():
+    text = "```json\n" + json.dumps({'analysis': ' ok ', 'meal_plan': 3, 'risks': ''}) + "\n```"
+    parsed = parse_sections(text)
+    assert parsed == {'analysis': 'ok', 'meal_plan': None, 'exercise_plan': None, 'supplements': None,
+                      'risks': None}
+    assert parse_sections("not json at all") == dict.fromkeys(AI_SECTIONS)
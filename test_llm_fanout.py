@@ -0,0 +1,56 @@
+import time
+
+from benchmarks.bench_fanout import SAMPLE_USER
+from utils.llm_fanout import AI_SECTIONS, generate_sections, iter_section_events
+from utils.stub_model import StubModel
+
+
+def test_sections_run_concurrently():
+    model = StubModel(latency=0.2)
+    start = time.perf_counter()
+    sections = generate_sections(model, SAMPLE_USER)
+    elapsed = time.perf_counter() - start
+
+    assert list(sections) == list(AI_SECTIONS)
+    assert all(sections.values())
+    assert model.calls == len(AI_SECTIONS)
+    assert elapsed < 0.2 * 3
+
+
+def test_failed_section_degrades_alone():
+    model = StubModel(latency=0.01, fail_on='nutrition expert')
+    sections = generate_sections(model, SAMPLE_USER)
+
+    assert sections['meal_plan'] is None
+    assert all(text for slot, text in sections.items() if slot != 'meal_plan')
+
+
+def test_slow_section_misses_deadline():
+    model = StubModel(latency=lambda prompt: 1.0 if 'fitness expert' in prompt else 0.01)
+    start = time.perf_counter()
+    sections = generate_sections(model, SAMPLE_USER, section_timeout=0.3)
+
+    assert time.perf_counter() - start < 0.8
+    assert sections['exercise_plan'] is None
+    assert sections['analysis']
+
+
+def test_request_deadline_bounds_every_section():
+    model = StubModel(latency=1.0)
+    start = time.perf_counter()
+    sections = generate_sections(model, SAMPLE_USER, section_timeout=5, request_timeout=0.2)
+
+    assert time.perf_counter() - start < 0.6
+    assert not any(sections.values())
+
+
+def test_stream_events_end_each_section_once():
+    model = StubModel(latency=0.01, fail_on='preventive health')
+    events = list(iter_section_events(model, SAMPLE_USER, stream_tokens=True))
+
+    finished = [slot for slot, kind, _ in events if kind in ('done', 'error')]
+    assert sorted(finished) == sorted(AI_SECTIONS)
+    for slot in AI_SECTIONS:
+        kinds = [kind for event_slot, kind, _ in events if event_slot == slot]
+        assert kinds[-1] == ('error' if slot == 'risks' else 'done')
+        assert kinds[:-1] == (['chunk'] if slot != 'risks' else [])
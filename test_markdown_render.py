@@ -0,0 +1,25 @@
+import markdown2
+
+from benchmarks.bench_markdown import sample_section
+from utils.llm_cache import SQLiteBackend
+from utils.markdown_render import EXTRAS, MarkdownRenderer, _prepare
+
+
+def test_memoized_html_matches_a_fresh_conversion_and_stays_bounded():
+    renderer = MarkdownRenderer(max_bytes=20000)
+    texts = [sample_section(3000, seed) for seed in range(10)]
+    for text in texts + texts[-1:]:
+        assert renderer.render(text) == markdown2.markdown(_prepare(text), extras=list(EXTRAS))
+
+    assert renderer.stats() == {'hits': 1, 'shared_hits': 0, 'renders': 10}
+    assert renderer._memo.currsize <= 20000
+
+
+def test_other_workers_reuse_html_from_the_shared_file(tmp_path):
+    shared = SQLiteBackend(str(tmp_path / "llm_cache.sqlite"))
+    text = sample_section(2048)
+    html = MarkdownRenderer(shared=shared).render(text)
+
+    other_worker = MarkdownRenderer(shared=shared)
+    assert other_worker.render(text) == html
+    assert other_worker.stats()['shared_hits'] == 1
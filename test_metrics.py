@@ -0,0 +1,43 @@
+import json
+import logging
+
+from prometheus_client import REGISTRY
+
+from utils.llm_cache import ResponseCache, generate_text
+from utils.metrics import Trace, render_metrics
+from utils.stub_model import StubModel
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_llm_calls_record_tokens_and_cache_outcomes():
+    before_tokens = sample('bloodiq_llm_tokens_total', prompt_type='metrics_test', direction='prompt')
+    before_hits = sample('bloodiq_llm_cache_events_total', event='hits')
+
+    cache = ResponseCache()
+    for _ in range(2):
+        generate_text(StubModel(), "x" * 400, "metrics_test", cache)
+
+    assert sample('bloodiq_llm_tokens_total', prompt_type='metrics_test', direction='prompt') == before_tokens + 100
+    assert sample('bloodiq_llm_call_seconds_count', prompt_type='metrics_test', outcome='ok') >= 1
+    assert sample('bloodiq_llm_cache_events_total', event='hits') == before_hits + 1
+    assert b'bloodiq_stage_seconds' in render_metrics()[0]
+
+
+def test_only_sampled_traces_are_logged(caplog):
+    caplog.set_level(logging.INFO, logger='bloodiq.trace')
+    for sampled in (False, True):
+        trace = Trace('metrics_test', sampled=sampled)
+        with trace.stage('parse_form'):
+            pass
+        trace.add('ai_analysis', 0.25)
+        trace.add('ai_analysis', 0.25)
+        trace.finish(streamed=False)
+
+    assert len(caplog.records) == 1
+    line = json.loads(caplog.records[0].getMessage())
+    assert line['route'] == 'metrics_test' and line['streamed'] is False
+    assert line['stages_ms']['ai_analysis'] == 500.0
+    assert sample('bloodiq_stage_seconds_count', route='metrics_test', stage='total') == 2
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from app import build_marker_insights, create_app
+from benchmarks.bench_biological_age import synthetic_panels
+from utils.biological_age import calculate_biological_age
+from utils.bulk_ingest import chunk_matrix, process_chunk
+from utils.health_analysis import analyze_health
+from utils.panel import PANEL_COLUMNS, Panel, PanelError, parse_panel
+
+FORM = {'age': '40', 'sex': 'Male', 'height': '180', 'weight': '80', 'albumin': '4.5', 'glucose': '90',
+        'crp': '1', 'lymph_pct': '30', 'mcv': '90', 'rdw': '13', 'wbc': '6', 'alk_phos': '70', 'creatinine': '1'}
+
+
+def test_form_json_and_si_units_parse_to_the_same_panel():
+    form = parse_panel(FORM)
+    assert form['glucose'] == 90.0 and form.height_cm == 180.0 and not form.missing.any()
+
+    body = {'age': 40, 'sex': 'Male', 'height_cm': 180, 'weight_kg': 80,
+            'units': {'glucose': 'mmol/L', 'creatinine': 'umol/L', 'albumin': 'g/L'},
+            'biomarkers': dict(FORM, glucose=90 / 18.016, creatinine=88.42, albumin=45)}
+    assert np.allclose(parse_panel(body).values, form.values)
+
+    partial = parse_panel(dict(FORM, crp='', mcv=None))
+    assert list(np.array(PANEL_COLUMNS)[partial.missing]) == ['crp', 'mcv']
+    assert 'crp' not in partial and partial.get('crp') is None and len(partial) == len(PANEL_COLUMNS) - 2
+
+    with pytest.raises(PanelError) as error:
+        parse_panel(dict(FORM, age='', glucose='high', crp='-1', glucose_unit='mmol/L', wbc_unit='cells'))
+    assert set(error.value.errors) == {'age', 'glucose', 'crp', 'wbc_unit'}
+
+
+def test_panel_gives_the_same_results_as_the_dict_it_was_parsed_from():
+    columns = synthetic_panels(200, seed=6)
+    for i in range(200):
+        record = {column: columns[column][i] for column in PANEL_COLUMNS}
+        panel = Panel([record[column] for column in PANEL_COLUMNS])
+        assert calculate_biological_age(panel) == calculate_biological_age(record)
+        assert analyze_health(panel) == analyze_health(record)
+        assert build_marker_insights(panel) == build_marker_insights(record)
+
+
+def test_bulk_rows_with_unit_columns_are_normalized():
+    rows = [dict(FORM, glucose_unit=''), dict(FORM, glucose='4.995', glucose_unit='mmol/L'), dict(FORM, glucose_unit='mg/dL'),
+            dict(FORM, glucose='5', glucose_unit='mmol/mol')]
+    results = process_chunk(rows)
+    assert results[0] == dict(results[1], row=0) == dict(results[2], row=0)
+    assert results[3]['glucose_status'] == 'missing'
+    matrix = chunk_matrix(rows)
+    assert np.allclose(matrix[:3], parse_panel(FORM).values, atol=0.02) and np.isnan(matrix[3, PANEL_COLUMNS.index('glucose')])
+
+
+def test_invalid_form_is_rejected_with_the_bad_fields():
+    response = create_app().test_client().post('/results', data=dict(FORM, glucose='abc'))
+    assert response.status_code == 400 and 'glucose' in response.get_data(as_text=True)
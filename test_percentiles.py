@@ -0,0 +1,108 @@
+import csv
+
+import numpy as np
+
+from app import create_app
+from benchmarks.bench_biological_age import synthetic_panels
+from utils.history_store import HistoryStore
+from utils.panel import PANEL_COLUMNS, parse_panel
+from utils.percentiles import METRICS, PercentileIndex, build, cohort_chunks, update_from_history
+
+PANEL = {'age': 45, 'sex': 'Female', 'albumin': 4.5, 'glucose': 90, 'crp': 1, 'lymph_pct': 30, 'mcv': 90, 'rdw': 13,
+         'wbc': 6, 'alk_phos': 70, 'creatinine': 1}
+
+
+def write_cohort(path, rows, seed):
+    columns = synthetic_panels(rows, seed=seed)
+    columns['age'] = np.where(np.arange(rows) % 2, 45, 72).astype(np.float64)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(('sex',) + PANEL_COLUMNS)
+        for i in range(rows):
+            # Men are all 45 and women all 72, so a 45-year-old woman or anyone of 25 needs a wider group
+            sex = 'M' if i % 2 else ('F' if i % 10 == 0 else 'female')
+            writer.writerow([sex] + [columns[column][i] for column in PANEL_COLUMNS])
+    return columns
+
+
+def test_percentiles_match_the_cohort_and_small_groups_fall_back(tmp_path):
+    columns = write_cohort(tmp_path / "cohort.csv", 1000, seed=5)
+    index = build(cohort_chunks(str(tmp_path / "cohort.csv"), chunk_size=300), str(tmp_path / "index"))
+    assert index.rows == 1000 and index.manifest['groups']['female|70-79'] == 500
+
+    women = columns['glucose'][np.arange(1000) % 2 == 0].astype(np.float32)
+    percentiles = index.panel_percentiles(parse_panel(dict(PANEL, age=75, glucose=women[7])))
+    expected = ((women < women[7]).sum() + (women <= women[7]).sum()) * 50 / len(women)
+    assert percentiles['peer_group'] == 'female|70-79' and percentiles['glucose'] == round(expected, 1)
+    assert percentiles['biological_age'] is None and percentiles['peer_label'] == 'women aged 70-79'
+
+    assert index.panel_percentiles(parse_panel(dict(PANEL, age=45)))['peer_group'] == 'all|40-49'
+    assert index.panel_percentiles(parse_panel(dict(PANEL, age=25, sex='Male')))['peer_group'] == 'all|all'
+
+    # A panel at the cohort's extremes sits at the ends of the scale
+    lowest = index.panel_percentiles(parse_panel(dict(PANEL, age=75, glucose=0)))
+    assert lowest['glucose'] == 0.0
+
+
+def test_incremental_update_from_history_equals_a_full_build(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.sqlite"))
+    columns = synthetic_panels(400, seed=6)
+    columns['patient_id'] = np.array([f"p-{i % 9}" for i in range(400)])
+    columns['taken_at'] = np.arange(400, dtype=np.float64)
+    store.add_panels({name: column[:250] for name, column in columns.items()})
+
+    path = str(tmp_path / "index")
+    first = update_from_history(path, store)
+    assert first.rows == 250 and first.manifest['history_through'] == 250
+    store.add_panels({name: column[250:] for name, column in columns.items()})
+    updated = update_from_history(path, store)
+    assert updated.rows == 400 and update_from_history(path, store).manifest == updated.manifest
+
+    full = update_from_history(str(tmp_path / "full"), store)
+    for key in full.manifest['segments']:
+        metric, group = key.split('|', 1)
+        assert np.array_equal(updated.segment(metric, group), full.segment(metric, group))
+
+
+def test_a_reload_during_a_lookup_does_not_mix_index_versions(tmp_path):
+    write_cohort(tmp_path / "old.csv", 1000, seed=5)
+    write_cohort(tmp_path / "new.csv", 600, seed=8)
+    old = build(cohort_chunks(str(tmp_path / "old.csv")), str(tmp_path / "old"))
+    new = build(cohort_chunks(str(tmp_path / "new.csv")), str(tmp_path / "new"))
+    panels = np.array([parse_panel(dict(PANEL, age=age)).values for age in (45, 75)])
+    expected = old.lookup(panels, [40.0, 70.0], ['M', 'F'])
+
+    # Swap in the other index right after the lookup resolves its first peer group
+    peer_group = old.peer_group
+
+    def reloading_peer_group(*args):
+        group = peer_group(*args)
+        old._snapshot = new._snapshot
+        return group
+
+    old.peer_group = reloading_peer_group
+    percentiles, groups = old.lookup(panels, [40.0, 70.0], ['M', 'F'])
+    assert groups == expected[1] and np.array_equal(percentiles, expected[0], equal_nan=True)
+    assert old.manifest is new.manifest
+
+
+def test_api_and_results_page_report_percentiles(tmp_path, monkeypatch):
+    write_cohort(tmp_path / "cohort.csv", 1000, seed=7)
+    build(cohort_chunks(str(tmp_path / "cohort.csv")), str(tmp_path / "index"))
+    monkeypatch.setenv('BLOODIQ_PERCENTILE_INDEX', str(tmp_path / "index"))
+    client = create_app().test_client()
+
+    body = client.post('/api/analyze/batch', json={'panels': [dict(PANEL, age=72), {'age': 30}]}).get_json()
+    first, second = body['results']
+    assert first['peer_group'] == 'female|70-79' and set(first['percentiles']) == set(METRICS)
+    assert all(0 <= p <= 100 for p in first['percentiles'].values())
+    assert second['peer_group'] == 'all|all' and set(second['percentiles'].values()) == {None}
+
+    index = PercentileIndex(str(tmp_path / "index"))
+    single = client.post('/api/analyze', json=dict(PANEL, age=72)).get_json()
+    assert single['percentiles'] == first['percentiles']
+    assert single['percentiles']['glucose'] == index.panel_percentiles(parse_panel(dict(PANEL, age=72)))['glucose']
+
+    form = {key: str(value) for key, value in dict(PANEL, age=72, height=170, weight=60).items()}
+    page = client.post('/results?ai_mode=rules', data=form).get_data(as_text=True)
+    assert 'among women aged 70-79' in page
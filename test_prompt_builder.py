@@ -0,0 +1,60 @@
+from utils import prompt_builder
+from utils.llm_combined import response_config
+from utils.llm_fanout import AI_SECTIONS, generate_sections
+from utils.panel import parse_panel, user_data_for
+from utils.prompt_builder import generate_combined_prompt, generate_prompt, generation_config
+from utils.stub_model import StubModel
+
+FORM = {'age': '45', 'sex': 'Male', 'height': '178', 'weight': '82', 'albumin': '4.2', 'glucose': '104', 'crp': '',
+        'lymph_pct': '28', 'mcv': '91', 'rdw': '16.5', 'wbc': '6.4', 'alk_phos': '80', 'creatinine': '1.0'}
+
+
+def user_data(**form):
+    return user_data_for(parse_panel(dict(FORM, **form)), 47.3)
+
+
+def test_prompt_lists_present_markers_with_status_most_urgent_first():
+    prompt = generate_prompt(user_data(), 'analysis')
+    assert 'crp' not in prompt and ': \n' not in prompt
+    assert prompt.index('- rdw 16.5 % HIGH (normal 11.5-14.5)') < prompt.index('- glucose 104 mg/dL HIGH (normal 70-99)') \
+        < prompt.index('- albumin 4.2 g/dL normal, below optimal 4.3-5.2')
+    assert 'Optimal: lymph_pct 28 %, mcv 91 fL, wbc 6.4 K/µL, alk_phos 80 U/L, creatinine 1 mg/dL' in prompt
+    assert 'Patient: 45 y (biological 47.3), Male, 178 cm, 82 kg' in prompt
+
+
+def test_budget_condenses_optimal_markers_but_never_flagged_ones(monkeypatch):
+    data = user_data()
+    monkeypatch.setitem(prompt_builder.PROMPT_TOKEN_BUDGETS, 'meal_plan', 1)
+    prompt = generate_prompt(data, 'meal_plan')
+    assert '- rdw 16.5 % HIGH' in prompt and '- glucose 104 mg/dL HIGH' in prompt
+    assert '- albumin 4.2 g/dL normal, below optimal 4.3-5.2' in prompt and 'Optimal:' not in prompt
+    # Markers the meal plan depends on come before the ones it does not, in the condensed line too
+    assert 'Also optimal: alk_phos, creatinine, lymph_pct, mcv, wbc' in prompt
+
+    full = len(generate_prompt(data, 'analysis'))
+    monkeypatch.setitem(prompt_builder.PROMPT_TOKEN_BUDGETS, 'analysis', full // 4 - 5)
+    prompt = generate_prompt(data, 'analysis')
+    assert len(prompt) // 4 <= full // 4 - 5 and '4.2 g/dL' in prompt
+    assert 'Also optimal: lymph_pct, mcv, wbc, alk_phos, creatinine' in prompt
+
+
+def test_default_budgets_keep_every_marker_the_instructions_target():
+    # Normal but above optimal: the meal plan is told to target it, so its value must stay
+    for prompt_type in prompt_builder.PROMPT_TEMPLATES:
+        prompt = generate_prompt(user_data(glucose='95', rdw='13'), prompt_type)
+        assert '- glucose 95 mg/dL normal, above optimal 70-90' in prompt
+        assert '- albumin 4.2 g/dL normal, below optimal 4.3-5.2' in prompt
+
+
+def test_output_cap_reaches_the_model_and_the_prompt(monkeypatch):
+    monkeypatch.setitem(prompt_builder.OUTPUT_TOKEN_LIMITS, 'analysis', 100)
+    monkeypatch.setitem(prompt_builder.OUTPUT_TOKEN_LIMITS, 'meal_plan', 200)
+    assert generation_config('analysis') == {'max_output_tokens': 100} and generation_config('risk_assessment') is None
+    assert 'Keep it under 70 words.' in generate_prompt(user_data(), 'analysis')
+    assert response_config({'analysis': 'analysis', 'meal_plan': 'meal_plan'})['max_output_tokens'] == 300
+    assert 'max_output_tokens' not in response_config(AI_SECTIONS)
+
+    model = StubModel(answer_tokens=500)
+    generate_sections(model, user_data(), {'analysis': 'analysis', 'risks': 'risk_assessment'})
+    assert model.output_tokens == 100 + 500
+    assert generate_combined_prompt(user_data(), AI_SECTIONS).count('- rdw 16.5 % HIGH') == 1
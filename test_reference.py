@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from benchmarks.bench_biological_age import synthetic_panels
+from utils.biological_age import PANEL_COLUMNS
+from utils.health_analysis import analyze_health, analyze_health_batch
+from utils.reference import HEALTH_STATUS_NAMES, MISSING, REFERENCE
+
+
+def test_registry_columns_are_read_only():
+    with pytest.raises(ValueError):
+        REFERENCE.high[0] = 0
+
+
+def test_batch_classification_matches_analyze_health():
+    columns = synthetic_panels(500, seed=2)
+    columns['crp'][::7] = np.nan
+    statuses, scores = analyze_health_batch(columns)
+
+    for i in range(500):
+        panel = {column: columns[column][i] for column in PANEL_COLUMNS}
+        single = analyze_health(panel, biological_age=None)
+        for j, marker in enumerate(REFERENCE.markers):
+            expected = single['marker_analysis'].get(marker)
+            assert (statuses[i, j] == MISSING) if expected is None else \
+                HEALTH_STATUS_NAMES[statuses[i, j]] == expected['status']
+        assert scores[i] == single['overall_health_score']
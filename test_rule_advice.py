@@ -0,0 +1,43 @@
+from app import create_app
+from utils import gemini
+from utils.llm_fanout import AI_SECTIONS
+from utils.panel import parse_panel, user_data_for
+from utils.rule_advice import FALLBACK_LEAD, RULES, HIGH, rule_sections, rule_sections_html
+from utils.stub_model import StubModel
+
+FORM = {'age': '45', 'sex': 'Male', 'height': '178', 'weight': '82', 'albumin': '4.2', 'glucose': '126', 'crp': '4',
+        'lymph_pct': '28', 'mcv': '91', 'rdw': '13', 'wbc': '6.4', 'creatinine': '1.0'}
+
+
+def test_rules_put_out_of_range_markers_first_and_list_what_was_not_measured():
+    user_data = user_data_for(parse_panel(FORM), 49.2)
+    sections = rule_sections(user_data)
+    assert set(sections) == set(AI_SECTIONS) and sections == rule_sections(user_data)
+
+    analysis = sections['analysis']
+    assert "4.2 years older than your chronological age of 45" in analysis
+    assert analysis.index("Glucose 126 mg/dL") < analysis.index("In range but not optimal") < analysis.index("Albumin 4.2")
+    assert "### Not measured\n\n- Alkaline phosphatase" in analysis
+    # Glucose (outside the range) leads the meal plan; albumin (short of optimal) follows
+    meal_plan = sections['meal_plan'].split('\n')
+    assert meal_plan[2] == f"- {RULES[('glucose', HIGH)]['meal_plan']}"
+    assert "Your biological age is ahead" in sections['exercise_plan']
+
+    html = rule_sections_html(user_data, {'risks': 'risk_assessment'}, lead=FALLBACK_LEAD)['risks']
+    assert html.startswith('<p><em>AI insights temporarily unavailable') and '<li>Sustained high glucose' in html
+
+
+def test_rules_mode_makes_no_llm_call_and_failed_sections_fall_back_to_rules(monkeypatch):
+    model = StubModel(fail_on='meal plan')
+    monkeypatch.setattr(gemini, '_model', model)
+    client = create_app().test_client()
+
+    page = client.post('/results?ai_mode=rules', data=FORM).get_data(as_text=True)
+    assert model.calls == 0 and RULES[('crp', HIGH)]['supplement_advice'] in page and FALLBACK_LEAD not in page
+
+    page = client.post('/results?stream=0', data=FORM).get_data(as_text=True)
+    assert model.calls == len(AI_SECTIONS) and page.count(FALLBACK_LEAD) == 1
+    assert RULES[('glucose', HIGH)]['meal_plan'] in page
+
+    body = client.post('/api/analyze', json=dict(FORM, ai='rules')).get_json()
+    assert body['sections'] == rule_sections(user_data_for(parse_panel(FORM), body['biological_age']))
@@ -0,0 +1,30 @@
+import os
+import runpy
+
+import pytest
+
+
+def load_config(monkeypatch, **env):
+    # setenv first so monkeypatch restores whatever the config's setdefault leaves behind
+    monkeypatch.setenv('BLOODIQ_LLM_WORKERS', '')
+    monkeypatch.delenv('BLOODIQ_LLM_WORKERS')
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    return runpy.run_path('gunicorn.conf.py')
+
+
+def test_default_mode_is_threaded_wsgi(monkeypatch):
+    config = load_config(monkeypatch)
+    assert config['worker_class'] == 'gthread'
+    assert config['threads'] >= 64
+
+
+def test_llm_pool_covers_every_in_flight_section(monkeypatch):
+    # gevent mode is not loaded here: its config monkey-patches the whole test process
+    load_config(monkeypatch, BLOODIQ_SERVER_MODE='gthread', BLOODIQ_THREADS='100')
+    assert os.environ['BLOODIQ_LLM_WORKERS'] == '500'
+
+
+def test_unknown_mode_is_rejected(monkeypatch):
+    with pytest.raises(RuntimeError):
+        load_config(monkeypatch, BLOODIQ_SERVER_MODE='uvicorn')
@@ -0,0 +1,22 @@
+import sqlite3
+import threading
+
+from utils.sqlite_connections import ThreadConnections
+
+
+def test_one_wal_connection_per_thread_reopened_after_a_fork(tmp_path, monkeypatch):
+    connections = ThreadConnections(str(tmp_path / "store.sqlite"), row_factory=sqlite3.Row)
+    conn = connections.connection()
+    assert connections.connection() is conn
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+    assert isinstance(conn.execute("SELECT 1 AS one").fetchone(), sqlite3.Row)
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(connections.connection()))
+    thread.start()
+    thread.join()
+    assert other[0] is not conn
+
+    # A forked worker sees its parent's thread-local but must not reuse the parent's connection
+    monkeypatch.setattr('os.getpid', lambda: -1)
+    assert connections.connection() is not conn
@@ -0,0 +1,47 @@
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+from utils import gemini
+from utils.stub_model import StubModel
+
+# Cumulative `import app` budget in microseconds; google-generativeai alone costs ~0.7s
+IMPORT_BUDGET_US = 600_000
+
+
+def import_times(module):
+    """{module: cumulative µs} from `python -X importtime -c "import <module>"` without an API key"""
+    env = {name: value for name, value in os.environ.items() if name != 'GEMINI_API_KEY'}
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, env=env, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        match = re.match(r'import time:\s+\d+ \|\s+(\d+) \|(\s*)(\S+)', line)
+        if match:
+            times[match.group(3)] = int(match.group(1))
+    return times
+
+
+def test_app_import_skips_gemini_sdk_and_stays_in_budget():
+    times = import_times('app')
+    assert not [name for name in times if name.startswith(('google.generativeai', 'grpc'))]
+    assert times['app'] < IMPORT_BUDGET_US
+
+
+def test_scoring_modules_import_without_flask():
+    times = import_times('utils.health_analysis')
+    assert 'flask' not in times and 'google.generativeai' not in times
+
+
+def test_model_requires_api_key_until_one_is_installed(monkeypatch):
+    monkeypatch.delenv('GEMINI_API_KEY', raising=False)
+    monkeypatch.setattr(gemini, '_model', None)
+    with pytest.raises(RuntimeError):
+        gemini.get_model()
+
+    stub = StubModel()
+    gemini.set_model(stub)
+    assert gemini.get_model() is stub
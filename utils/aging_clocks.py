@@ -0,0 +1,161 @@
+"""
+Registry of aging clocks scored together in one pass. A panel (or an N-panel matrix) is wrapped
+once in ClockInputs, whose intermediates (the incomplete-row mask, health statuses, the matrix in
+PhenoAge's units) are computed on first use and shared by every clock, which are then masked and
+rounded together, so another registered clock costs only its own arithmetic. For a single panel,
+where NumPy's per-call overhead outweighs the arithmetic, a clock may also register a scalar form
+over the panel's Python floats; clocks without one are scored as a batch of one.
+"""
+import math
+from collections import namedtuple
+from functools import cached_property
+
+import numpy as np
+
+from utils.biological_age import _round_half_even_like_python, _score, calculate_biological_age_batch, panel_matrix
+from utils.panel import PANEL_COLUMNS
+from utils.phenotypic_age import COEFFICIENTS, CRP_FLOOR_MG_DL, INTERCEPT, phenotypic_age_from_predictor
+from utils.reference import NORMAL, OPTIMAL, OUTSIDE_RANGE, REFERENCE
+
+AgingClock = namedtuple('AgingClock', 'name label score scalar', defaults=(None,))
+
+# name -> AgingClock, in registration (and display) order
+CLOCKS = {}
+
+# The clock reported as "biological age" everywhere (history, percentiles, prompts)
+PRIMARY_CLOCK = 'deviation'
+
+# Factors from utils.reference units to PhenoAge's model units, per PANEL_COLUMNS column; CRP is
+# converted to mg/dL here and its log taken afterwards
+_MODEL_UNIT_FACTORS = np.array([{
+    'albumin': 10,  # g/dL -> g/L
+    'creatinine': 88.42,  # mg/dL -> µmol/L
+    'glucose': 1 / 18.016,  # mg/dL -> mmol/L
+    'crp': 0.1,  # mg/L -> mg/dL
+}.get(column, 1) for column in PANEL_COLUMNS])
+_CRP = PANEL_COLUMNS.index('crp')
+_PHENOAGE_COEFFICIENTS = np.array([COEFFICIENTS['log_crp' if column == 'crp' else column] for column in PANEL_COLUMNS])
+
+# The same constants as Python floats, for the scalar forms
+_SCALAR_UNIT_FACTORS = tuple(_MODEL_UNIT_FACTORS.tolist())
+_SCALAR_COEFFICIENTS = tuple(_PHENOAGE_COEFFICIENTS.tolist())
+_HEALTH_BOUNDS = tuple(zip(REFERENCE.optimal_low.tolist(), REFERENCE.optimal_high.tolist(),
+                           REFERENCE.low.tolist(), REFERENCE.high.tolist()))
+
+
+class ClockInputs:
+    """One (N x len(PANEL_COLUMNS)) matrix and the intermediates derived from it, each computed once"""
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    @cached_property
+    def age(self):
+        return self.matrix[:, 0]
+
+    @cached_property
+    def incomplete(self):
+        """Rows missing the age or any marker; they score NaN on every clock"""
+        return np.isnan(self.matrix).any(axis=1)
+
+    @cached_property
+    def health_status(self):
+        """(N x markers) OPTIMAL/NORMAL/OUTSIDE_RANGE codes, as analyze_health classifies them"""
+        return REFERENCE.health_status(self.matrix[:, 1:])
+
+    @cached_property
+    def model_units(self):
+        """The matrix in PhenoAge's units, with ln(CRP mg/dL) in the CRP column"""
+        units = self.matrix * _MODEL_UNIT_FACTORS
+        units[:, _CRP] = np.log(np.maximum(units[:, _CRP], CRP_FLOOR_MG_DL))
+        return units
+
+
+def register_clock(name, score, label=None, scalar=None):
+    """
+    Add a clock: `score(inputs)` takes a ClockInputs and returns N ages (years). The optional
+    `scalar(row)` scores one complete panel from its PANEL_COLUMNS values as a list of floats, and
+    must agree with `score` to the rounded 0.1 year.
+    """
+    CLOCKS[name] = AgingClock(name, label or name, score, scalar)
+
+
+def _clock_names(clocks):
+    names = list(CLOCKS) if clocks is None else list(clocks)
+    unknown = [name for name in names if name not in CLOCKS]
+    if unknown:
+        raise ValueError(f"Unknown aging clock(s): {', '.join(unknown)}")
+    return names
+
+
+def score_clocks(panels, clocks=None):
+    """
+    {clock name: float64 array of N ages rounded to 0.1} for `panels` (anything panel_matrix()
+    accepts), over every registered clock or just `clocks`. Incomplete rows are NaN.
+    """
+    names = _clock_names(clocks)
+    inputs = ClockInputs(panel_matrix(panels))
+    # Masked and rounded together: per-op overhead, not arithmetic, dominates a single panel
+    ages = np.stack([CLOCKS[name].score(inputs) for name in names])
+    ages[:, inputs.incomplete] = np.nan
+    return dict(zip(names, _round_half_even_like_python(ages.ravel()).reshape(ages.shape)))
+
+
+def panel_clocks(panel, clocks=None):
+    """{clock name: age or None} for one Panel, through each clock's scalar form where it has one"""
+    names = _clock_names(clocks)
+    if len(panel) < len(PANEL_COLUMNS):
+        return dict.fromkeys(names)
+    row = panel.values.tolist()
+    ages = {name: CLOCKS[name].scalar(row) for name in names if CLOCKS[name].scalar is not None}
+    batch = [name for name in names if name not in ages]
+    if batch:
+        ages.update((name, scores.item()) for name, scores in score_clocks(panel.values[None, :], batch).items())
+    return {name: None if ages[name] != ages[name] else round(ages[name], 1) for name in names}
+
+
+def _deviation(inputs):
+    # The original score, already rounded; calculate_biological_age_batch matches the scalar function
+    return calculate_biological_age_batch(inputs.matrix)
+
+
+def _deviation_scalar(row):
+    return _score(row[0], row[1:])
+
+
+def _phenoage(inputs):
+    return phenotypic_age_from_predictor(INTERCEPT + inputs.model_units @ _PHENOAGE_COEFFICIENTS)
+
+
+def _phenoage_scalar(row):
+    predictor = 0.0
+    for i, (value, factor, coefficient) in enumerate(zip(row, _SCALAR_UNIT_FACTORS, _SCALAR_COEFFICIENTS)):
+        value *= factor
+        if i == _CRP:
+            value = math.log(max(value, CRP_FLOOR_MG_DL))
+        predictor += value * coefficient
+    return phenotypic_age_from_predictor(INTERCEPT + predictor)
+
+
+# Years added per marker by the range-penalty clock, by health status
+RANGE_PENALTY_YEARS = {OPTIMAL: 0.0, NORMAL: 0.5, OUTSIDE_RANGE: 1.0}
+_PENALTY_BY_STATUS = np.array([RANGE_PENALTY_YEARS[code] for code in sorted(RANGE_PENALTY_YEARS)])
+_PENALTY_OPTIMAL, _PENALTY_NORMAL, _PENALTY_OUTSIDE = (RANGE_PENALTY_YEARS[code]
+                                                       for code in (OPTIMAL, NORMAL, OUTSIDE_RANGE))
+
+
+def _range_penalty(inputs):
+    return inputs.age + _PENALTY_BY_STATUS[inputs.health_status].sum(axis=1)
+
+
+def _range_penalty_scalar(row):
+    penalty = 0.0
+    for value, (optimal_low, optimal_high, low, high) in zip(row[1:], _HEALTH_BOUNDS):
+        penalty += _PENALTY_OPTIMAL if optimal_low <= value <= optimal_high else \
+            _PENALTY_NORMAL if low <= value <= high else _PENALTY_OUTSIDE
+    return row[0] + penalty
+
+
+register_clock('deviation', _deviation, "Deviation score", _deviation_scalar)
+register_clock('phenoage', _phenoage, "PhenoAge", _phenoage_scalar)
+register_clock('range_penalty', _range_penalty, "Range penalty", _range_penalty_scalar)
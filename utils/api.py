@@ -0,0 +1,87 @@
+"""
+Deterministic scoring behind the JSON API: biological age, per-marker status and analyze_health
+scores for one panel or thousands, in one vectorized pass and without the LLM. A single panel goes
+through the same path as a batch of one, so both endpoints return identical results.
+"""
+import math
+
+from utils.aging_clocks import PRIMARY_CLOCK, score_clocks
+from utils.biological_age import panel_matrix
+from utils.health_analysis import analyze_health_batch
+from utils.panel import PanelError, parse_panel
+from utils.percentiles import METRICS
+from utils.reference import ABOVE, BELOW, HEALTH_STATUS_NAMES, MISSING, NORMAL, OUTSIDE_RANGE, REFERENCE
+
+API_VERSION = 1
+
+RANGE_STATUS_NAMES = {BELOW: 'below', ABOVE: 'above'}
+
+
+def parse_panels(bodies):
+    """(panels, errors): a Panel per valid body, and {index: {field: message}} for the others"""
+    panels, errors = {}, {}
+    for i, body in enumerate(bodies):
+        if not isinstance(body, dict):
+            errors[i] = {'panel': "must be a JSON object"}
+            continue
+        try:
+            panels[i] = parse_panel(body)
+        except PanelError as e:
+            errors[i] = e.errors
+    return panels, errors
+
+
+def analyze_panels(panels, percentile_index=None):
+    """
+    One result dict per Panel, scored in one vectorized pass. "biological_age" is the primary
+    aging clock and "aging_clocks" has every registered one. With a PercentileIndex each result
+    also gets "percentiles" ({metric: 0-100 or None}) among its "peer_group".
+    """
+    panels = list(panels)
+    if not panels:
+        return []
+    matrix = panel_matrix(panels)
+    clocks = score_clocks(matrix)
+    age_array = clocks[PRIMARY_CLOCK]
+    ages = age_array.tolist()
+    clock_rows = [dict(zip(clocks, row)) for row in zip(*(ages.tolist() for ages in clocks.values()))]
+    statuses, scores = analyze_health_batch(matrix)
+    range_statuses = REFERENCE.range_status(matrix[:, 1:]).tolist()
+    values = matrix[:, 1:].tolist()
+    if percentile_index is not None:
+        percentiles, peer_groups = percentile_index.lookup(matrix, age_array, [panel.sex for panel in panels])
+        percentiles = percentiles.round(1).tolist()
+
+    results = []
+    for age, score, row_statuses, row_ranges, row_values, row_clocks in zip(ages, scores.tolist(), statuses.tolist(),
+                                                                             range_statuses, values, clock_rows):
+        markers, missing, concerns, optimizations = {}, [], [], []
+        for marker, unit, status, range_status, value in zip(REFERENCE.markers, REFERENCE.units, row_statuses,
+                                                             row_ranges, row_values):
+            if status == MISSING:
+                missing.append(marker)
+                continue
+            markers[marker] = {
+                'value': value,
+                'unit': unit,
+                'status': HEALTH_STATUS_NAMES[status],
+                'range': RANGE_STATUS_NAMES.get(range_status, 'within')
+            }
+            if status == OUTSIDE_RANGE:
+                concerns.append(f"{marker} is outside normal range")
+            elif status == NORMAL:
+                optimizations.append(f"{marker} could be optimized")
+        results.append({
+            'biological_age': None if math.isnan(age) else age,
+            'aging_clocks': {name: None if math.isnan(value) else value for name, value in row_clocks.items()},
+            'overall_health_score': None if math.isnan(score) else int(score),
+            'markers': markers,
+            'missing': missing,
+            'concerns': concerns,
+            'optimizations': optimizations
+        })
+    if percentile_index is not None:
+        for result, row, group in zip(results, percentiles, peer_groups):
+            result['percentiles'] = {metric: None if p != p else p for metric, p in zip(METRICS, row)}
+            result['peer_group'] = group
+    return results
@@ -0,0 +1,86 @@
+"""
+Static asset pipeline. At startup every file under static/ is read once, given a content-hashed
+name (css/results.css -> css/results.1a2b3c4d5e.css) and pre-compressed with gzip and, when the
+brotli package is installed, brotli. Templates link assets with asset_url(); /assets/<name> serves
+the smallest encoding the client accepts with a year-long immutable Cache-Control, so a changed
+file gets a new URL instead of waiting for caches to expire.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+from collections import namedtuple
+
+try:
+    import brotli
+except ImportError:  # optional; gzip alone is served without it
+    brotli = None
+
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Types worth compressing; images and fonts are compressed already
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+# Below this size the encoding headers outweigh the savings
+MIN_COMPRESS_BYTES = 256
+
+
+# bodies: {content-encoding ('identity', 'gzip', 'br'): bytes}, keeping only encodings that are smaller
+Asset = namedtuple('Asset', 'mimetype etag bodies')
+
+
+def fingerprint(name, digest):
+    root, ext = os.path.splitext(name)
+    return f"{root}.{digest[:10]}{ext}"
+
+
+def compress(data, mimetype):
+    bodies = {'identity': data}
+    if len(data) < MIN_COMPRESS_BYTES or not mimetype.startswith(COMPRESSIBLE_TYPES):
+        return bodies
+    candidates = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        candidates['br'] = brotli.compress(data, quality=11)
+    bodies.update({encoding: body for encoding, body in candidates.items() if len(body) < len(data)})
+    return bodies
+
+
+class AssetPipeline:
+    """Fingerprinted, pre-compressed copies of the files under `folder`, held in memory"""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.urls = {}    # logical name -> fingerprinted name
+        self.assets = {}  # fingerprinted name -> Asset
+        for root, _, files in os.walk(folder):
+            for filename in sorted(files):
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, folder).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    data = f.read()
+                digest = hashlib.sha256(data).hexdigest()
+                mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+                self.urls[name] = fingerprint(name, digest)
+                self.assets[self.urls[name]] = Asset(mimetype, digest[:20], compress(data, mimetype))
+
+    def name_for(self, name):
+        """Fingerprinted name of static/`name`; KeyError for a file that is not there"""
+        return self.urls[name]
+
+    def get(self, name):
+        return self.assets.get(name)
+
+    def stats(self):
+        """Total bytes per encoding, counting identity where an encoding was not worth keeping"""
+        totals = {'identity': 0, 'gzip': 0, 'br': 0}
+        for asset in self.assets.values():
+            for encoding in totals:
+                totals[encoding] += len(asset.bodies.get(encoding, asset.bodies['identity']))
+        return totals
+
+
+def choose_encoding(asset, accept_encodings):
+    """Smallest body the client accepts; `accept_encodings` is werkzeug's request.accept_encodings"""
+    accepted = [encoding for encoding in asset.bodies
+                if encoding == 'identity' or accept_encodings[encoding]]
+    return min(accepted, key=lambda encoding: len(asset.bodies[encoding]))
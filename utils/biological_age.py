@@ -1,52 +1,108 @@
 import numpy as np
 
+from utils.panel import PANEL_COLUMNS, Panel, _to_float_column
+from utils.reference import REFERENCE
+
+# Markers scored by the age model with their optimal ranges and weights, in scoring order
+AGE_MODEL_MARKERS = REFERENCE.markers
+AGE_MODEL_RANGES = tuple(zip(REFERENCE.age_low.tolist(), REFERENCE.age_high.tolist()))
+AGE_MODEL_WEIGHTS = tuple(REFERENCE.age_weights.tolist())
+_AGE_MODEL_OPTIMA = np.array([(min_val + max_val) / 2 for min_val, max_val in AGE_MODEL_RANGES])
+_AGE_MODEL_WEIGHT_ARRAY = np.array(AGE_MODEL_WEIGHTS)
+
+
 def calculate_biological_age(biomarkers):
     """
     Calculates biological age based on blood work markers and their optimal ranges
     """
-    try:
-        age = float(biomarkers['age'])
-        albumin = float(biomarkers['albumin'])
-        creatinine = float(biomarkers['creatinine'])
-        glucose = float(biomarkers['glucose'])
-        crp = float(biomarkers['crp'])
-        lymph_pct = float(biomarkers['lymph_pct'])
-        mcv = float(biomarkers['mcv'])
-        rdw = float(biomarkers['rdw'])
-        alk_phos = float(biomarkers['alk_phos'])
-        wbc = float(biomarkers['wbc'])
-
-        # Define optimal ranges and calculate deviations
-        deviations = [
-            (albumin, 4.3, 5.2),      # weight: 2.0
-            (glucose, 70, 90),        # weight: 1.5
-            (crp, 0, 1),             # weight: 1.5
-            (lymph_pct, 20, 40),     # weight: 1.0
-            (mcv, 80, 96),           # weight: 1.0
-            (rdw, 11.5, 14.5),       # weight: 1.0
-            (wbc, 4.5, 10),          # weight: 1.0
-            (alk_phos, 44, 147),     # weight: 0.5
-            (creatinine, 0.6, 1.2)   # weight: 0.5
-        ]
-
-        weights = [2.0, 1.5, 1.5, 1.0, 1.0, 1.0, 1.0, 0.5, 0.5]
-        total_deviation = 0
-        total_weight = sum(weights)
-
-        for (value, min_val, max_val), weight in zip(deviations, weights):
-            optimal = (min_val + max_val) / 2
-            deviation = abs(value - optimal) / optimal
-            total_deviation += deviation * weight
-
-        # Calculate biological age adjustment
-        avg_deviation = total_deviation / total_weight
-        age_adjustment = avg_deviation * 10  # Scale factor for age impact
-        
-        biological_age = age + (age_adjustment if avg_deviation > 0.1 else -age_adjustment)
-        biological_age = max(0, min(biological_age, 120))
-
-        return round(biological_age, 1)
-
-    except (ValueError, TypeError) as e:
-        print(f"Error calculating biological age: {str(e)}")
-        return None
\ No newline at end of file
+    if isinstance(biomarkers, Panel):
+        # Already parsed and validated: no casting, and a missing value is known up front
+        if len(biomarkers) < len(PANEL_COLUMNS):
+            return None
+        age, *values = biomarkers.values.tolist()
+    else:
+        try:
+            age = float(biomarkers['age'])
+            values = [float(biomarkers[marker]) for marker in AGE_MODEL_MARKERS]
+        except (ValueError, TypeError) as e:
+            print(f"Error calculating biological age: {str(e)}")
+            return None
+    return _score(age, values)
+
+
+def _score(age, values):
+    total_deviation = 0
+    total_weight = sum(AGE_MODEL_WEIGHTS)
+
+    for value, (min_val, max_val), weight in zip(values, AGE_MODEL_RANGES, AGE_MODEL_WEIGHTS):
+        optimal = (min_val + max_val) / 2
+        deviation = abs(value - optimal) / optimal
+        total_deviation += deviation * weight
+
+    # Calculate biological age adjustment
+    avg_deviation = total_deviation / total_weight
+    age_adjustment = avg_deviation * 10  # Scale factor for age impact
+
+    biological_age = age + (age_adjustment if avg_deviation > 0.1 else -age_adjustment)
+    biological_age = max(0, min(biological_age, 120))
+
+    return round(biological_age, 1)
+
+
+def panel_matrix(panels):
+    """
+    (N x len(PANEL_COLUMNS)) float64 matrix from an array already in PANEL_COLUMNS order, a
+    sequence of Panels, or a columnar mapping of column name -> sequence (dict of lists, DataFrame...)
+    """
+    if isinstance(panels, (list, tuple)) and panels and isinstance(panels[0], Panel):
+        return np.stack([panel.values for panel in panels])
+    if hasattr(panels, 'keys'):
+        return np.column_stack([_to_float_column(panels[column]) for column in PANEL_COLUMNS])
+
+    matrix = np.asarray(panels, dtype=np.float64)
+    if matrix.ndim != 2 or matrix.shape[1] != len(PANEL_COLUMNS):
+        raise ValueError(f"Expected an (N x {len(PANEL_COLUMNS)}) array with columns {PANEL_COLUMNS}")
+    return matrix
+
+
+def _round_half_even_like_python(values, ndigits=1):
+    """
+    np.round(values, 1) except where it can disagree with Python's correctly rounded round():
+    only values whose scaled fraction sits next to .5 are re-rounded in Python
+    """
+    scale = 10.0 ** ndigits
+    rounded = np.round(values, ndigits)
+    scaled = values * scale
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    for i in np.flatnonzero(near_tie):
+        rounded[i] = round(float(values[i]), ndigits)
+    return rounded
+
+
+def calculate_biological_age_batch(panels):
+    """
+    Vectorized calculate_biological_age for N panels in one pass. `panels` is anything
+    panel_matrix() accepts. Returns a float64 array of N ages, identical to the scalar function
+    row by row; rows with a missing or non-numeric value are NaN (the scalar returns None).
+    """
+    values = panel_matrix(panels)
+    missing = np.isnan(values).any(axis=1)
+
+    age = values[:, 0]
+    total_weight = sum(AGE_MODEL_WEIGHTS)
+
+    # Same operation order as the scalar loop so every row rounds identically: the terms are
+    # computed element-wise and cumsum adds them left to right (sum() would add them pairwise)
+    terms = np.abs(values[:, 1:] - _AGE_MODEL_OPTIMA) / _AGE_MODEL_OPTIMA * _AGE_MODEL_WEIGHT_ARRAY
+    total_deviation = np.cumsum(terms, axis=1)[:, -1]
+
+    avg_deviation = total_deviation / total_weight
+    age_adjustment = avg_deviation * 10
+    biological_age = np.where(avg_deviation > 0.1, age + age_adjustment, age - age_adjustment)
+
+    # max(0, min(x, 120)) exactly as Python evaluates it, including returning 0 for -0.0
+    biological_age = np.where(120 < biological_age, 120.0, biological_age)
+    biological_age = np.where(biological_age > 0, biological_age, 0.0)
+
+    biological_age[missing] = np.nan
+    return _round_half_even_like_python(biological_age)
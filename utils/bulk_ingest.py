@@ -0,0 +1,177 @@
+"""
+Bulk panel ingestion: stream-parse CSV (or Parquet when pyarrow is installed) in chunks, score
+each chunk and write results out incrementally so memory stays flat regardless of file size.
+
+    python -m utils.bulk_ingest panels.csv -o results.csv --chunk-size 10000
+"""
+import argparse
+import csv
+import io
+import math
+import sys
+import time
+
+from utils.biological_age import calculate_biological_age_batch
+from utils.health_analysis import analyze_health_batch
+from utils.panel import PANEL_COLUMNS, parse_columns
+from utils.reference import HEALTH_STATUS_NAMES, MISSING, NORMAL, OUTSIDE_RANGE, REFERENCE
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet support is optional
+    pq = None
+
+DEFAULT_CHUNK_SIZE = 10000
+
+# Optional per-row unit columns, e.g. glucose_unit = mmol/L
+UNIT_COLUMNS = tuple(f'{marker}_unit' for marker in REFERENCE.markers)
+
+# First of these found in the input header is copied to the output so rows can be joined back
+ID_COLUMNS = ('patient_id', 'sample_id', 'id')
+
+OUTPUT_COLUMNS = (
+    ['row', 'id', 'biological_age', 'overall_health_score']
+    + [f'{marker}_status' for marker in REFERENCE.markers]
+    + ['concerns', 'optimizations']
+)
+
+
+def iter_csv_chunks(text_stream, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield lists of row dicts from a CSV text stream, `chunk_size` rows at a time"""
+    chunk = []
+    for row in csv.DictReader(text_stream):
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_parquet_chunks(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield lists of row dicts from a Parquet file or binary file object, one record batch at a time"""
+    if pq is None:
+        raise RuntimeError("Parquet ingestion requires pyarrow (pip install pyarrow)")
+    for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_size):
+        yield batch.to_pylist()
+
+
+def iter_chunks(source, fmt, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Chunk iterator for a binary file object in 'csv' or 'parquet' format"""
+    if fmt == 'parquet':
+        return iter_parquet_chunks(source, chunk_size)
+    return iter_csv_chunks(io.TextIOWrapper(source, encoding='utf-8-sig', newline=''), chunk_size)
+
+
+def detect_format(filename):
+    return 'parquet' if filename and filename.lower().endswith(('.parquet', '.pq')) else 'csv'
+
+
+def chunk_matrix(rows):
+    """
+    (N x PANEL_COLUMNS) matrix of one chunk of row dicts, converting '<marker>_unit' columns to
+    reference units. Every reader of bulk-format files (scoring, the percentile index, cohort
+    packing) parses chunks here, so they agree on units and missing values.
+    """
+    unit_columns = tuple(column for column in UNIT_COLUMNS if rows and column in rows[0])
+    return parse_columns({column: [row.get(column) for row in rows] for column in PANEL_COLUMNS + unit_columns})
+
+
+def process_chunk(rows, first_row=0):
+    """
+    Score one chunk: parse it into one matrix (chunk_matrix), then biological age and marker
+    classification each in one vectorized pass over it
+    """
+    matrix = chunk_matrix(rows)
+    ages = calculate_biological_age_batch(matrix)
+    statuses, scores = analyze_health_batch(matrix)
+    id_column = next((column for column in ID_COLUMNS if rows and column in rows[0]), None)
+
+    results = []
+    for offset, (row, age, score, row_statuses) in enumerate(zip(rows, ages.tolist(), scores.tolist(),
+                                                                  statuses.tolist())):
+        result = {
+            'row': first_row + offset,
+            'id': row.get(id_column) if id_column else '',
+            'biological_age': None if math.isnan(age) else age,
+            'overall_health_score': None if math.isnan(score) else int(score)
+        }
+        concerns, optimizations = [], []
+        for marker, status in zip(REFERENCE.markers, row_statuses):
+            result[f'{marker}_status'] = 'missing' if status == MISSING else HEALTH_STATUS_NAMES[status]
+            if status == OUTSIDE_RANGE:
+                concerns.append(f"{marker} is outside normal range")
+            elif status == NORMAL:
+                optimizations.append(f"{marker} could be optimized")
+        result['concerns'] = '; '.join(concerns)
+        result['optimizations'] = '; '.join(optimizations)
+        results.append(result)
+    return results
+
+
+def iter_result_csv(chunks, stats=None):
+    """Yield the output CSV text chunk by chunk; `stats` (a dict) is updated with rows/seconds as it goes"""
+    stats = stats if stats is not None else {}
+    stats.update(rows=0, seconds=0.0, rows_per_sec=0.0)
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=OUTPUT_COLUMNS)
+    writer.writeheader()
+
+    start = time.perf_counter()
+    for rows in chunks:
+        writer.writerows(process_chunk(rows, stats['rows']))
+        stats['rows'] += len(rows)
+        stats['seconds'] = time.perf_counter() - start
+        stats['rows_per_sec'] = stats['rows'] / stats['seconds'] if stats['seconds'] else 0.0
+
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def ingest(source, out, fmt='csv', chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """
+    Score every panel in binary file object `source` and write CSV results to text stream `out`.
+    `progress(stats)` is called after each chunk. Returns the final stats dict.
+    """
+    stats = {}
+    for text in iter_result_csv(iter_chunks(source, fmt, chunk_size), stats):
+        out.write(text)
+        if progress:
+            progress(stats)
+    return stats
+
+
+def _print_progress(stats):
+    print(f"\r{stats['rows']:,} rows  {stats['rows_per_sec']:,.0f} rows/sec", end='', file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a CSV/Parquet file of blood panels")
+    parser.add_argument('input', help="CSV or Parquet file of panels ('-' for CSV on stdin)")
+    parser.add_argument('-o', '--output', default='-', help="output CSV path (default: stdout)")
+    parser.add_argument('--format', choices=('csv', 'parquet'), help="input format (default: from extension)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+
+    fmt = args.format or detect_format(args.input)
+    source = sys.stdin.buffer if args.input == '-' else open(args.input, 'rb')
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', newline='', encoding='utf-8')
+    try:
+        stats = ingest(source, out, fmt, args.chunk_size, progress=_print_progress)
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+
+    print(f"\n✅ {stats['rows']:,} rows in {stats['seconds']:.2f}s ({stats['rows_per_sec']:,.0f} rows/sec)",
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
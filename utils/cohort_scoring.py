@@ -0,0 +1,183 @@
+"""
+Multi-core re-scoring of a whole cohort. The panels are first packed into one (N x
+len(PANEL_COLUMNS)) float64 .npy file; `score` then splits it into row ranges across a process
+pool. Every worker memory-maps the same file, so its slices are zero-copy views of pages shared
+through the OS page cache, and writes its rows straight into a memory-mapped output file at their
+own offsets: the output is in input order whichever worker finishes first.
+
+    python -m utils.cohort_scoring pack cohort.csv -o cohort.npy
+    python -m utils.cohort_scoring pack --history history.sqlite -o cohort.npy
+    python -m utils.cohort_scoring score cohort.npy -o scores.npy --workers 32
+
+The output is a structured array with one float64 field per aging clock (NaN for incomplete
+rows), 'overall_health_score' (NaN with no markers) and 'statuses', the health-status code of each
+of REFERENCE.markers (MISSING where absent). History rows are packed in panel id order.
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+from utils.aging_clocks import CLOCKS, score_clocks
+from utils.bulk_ingest import DEFAULT_CHUNK_SIZE, chunk_matrix, detect_format, iter_chunks
+from utils.health_analysis import analyze_health_batch
+from utils.panel import PANEL_COLUMNS, parse_columns
+from utils.reference import REFERENCE
+
+# Rows per pool task: small enough to balance 32 workers on a few million rows, large enough that
+# the per-call numpy overhead is noise
+DEFAULT_TASK_ROWS = 100000
+
+
+def output_dtype():
+    """Structured dtype of a score file: the registered clocks, the health score and marker statuses"""
+    return np.dtype([(name, np.float64) for name in CLOCKS]
+                    + [('overall_health_score', np.float64), ('statuses', np.int8, (len(REFERENCE.markers),))])
+
+
+# -- packing -------------------------------------------------------------------------------------
+
+def file_matrices(path, fmt=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Panel matrices, chunk by chunk, from a CSV/Parquet file in the bulk-ingest format"""
+    fmt = fmt or detect_format(path)
+    with open(path, 'rb') as source:
+        for rows in iter_chunks(source, fmt, chunk_size):
+            yield chunk_matrix(rows)
+
+
+def history_matrices(store, chunk_size=100000):
+    """Panel matrices, chunk by chunk and oldest first, of every panel in a HistoryStore"""
+    for chunk in store.iter_columns(0, chunk_size):
+        yield parse_columns(chunk)
+
+
+def pack(matrices, path):
+    """
+    Write the rows of `matrices` (an iterable of panel matrices) to the .npy file `path` without
+    holding them all in memory: they are appended to a raw file, then copied in behind the header
+    once the row count is known. Returns the number of rows.
+    """
+    rows, raw = 0, path + '.raw'
+    with open(raw, 'wb') as f:
+        for matrix in matrices:
+            f.write(np.ascontiguousarray(matrix, dtype=np.float64).tobytes())
+            rows += len(matrix)
+    try:
+        with open(path, 'wb') as out, open(raw, 'rb') as f:
+            np.lib.format.write_array_header_1_0(out, {
+                'descr': np.lib.format.dtype_to_descr(np.dtype(np.float64)),
+                'fortran_order': False,
+                'shape': (rows, len(PANEL_COLUMNS))
+            })
+            shutil.copyfileobj(f, out, 16 << 20)
+    finally:
+        os.remove(raw)
+    return rows
+
+
+# -- scoring -------------------------------------------------------------------------------------
+
+# Per-process input and output mappings, opened once by the pool initializer
+_mapped = {}
+
+
+def _open_mappings(matrix_path, out_path):
+    _mapped['matrix'] = np.load(matrix_path, mmap_mode='r')
+    _mapped['out'] = np.load(out_path, mmap_mode='r+')
+
+
+def _score_range(bounds):
+    start, stop = bounds
+    rows = _mapped['matrix'][start:stop]  # a view of the mapping; nothing is copied until numpy reads it
+    block = _mapped['out'][start:stop]
+    for name, ages in score_clocks(rows, [name for name in block.dtype.names if name in CLOCKS]).items():
+        block[name] = ages
+    block['statuses'], block['overall_health_score'] = analyze_health_batch(rows)
+    return stop - start
+
+
+def score(matrix_path, out_path, workers=None, task_rows=DEFAULT_TASK_ROWS, progress=None):
+    """
+    Score every row of the packed matrix at `matrix_path` into the .npy file `out_path` with
+    `workers` processes (default: one per CPU; 1 scores in this process). `progress(stats)` is
+    called as ranges finish. Returns (the output opened read-only, final stats dict).
+    """
+    workers = workers or os.cpu_count()
+    matrix = np.load(matrix_path, mmap_mode='r')
+    if matrix.ndim != 2 or matrix.shape[1] != len(PANEL_COLUMNS):
+        raise ValueError(f"Expected an (N x {len(PANEL_COLUMNS)}) matrix with columns {PANEL_COLUMNS}")
+    total = len(matrix)
+    del matrix
+    out = np.lib.format.open_memmap(out_path, mode='w+', dtype=output_dtype(), shape=(total,))
+    del out
+    ranges = [(start, min(start + task_rows, total)) for start in range(0, total, task_rows)]
+
+    stats = {'rows': 0, 'total': total, 'workers': workers, 'seconds': 0.0, 'rows_per_sec': 0.0}
+    start = time.perf_counter()
+
+    def finished(rows):
+        stats['rows'] += rows
+        stats['seconds'] = time.perf_counter() - start
+        stats['rows_per_sec'] = stats['rows'] / stats['seconds'] if stats['seconds'] else 0.0
+        if progress:
+            progress(stats)
+
+    if workers == 1:
+        _open_mappings(matrix_path, out_path)
+        try:
+            for bounds in ranges:
+                finished(_score_range(bounds))
+        finally:
+            _mapped.clear()
+    else:
+        # Workers inherit clocks registered at runtime where processes fork (the default on Linux)
+        with multiprocessing.Pool(workers, initializer=_open_mappings, initargs=(matrix_path, out_path)) as pool:
+            for rows in pool.imap_unordered(_score_range, ranges):
+                finished(rows)
+    return np.load(out_path, mmap_mode='r'), stats
+
+
+def _print_progress(stats):
+    print(f"\r{stats['rows']:,}/{stats['total']:,} rows  {stats['rows_per_sec']:,.0f} rows/sec", end='',
+          file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pack a cohort into a memory-mapped matrix and score it on every core")
+    commands = parser.add_subparsers(dest='command', required=True)
+    pack_parser = commands.add_parser('pack', help="convert a cohort file or the panel history to a .npy matrix")
+    pack_parser.add_argument('input', nargs='?', help="CSV or Parquet file of panels")
+    pack_parser.add_argument('--history', help="BLOODIQ_HISTORY_PATH database to pack instead of a file")
+    pack_parser.add_argument('-o', '--output', required=True)
+    pack_parser.add_argument('--format', choices=('csv', 'parquet'))
+    pack_parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    score_parser = commands.add_parser('score', help="score a packed matrix")
+    score_parser.add_argument('matrix')
+    score_parser.add_argument('-o', '--output', required=True)
+    score_parser.add_argument('--workers', type=int, help="processes (default: one per CPU)")
+    score_parser.add_argument('--task-rows', type=int, default=DEFAULT_TASK_ROWS)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if args.command == 'pack':
+        if bool(args.input) == bool(args.history):
+            parser.error("pack needs an input file or --history, not both")
+        if args.history:
+            from utils.history_store import HistoryStore
+            matrices = history_matrices(HistoryStore(args.history), args.chunk_size)
+        else:
+            matrices = file_matrices(args.input, args.format, args.chunk_size)
+        rows = pack(matrices, args.output)
+        print(f"✅ {rows:,} rows packed in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    else:
+        _, stats = score(args.matrix, args.output, args.workers, args.task_rows, progress=_print_progress)
+        print(f"\n✅ {stats['rows']:,} rows on {stats['workers']} workers in {stats['seconds']:.2f}s "
+              f"({stats['rows_per_sec']:,.0f} rows/sec)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
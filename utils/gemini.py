@@ -0,0 +1,52 @@
+"""
+Lazily created Gemini client. Importing this module (or the app) does not import
+google-generativeai or need GEMINI_API_KEY; both happen on the first get_model() call.
+"""
+import os
+import threading
+from contextlib import contextmanager
+
+from utils.llm_client import LLMClient
+
+MODEL_NAME = os.getenv('BLOODIQ_GEMINI_MODEL', 'gemini-1.5-flash')
+
+_model = None
+_lock = threading.Lock()
+
+
+def get_model():
+    """
+    Return the shared GenerativeModel behind an LLMClient (rate limits, retries, circuit breaker),
+    configuring the SDK on first use (thread-safe)
+    """
+    global _model
+    if _model is None:
+        with _lock:
+            if _model is None:
+                api_key = os.getenv("GEMINI_API_KEY")
+                if not api_key:
+                    raise RuntimeError("GEMINI_API_KEY not found in .env file")
+                import google.generativeai as genai
+                genai.configure(api_key=api_key)
+                _model = LLMClient.from_env(genai.GenerativeModel(MODEL_NAME))
+    return _model
+
+
+def set_model(model):
+    """Install a ready-made model (e.g. utils.stub_model.StubModel) instead of the Gemini client"""
+    global _model
+    with _lock:
+        _model = model
+
+
+@contextmanager
+def model_override(model):
+    """set_model(model) for the duration of the block, then restore whatever was installed before"""
+    global _model
+    with _lock:
+        previous, _model = _model, model
+    try:
+        yield model
+    finally:
+        with _lock:
+            _model = previous
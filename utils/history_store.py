@@ -0,0 +1,383 @@
+"""
+Longitudinal history of submitted panels in one SQLite file: inputs, biological age,
+analyze_health output and the generated AI sections, plus per-metric trend points (delta from the
+previous panel and a rolling mean) maintained incrementally on insert.
+
+    patients      one row per tracked patient: a random id and the hash of its secret patient key
+    panels        one row per submission, indexed on (patient_id, taken_at)
+    trend_points  (patient_id, metric, taken_at, panel_id) clustered primary key, so a patient's
+                  trend over a time range is one index range scan however large the table grows
+
+Adding a panel touches only the last `window` points of each metric for that patient; nothing
+rescans full history. Each panel also gets a random `token`, the only id shown outside the store:
+the integer row id is sequential, so anyone could walk it. Likewise a patient's history is reached
+only through the patient key issued on their first submission, never through a typed-in ID. AI
+sections are stored with the PROMPT_TEMPLATE_VERSION they were generated from, so later templates
+do not reuse them.
+"""
+import hashlib
+import json
+import secrets
+import sqlite3
+import time
+
+import numpy as np
+
+from utils.biological_age import calculate_biological_age_batch
+from utils.health_analysis import analyze_health_batch
+from utils.panel import PANEL_COLUMNS, Panel, user_data_for
+from utils.prompt_builder import PROMPT_TEMPLATE_VERSION
+from utils.reference import REFERENCE
+from utils.sqlite_connections import ThreadConnections
+
+# Metrics with trend points; markers are stored as REAL columns of the same name on panels
+TREND_METRICS = ('biological_age', 'overall_health_score') + REFERENCE.markers
+
+ROLLING_WINDOW = 3
+
+_PANEL_COLUMNS = ('token', 'patient_id', 'taken_at', 'age', 'sex', 'height_cm', 'weight_kg') + REFERENCE.markers \
+    + ('biological_age', 'overall_health_score', 'analysis', 'ai_sections', 'prompt_version')
+
+# Columns added after the first release, migrated onto existing stores
+_ADDED_COLUMNS = (('token', 'TEXT'), ('prompt_version', 'INTEGER'))
+
+
+def new_token():
+    """Unguessable public id of a stored panel (128 random bits)"""
+    return secrets.token_urlsafe(16)
+
+
+def _key_hash(key):
+    # Keys are 128 random bits, so a fast hash is enough; the store never holds a usable key
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def _float_or_none(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if value != value else value  # NaN
+
+
+def _json_default(value):
+    # analyze_health output holds MappingProxyType reference views and may hold NumPy scalars
+    if hasattr(value, 'keys'):
+        return dict(value)
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _trend(values, window):
+    """(delta, rolling mean) for the last of `values`, given up to window-1 values before it"""
+    delta = values[-1] - values[-2] if len(values) > 1 else None
+    recent = values[-window:]
+    return delta, sum(recent) / len(recent)
+
+
+def panel_user_data(panel):
+    """Rebuild the /results user_data dict, with a Panel as its biomarkers, from a stored panel"""
+    values = [np.nan if panel[column] is None else panel[column] for column in PANEL_COLUMNS]
+    return user_data_for(Panel(values, panel['sex'], panel['height_cm'], panel['weight_kg']),
+                         panel['biological_age'])
+
+
+class HistoryStore:
+    """Append-mostly panel history; one connection per thread and process (utils.sqlite_connections)"""
+
+    def __init__(self, path, window=ROLLING_WINDOW):
+        self.path = path
+        self.window = window
+        self._connections = ThreadConnections(path, row_factory=sqlite3.Row)
+        marker_columns = ''.join(f', {marker} REAL' for marker in REFERENCE.markers)
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS panels ("
+                "id INTEGER PRIMARY KEY, patient_id TEXT, taken_at REAL NOT NULL, age REAL, sex TEXT, "
+                f"height_cm REAL, weight_kg REAL{marker_columns}, biological_age REAL, "
+                "overall_health_score REAL, analysis TEXT, ai_sections TEXT, token TEXT, prompt_version INTEGER)"
+            )
+            existing = [row[1] for row in conn.execute("PRAGMA table_info(panels)")]
+            for column, kind in _ADDED_COLUMNS:
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE panels ADD COLUMN {column} {kind}")
+            # Stores created before panels had tokens get one per existing panel; their AI sections
+            # keep a NULL prompt_version, so none of them is reused
+            missing = [row[0] for row in conn.execute("SELECT id FROM panels WHERE token IS NULL")]
+            conn.executemany("UPDATE panels SET token = ? WHERE id = ?", ((new_token(), i) for i in missing))
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS panels_token ON panels (token)")
+            conn.execute("CREATE INDEX IF NOT EXISTS panels_patient_time ON panels (patient_id, taken_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS patients ("
+                "id TEXT PRIMARY KEY, key_hash TEXT NOT NULL UNIQUE, label TEXT, created_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS trend_points ("
+                "patient_id TEXT NOT NULL, metric TEXT NOT NULL, taken_at REAL NOT NULL, panel_id INTEGER NOT NULL, "
+                "value REAL NOT NULL, delta REAL, rolling_mean REAL NOT NULL, "
+                "PRIMARY KEY (patient_id, metric, taken_at, panel_id)) WITHOUT ROWID"
+            )
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return self._connections.connection()
+
+    # -- writes ---------------------------------------------------------------------------------
+
+    def issue_key(self, label=None, patient_id=None):
+        """
+        Start tracking a patient: returns (patient_id, patient_key). The key is shown once and only
+        its hash is stored. Pass the `patient_id` of panels already stored (bulk imports, stores
+        from before patient keys) to issue a key for them, replacing any earlier key; otherwise a
+        random id is created.
+        """
+        patient_id = new_token() if patient_id is None else patient_id
+        key = new_token()
+        self._connect().execute(
+            "INSERT INTO patients (id, key_hash, label, created_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET key_hash = excluded.key_hash",
+            (patient_id, _key_hash(key), label, time.time())
+        )
+        return patient_id, key
+
+    def add_panel(self, patient_id, user_data, biological_age=None, analysis=None, ai_sections=None,
+                  taken_at=None):
+        """
+        Store one submission (`user_data` as built by /results) and update the patient's trends.
+        Returns the new panel's internal id. Panels without a patient_id are stored but have no trend.
+        """
+        taken_at = time.time() if taken_at is None else taken_at
+        biomarkers = user_data.get('biomarkers', {})
+        metrics = {marker: _float_or_none(biomarkers.get(marker)) for marker in REFERENCE.markers}
+        metrics['biological_age'] = _float_or_none(biological_age)
+        metrics['overall_health_score'] = _float_or_none((analysis or {}).get('overall_health_score'))
+
+        row = (new_token(), patient_id, taken_at, _float_or_none(user_data.get('age')), user_data.get('sex'),
+               _float_or_none(user_data.get('height_cm')), _float_or_none(user_data.get('weight_kg')),
+               *(metrics[marker] for marker in REFERENCE.markers),
+               metrics['biological_age'], metrics['overall_health_score'],
+               json.dumps(analysis, default=_json_default) if analysis is not None else None,
+               json.dumps(ai_sections) if ai_sections is not None else None,
+               PROMPT_TEMPLATE_VERSION if ai_sections is not None else None)
+
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            panel_id = conn.execute(
+                f"INSERT INTO panels ({', '.join(_PANEL_COLUMNS)}) VALUES ({', '.join('?' * len(row))})", row
+            ).lastrowid
+            if patient_id is not None:
+                for metric, value in metrics.items():
+                    if value is not None:
+                        self._insert_point(conn, patient_id, metric, taken_at, panel_id, value)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return panel_id
+
+    def _insert_point(self, conn, patient_id, metric, taken_at, panel_id, value):
+        """
+        Insert one trend point and refresh the points whose window it falls into: the new point
+        and, for a back-dated panel, the next window-1 points after it.
+        """
+        before = conn.execute(
+            "SELECT value FROM trend_points WHERE patient_id = ? AND metric = ? AND (taken_at, panel_id) < (?, ?) "
+            "ORDER BY taken_at DESC, panel_id DESC LIMIT ?",
+            (patient_id, metric, taken_at, panel_id, self.window - 1)
+        ).fetchall()
+        after = conn.execute(
+            "SELECT taken_at, panel_id, value FROM trend_points "
+            "WHERE patient_id = ? AND metric = ? AND (taken_at, panel_id) > (?, ?) "
+            "ORDER BY taken_at, panel_id LIMIT ?",
+            (patient_id, metric, taken_at, panel_id, self.window - 1)
+        ).fetchall()
+
+        values = [row[0] for row in reversed(before)] + [value]
+        delta, rolling_mean = _trend(values, self.window)
+        conn.execute(
+            "INSERT INTO trend_points (patient_id, metric, taken_at, panel_id, value, delta, rolling_mean) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (patient_id, metric, taken_at, panel_id, value, delta, rolling_mean)
+        )
+        for later_taken_at, later_panel_id, later_value in after:
+            values.append(later_value)
+            delta, rolling_mean = _trend(values, self.window)
+            conn.execute(
+                "UPDATE trend_points SET delta = ?, rolling_mean = ? "
+                "WHERE patient_id = ? AND metric = ? AND taken_at = ? AND panel_id = ?",
+                (delta, rolling_mean, patient_id, metric, later_taken_at, later_panel_id)
+            )
+
+    def set_ai_sections(self, panel_id, sections):
+        """Attach the AI sections ({slot: markdown or None}) once they have been generated"""
+        self._connect().execute("UPDATE panels SET ai_sections = ?, prompt_version = ? WHERE id = ?",
+                                (json.dumps(sections), PROMPT_TEMPLATE_VERSION, panel_id))
+
+    def add_panels(self, columns):
+        """
+        Bulk import from a columnar mapping (patient_id, taken_at, age and marker columns, as
+        accepted by calculate_biological_age_batch), scored and trended in vectorized passes.
+        Every imported panel must be newer than the history already stored for its patient;
+        use add_panel for back-dated ones. Returns the number of panels stored.
+        """
+        patient_ids = np.asarray(columns['patient_id']).astype(str)
+        taken_at = np.asarray(columns['taken_at'], dtype=np.float64)
+        n = len(patient_ids)
+        ages = calculate_biological_age_batch(columns)
+        _, scores = analyze_health_batch(columns)
+        markers = {marker: np.asarray(columns[marker], dtype=np.float64) for marker in REFERENCE.markers}
+        metrics = dict(markers, biological_age=ages, overall_health_score=scores)
+
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Patients with stored history seed the trend windows; for the rest there is nothing to read
+            existing = [patient for patient in np.unique(patient_ids).tolist() if conn.execute(
+                "SELECT 1 FROM panels WHERE patient_id = ? LIMIT 1", (patient,)).fetchone()]
+            first_id = (conn.execute("SELECT COALESCE(MAX(id), 0) FROM panels").fetchone()[0]) + 1
+            panel_ids = np.arange(first_id, first_id + n)
+            chronological = np.asarray(columns['age'], dtype=np.float64)
+            conn.executemany(
+                "INSERT INTO panels (id, token, patient_id, taken_at, age" + ''.join(f', {m}' for m in REFERENCE.markers)
+                + ", biological_age, overall_health_score) VALUES (" + ', '.join('?' * (7 + len(REFERENCE.markers)))
+                + ")",
+                zip(panel_ids.tolist(), [new_token() for _ in range(n)], patient_ids.tolist(), taken_at.tolist(),
+                    chronological.tolist(),
+                    *(np.where(np.isnan(markers[m]), None, markers[m]).tolist() for m in REFERENCE.markers),
+                    np.where(np.isnan(ages), None, ages).tolist(), np.where(np.isnan(scores), None, scores).tolist())
+            )
+            for metric, values in metrics.items():
+                conn.executemany(
+                    "INSERT INTO trend_points (patient_id, metric, taken_at, panel_id, value, delta, rolling_mean) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    self._bulk_points(conn, metric, patient_ids, taken_at, panel_ids, values, existing)
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return n
+
+    def _bulk_points(self, conn, metric, patient_ids, taken_at, panel_ids, values, existing):
+        """Trend rows for one metric, seeded with the last window-1 stored points of `existing` patients"""
+        present = ~np.isnan(values)
+        patients, times, ids, vals = patient_ids[present], taken_at[present], panel_ids[present], values[present]
+        is_new = np.ones(len(vals), dtype=bool)
+
+        seeds = []
+        if existing:
+            unique, inverse = np.unique(patients, return_inverse=True)
+            earliest = np.full(len(unique), np.inf)
+            np.minimum.at(earliest, inverse, times)
+            earliest = dict(zip(unique.tolist(), earliest.tolist()))
+            for patient in existing:
+                rows = conn.execute(
+                    "SELECT taken_at, panel_id, value FROM trend_points WHERE patient_id = ? AND metric = ? "
+                    "ORDER BY taken_at DESC, panel_id DESC LIMIT ?", (patient, metric, self.window - 1)
+                ).fetchall()
+                if rows and rows[0][0] > earliest.get(patient, np.inf):
+                    raise ValueError(f"Panel for {patient} is older than its stored history; use add_panel")
+                seeds.extend((patient,) + tuple(row) for row in rows)
+        if seeds:
+            seed_patients, seed_times, seed_ids, seed_vals = (np.array(column) for column in zip(*seeds))
+            patients = np.concatenate([seed_patients.astype(patients.dtype), patients])
+            times = np.concatenate([seed_times.astype(np.float64), times])
+            ids = np.concatenate([seed_ids.astype(ids.dtype), ids])
+            vals = np.concatenate([seed_vals.astype(np.float64), vals])
+            is_new = np.concatenate([np.zeros(len(seeds), dtype=bool), is_new])
+
+        order = np.lexsort((ids, times, patients))
+        patients, times, ids, vals, is_new = patients[order], times[order], ids[order], vals[order], is_new[order]
+
+        # Position of each point within its patient's run, for deltas and windows that stop at the boundary
+        starts = np.r_[True, patients[1:] != patients[:-1]]
+        run_start = np.maximum.accumulate(np.where(starts, np.arange(len(vals)), 0))
+        delta = np.r_[np.nan, np.diff(vals)]
+        delta[starts] = np.nan
+
+        sums = np.r_[0.0, np.cumsum(vals)]
+        index = np.arange(len(vals))
+        window_start = np.maximum(index - self.window + 1, run_start)
+        rolling = (sums[index + 1] - sums[window_start]) / (index + 1 - window_start)
+
+        keep = is_new
+        return zip(patients[keep].tolist(), [metric] * int(keep.sum()), times[keep].tolist(), ids[keep].tolist(),
+                   vals[keep].tolist(), np.where(np.isnan(delta[keep]), None, delta[keep]).tolist(),
+                   rolling[keep].tolist())
+
+    # -- reads ----------------------------------------------------------------------------------
+
+    def patient_for_key(self, key):
+        """The patient id a patient key was issued for, or None for an unknown key"""
+        row = self._connect().execute("SELECT id FROM patients WHERE key_hash = ?", (_key_hash(key),)).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _panel(row):
+        panel = dict(row)
+        for field in ('analysis', 'ai_sections'):
+            panel[field] = json.loads(panel[field]) if panel[field] else None
+        return panel
+
+    def get_panel(self, panel_id):
+        row = self._connect().execute("SELECT * FROM panels WHERE id = ?", (panel_id,)).fetchone()
+        return self._panel(row) if row else None
+
+    def get_panel_by_token(self, token):
+        row = self._connect().execute("SELECT * FROM panels WHERE token = ?", (token,)).fetchone()
+        return self._panel(row) if row else None
+
+    def latest_panel(self, patient_id):
+        """The patient's most recent panel that has AI sections, or None"""
+        row = self._connect().execute(
+            "SELECT * FROM panels WHERE patient_id = ? AND ai_sections IS NOT NULL "
+            "ORDER BY taken_at DESC, id DESC LIMIT 1", (patient_id,)
+        ).fetchone()
+        return self._panel(row) if row else None
+
+    def panels(self, patient_id, since=None, until=None, limit=None):
+        """A patient's panels in time order, optionally within [since, until] and capped at `limit`"""
+        rows = self._connect().execute(
+            "SELECT * FROM panels WHERE patient_id = ? AND taken_at >= ? AND taken_at <= ? "
+            "ORDER BY taken_at, id LIMIT ?",
+            (patient_id, -np.inf if since is None else since, np.inf if until is None else until,
+             -1 if limit is None else limit)
+        ).fetchall()
+        return [self._panel(row) for row in rows]
+
+    def trends(self, patient_id, metrics=None, since=None, until=None):
+        """{metric: [{taken_at, panel_id, value, delta, rolling_mean}, ...]} in time order"""
+        metrics = tuple(metrics or TREND_METRICS)
+        rows = self._connect().execute(
+            f"SELECT metric, taken_at, panel_id, value, delta, rolling_mean FROM trend_points "
+            f"WHERE patient_id = ? AND metric IN ({', '.join('?' * len(metrics))}) "
+            f"AND taken_at >= ? AND taken_at <= ? ORDER BY metric, taken_at, panel_id",
+            (patient_id, *metrics, -np.inf if since is None else since, np.inf if until is None else until)
+        ).fetchall()
+        trends = {metric: [] for metric in metrics}
+        for row in rows:
+            point = dict(row)
+            trends[point.pop('metric')].append(point)
+        return trends
+
+    def iter_columns(self, after_id=0, chunk_size=100000):
+        """
+        Yield every panel with id > after_id, oldest first, as columnar chunks: {column: list} with
+        id, sex, age, the markers and biological_age. For offline jobs such as the percentile index.
+        """
+        columns = ('id', 'sex') + PANEL_COLUMNS + ('biological_age',)
+        conn = self._connect()
+        while True:
+            rows = conn.execute(
+                f"SELECT {', '.join(columns)} FROM panels WHERE id > ? ORDER BY id LIMIT ?", (after_id, chunk_size)
+            ).fetchall()
+            if not rows:
+                return
+            chunk = {column: list(values) for column, values in zip(columns, zip(*rows))}
+            after_id = chunk['id'][-1]
+            yield chunk
@@ -0,0 +1,78 @@
+"""
+Dependency-aware reuse of AI sections between a patient's consecutive results. Each prompt type
+declares its inputs in prompt_builder.PROMPT_DEPENDENCIES; a section is regenerated only when
+the coarsened value of one of those inputs differs from the previous result's, or when the
+previous sections were generated from an older PROMPT_TEMPLATE_VERSION.
+"""
+import math
+
+from utils.llm_fanout import AI_SECTIONS
+from utils.panel import marker_values
+from utils.prompt_builder import MARKER_BUCKET_FRACTION, PROMPT_DEPENDENCIES, PROMPT_TEMPLATE_VERSION
+from utils.reference import REFERENCE
+
+
+def _number(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(value) else value
+
+
+def _marker_states(biomarkers):
+    """
+    {marker: (health status, range status, bucket)} for every marker; None when missing. The health
+    status is what the prompts print (optimal / normal but short of optimal / outside the range),
+    so a marker crossing an optimal bound counts as a material change even inside one bucket.
+    """
+    values = marker_values(biomarkers)
+    health = REFERENCE.health_status(values).tolist()
+    ranges = REFERENCE.range_status(values).tolist()
+    states = {}
+    for i, (marker, value) in enumerate(zip(REFERENCE.markers, values.tolist())):
+        if value != value:
+            states[marker] = None
+            continue
+        low, high = REFERENCE.low[i].item(), REFERENCE.high[i].item()
+        states[marker] = health[i], ranges[i], math.floor((value - low) / ((high - low) * MARKER_BUCKET_FRACTION))
+    return states
+
+
+def _demographic_state(value, bucket):
+    if bucket is None:
+        return value
+    value = _number(value)
+    return None if value is None else math.floor(value / bucket)
+
+
+def section_inputs(user_data, prompt_type):
+    """The coarsened inputs `prompt_type` depends on; equal tuples mean the same advice applies"""
+    dependencies = PROMPT_DEPENDENCIES[prompt_type]
+    states = _marker_states(user_data.get('biomarkers', {}))
+    return (
+        tuple(states[marker] for marker in dependencies['markers']),
+        tuple(_demographic_state(user_data.get(name), bucket) for name, bucket in dependencies['demographics'].items())
+    )
+
+
+def plan_sections(user_data, previous_user_data=None, previous_texts=None, sections=None,
+                  previous_version=PROMPT_TEMPLATE_VERSION):
+    """
+    Split `sections` ({slot: prompt_type}) into (reused {slot: text}, pending {slot: prompt_type}):
+    a slot is reused when the previous result generated it, under the current prompt templates
+    (`previous_version`), and its inputs did not change materially.
+    """
+    sections = sections or AI_SECTIONS
+    if previous_version != PROMPT_TEMPLATE_VERSION:
+        previous_texts = None
+    previous_texts = previous_texts or {}
+    reused, pending = {}, {}
+    for slot, prompt_type in sections.items():
+        text = previous_texts.get(slot)
+        if previous_user_data is not None and text and \
+                section_inputs(user_data, prompt_type) == section_inputs(previous_user_data, prompt_type):
+            reused[slot] = text
+        else:
+            pending[slot] = prompt_type
+    return reused, pending
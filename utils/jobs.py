@@ -0,0 +1,262 @@
+"""
+Durable background job queue for work that should not hold an HTTP request, such as generating a
+report's AI sections. Jobs live in SQLite, so no broker is needed: with BLOODIQ_JOBS_PATH every
+gunicorn worker (and any `python -m utils.jobs` process) enqueues into and drains the same file,
+and a poll can land on any of them. The app defaults it to jobs.sqlite in its instance folder; a
+path of ':memory:' keeps the queue in one process, which only suits a single-worker server.
+
+- enqueue() is idempotent per key: an identical pending, running or finished job is returned
+  instead of a new one
+- workers claim a job under a lease; a job whose worker died is picked up again when it expires
+- a failing job is retried with backoff up to max_attempts; progress it reported survives retries
+  so a handler can resume where the last attempt stopped
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from utils.sqlite_connections import ThreadConnections
+
+PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+
+# Finished jobs are kept this long for clients to collect
+JOB_TTL = 3600
+
+
+def job_key(kind, payload):
+    """Idempotency key of a job: the same kind and payload always map to the same job"""
+    return hashlib.sha256(json.dumps([kind, payload], sort_keys=True).encode()).hexdigest()
+
+
+class Job:
+    """A claimed job as its handler sees it: payload, attempt number and reported progress"""
+
+    __slots__ = ('queue', 'id', 'kind', 'payload', 'attempt', 'progress')
+
+    def __init__(self, queue, job_id, kind, payload, attempt, progress):
+        self.queue = queue
+        self.id, self.kind, self.payload, self.attempt = job_id, kind, payload, attempt
+        self.progress = progress
+
+    def report(self, updates):
+        """Merge `updates` into the job's progress (visible to pollers at once) and renew the lease"""
+        self.progress.update(updates)
+        self.queue.report(self.id, updates)
+
+
+class JobQueue:
+    """
+    `handlers` maps a job kind to handler(job) -> JSON-serializable result. `context` is an
+    optional callable returning a context manager each job runs in (e.g. app.app_context).
+    """
+
+    POLL_INTERVAL = 0.2
+
+    def __init__(self, path=None, handlers=None, workers=4, max_attempts=3, lease=90.0, retry_delay=2.0,
+                 ttl=JOB_TTL, context=None):
+        self.path = path or ':memory:'
+        self.handlers = dict(handlers or {})
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self.retry_delay = retry_delay
+        self.ttl = ttl
+        self.context = context
+        self._connections = ThreadConnections(self.path)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._started_pid = None
+        self._start_lock = threading.Lock()
+        # An in-memory database exists only on its connection, so all threads share one behind a lock
+        self._memory = (sqlite3.connect(':memory:', isolation_level=None, check_same_thread=False)
+                        if self.path == ':memory:' else None)
+        self._memory_lock = threading.Lock()
+        self._execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, key TEXT UNIQUE, kind TEXT NOT NULL, status TEXT NOT NULL, "
+            "payload TEXT NOT NULL, progress TEXT NOT NULL DEFAULT '{}', result TEXT, error TEXT, "
+            "attempts INTEGER NOT NULL DEFAULT 0, run_after REAL NOT NULL, lease_until REAL, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, run_after)")
+
+    def _connect(self):
+        return self._connections.connection()
+
+    def _execute(self, sql, params=()):
+        """(rows, column names) of one autocommitted statement"""
+        if self._memory is not None:
+            with self._memory_lock:
+                cursor = self._memory.execute(sql, params)
+                return cursor.fetchall(), [column[0] for column in cursor.description or ()]
+        cursor = self._connect().execute(sql, params)
+        return cursor.fetchall(), [column[0] for column in cursor.description or ()]
+
+    def register(self, kind, handler):
+        self.handlers[kind] = handler
+
+    def enqueue(self, kind, payload, key=None, progress=None):
+        """
+        Queue a job and return its id. Jobs with the same `key` are one job: while it is pending,
+        running or finished (and not expired) its id is returned and nothing new is queued; a
+        failed one is replaced. `progress` pre-fills what is already known (e.g. reused sections).
+        """
+        now = time.time()
+        self._execute("DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?", (DONE, FAILED, now - self.ttl))
+        if key is not None:
+            self._execute("DELETE FROM jobs WHERE key = ? AND status = ?", (key, FAILED))
+        job_id = uuid.uuid4().hex
+        self._execute(
+            "INSERT INTO jobs (id, key, kind, status, payload, progress, run_after, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (key) DO NOTHING",
+            (job_id, key, kind, PENDING, json.dumps(payload), json.dumps(progress or {}), now, now, now)
+        )
+        if key is not None:
+            job_id = self._execute("SELECT id FROM jobs WHERE key = ?", (key,))[0][0][0]
+        self.ensure_started()
+        self._wake.set()
+        return job_id
+
+    def get(self, job_id):
+        """The job's record (status, payload, progress, result, error, attempts...) or None"""
+        rows, columns = self._execute(
+            "SELECT id, kind, status, payload, progress, result, error, attempts, created_at, updated_at FROM jobs "
+            "WHERE id = ?", (job_id,)
+        )
+        if not rows:
+            return None
+        job = dict(zip(columns, rows[0]))
+        job['payload'] = json.loads(job['payload'])
+        job['progress'] = json.loads(job['progress'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def counts(self):
+        """{status: number of jobs}"""
+        return dict(self._execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")[0])
+
+    def claim(self):
+        """Lease the oldest runnable job (pending, or running with an expired lease); None if idle"""
+        while True:
+            now = time.time()
+            rows, _ = self._execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_until = ?, updated_at = ? "
+                "WHERE id = (SELECT id FROM jobs WHERE (status = ? AND run_after <= ?) "
+                "OR (status = ? AND lease_until < ?) ORDER BY run_after, created_at LIMIT 1) "
+                "RETURNING id, kind, payload, progress, attempts",
+                (RUNNING, now + self.lease, now, PENDING, now, RUNNING, now)
+            )
+            if not rows:
+                return None
+            job_id, kind, payload, progress, attempts = rows[0]
+            if attempts > self.max_attempts:
+                # Its worker died on the last allowed attempt
+                self._finish(job_id, FAILED, error="worker lost on the last attempt")
+                continue
+            return Job(self, job_id, kind, json.loads(payload), attempts, json.loads(progress))
+
+    def report(self, job_id, updates):
+        now = time.time()
+        self._execute(
+            "UPDATE jobs SET progress = json_patch(progress, ?), lease_until = ?, updated_at = ? WHERE id = ?",
+            (json.dumps(updates), now + self.lease, now, job_id)
+        )
+
+    def _finish(self, job_id, status, result=None, error=None):
+        self._execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, lease_until = NULL, updated_at = ? WHERE id = ?",
+            (status, None if result is None else json.dumps(result), error, time.time(), job_id)
+        )
+
+    def _retry(self, job, error):
+        delay = self.retry_delay * 2 ** (job.attempt - 1)
+        self._execute(
+            "UPDATE jobs SET status = ?, error = ?, run_after = ?, lease_until = NULL, updated_at = ? WHERE id = ?",
+            (PENDING, error, time.time() + delay, time.time(), job.id)
+        )
+
+    def run_one(self, job):
+        """Run a claimed job's handler and record the outcome: done, retried or failed"""
+        try:
+            handler = self.handlers[job.kind]
+            if self.context is not None:
+                with self.context():
+                    result = handler(job)
+            else:
+                result = handler(job)
+        except Exception as e:
+            if job.attempt < self.max_attempts and job.kind in self.handlers:
+                print(f"⚠️ Job {job.id} attempt {job.attempt} failed, retrying: {str(e)}")
+                self._retry(job, str(e))
+            else:
+                print(f"❌ Job {job.id} failed: {str(e)}")
+                self._finish(job.id, FAILED, error=str(e))
+            return False
+        self._finish(job.id, DONE, result=result)
+        return True
+
+    def _work(self):
+        while not self._stop.is_set():
+            job = self.claim()
+            if job is None:
+                self._wake.wait(self.POLL_INTERVAL)
+                self._wake.clear()
+                continue
+            self.run_one(job)
+
+    def ensure_started(self):
+        """Start this process's worker threads (again after a fork); a no-op when workers is 0"""
+        if not self.workers or self._started_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._started_pid == os.getpid():
+                return
+            self._stop.clear()
+            self._threads = [
+                threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True) for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+            self._started_pid = os.getpid()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._started_pid = None
+
+    def wait(self, job_id, timeout=None):
+        """Block until the job is done or failed; returns its record (None if it does not exist)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job['status'] in (DONE, FAILED):
+                return job
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"job {job_id} still {job['status']}")
+            time.sleep(0.02)
+
+
+if __name__ == '__main__':
+    # A dedicated queue worker: run with BLOODIQ_JOB_WORKERS=0 on the web servers so only this drains
+    parser = argparse.ArgumentParser(description="Drain the BloodIQ job queue (BLOODIQ_JOBS_PATH)")
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+    if os.getenv('BLOODIQ_JOBS_PATH') == ':memory:':
+        parser.error("an in-memory queue cannot be shared; set BLOODIQ_JOBS_PATH to the web workers' queue file")
+
+    from app import create_app
+    queue = create_app().extensions['jobs']
+    queue.workers = args.workers
+    queue.ensure_started()
+    print(f"Draining {queue.path} with {args.workers} workers")
+    while True:
+        time.sleep(60)
+        print(f"Jobs: {queue.counts()}")
@@ -0,0 +1,361 @@
+import hashlib
+import sqlite3
+import threading
+import time
+
+from cachetools import TTLCache
+
+from utils.metrics import record_cache_event, record_llm_call
+from utils.prompt_builder import PROMPT_TEMPLATE_VERSION
+from utils.single_flight import SingleFlight
+from utils.sqlite_connections import ThreadConnections
+
+
+def normalize_prompt(prompt):
+    """Strip whitespace noise that does not change what the model is asked"""
+    return '\n'.join(line.rstrip() for line in prompt.strip().splitlines())
+
+
+def cache_key(prompt, model_name, prompt_type, version=PROMPT_TEMPLATE_VERSION):
+    """Content address of a prompt: sha256 over template version, model, prompt type and prompt"""
+    payload = '\0'.join([str(version), model_name, prompt_type, normalize_prompt(prompt)])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class _CountingTTLCache(TTLCache):
+    """TTLCache that reports LRU evictions and TTL expirations to its owner"""
+
+    def __init__(self, maxsize, ttl, on_evict):
+        super().__init__(maxsize, ttl)
+        self._on_evict = on_evict
+
+    def popitem(self):
+        item = super().popitem()
+        self._on_evict(1)
+        return item
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        if expired:
+            self._on_evict(len(expired))
+        return expired
+
+
+class MemoryBackend:
+    """Per-process LRU with TTL; entries are (version, value) pairs"""
+
+    def __init__(self, maxsize=1024, ttl=3600, on_evict=None):
+        self._lock = threading.Lock()
+        self._cache = _CountingTTLCache(maxsize, ttl, on_evict or (lambda n: None))
+
+    def get(self, key):
+        with self._lock:
+            self._cache.expire()
+            entry = self._cache.get(key)
+        return entry[1] if entry else None
+
+    def set(self, key, value, version):
+        with self._lock:
+            self._cache[key] = (version, value)
+
+    def discard(self, key):
+        with self._lock:
+            self._cache.pop(key, None)
+
+    def invalidate_version(self, version):
+        with self._lock:
+            stale = [key for key, (entry_version, _) in self._cache.items() if entry_version == version]
+            for key in stale:
+                del self._cache[key]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+class SQLiteBackend:
+    """
+    On-disk cache shared by every gunicorn worker on the host. Expired rows are pruned on
+    write and the table is capped at `max_entries`, dropping the oldest rows first.
+    The llm_inflight table holds leases so only one worker calls upstream per key at a time.
+    """
+
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, path, ttl=3600, max_entries=100000, on_evict=None):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._on_evict = on_evict or (lambda n: None)
+        self._connections = ThreadConnections(path)
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, version TEXT NOT NULL, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_version ON llm_cache (version)")
+            conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_created ON llm_cache (created_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_inflight (key TEXT PRIMARY KEY, expires_at REAL NOT NULL)"
+            )
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return self._connections.connection()
+
+    def get(self, key):
+        row = self._connect().execute(
+            "SELECT value FROM llm_cache WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, version):
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_cache (key, version, value, created_at, expires_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, str(version), value, now, now + self.ttl)
+        )
+        evicted = conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,)).rowcount
+        evicted += conn.execute(
+            "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY created_at DESC "
+            "LIMIT -1 OFFSET ?)", (self.max_entries,)
+        ).rowcount
+        if evicted:
+            self._on_evict(evicted)
+
+    def claim(self, key, lease):
+        """Take the upstream-call lease for `key` unless a live one exists; True when taken"""
+        now = time.time()
+        conn = self._connect()
+        conn.execute("DELETE FROM llm_inflight WHERE key = ? AND expires_at <= ?", (key, now))
+        return conn.execute(
+            "INSERT OR IGNORE INTO llm_inflight (key, expires_at) VALUES (?, ?)", (key, now + lease)
+        ).rowcount == 1
+
+    def release(self, key):
+        self._connect().execute("DELETE FROM llm_inflight WHERE key = ?", (key,))
+
+    def wait(self, key, timeout):
+        """
+        Poll for the value another worker is producing under its lease. Returns None once the
+        lease is gone without a value (the leader failed) or `timeout` passes.
+        """
+        deadline = time.monotonic() + timeout
+        conn = self._connect()
+        while time.monotonic() < deadline:
+            value = self.get(key)
+            if value is not None:
+                return value
+            leased = conn.execute(
+                "SELECT 1 FROM llm_inflight WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+            if not leased:
+                return self.get(key)
+            time.sleep(self.POLL_INTERVAL)
+        return None
+
+    def discard(self, key):
+        self._connect().execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+
+    def invalidate_version(self, version):
+        return self._connect().execute(
+            "DELETE FROM llm_cache WHERE version = ?", (str(version),)
+        ).rowcount
+
+    def clear(self):
+        self._connect().execute("DELETE FROM llm_cache")
+
+
+class ResponseCache:
+    """
+    Two-level cache for LLM responses: an in-process LRU/TTL in front of an optional
+    shared SQLite file. Keys are content hashes from cache_key().
+
+    Misses are single-flighted: concurrent misses on one key in this process share one upstream
+    call, and with a shared file, workers wait on whichever worker holds the key's lease for up
+    to `lease` seconds. `coalesced` and `shared_coalesced` in stats() count the calls saved.
+    """
+
+    def __init__(self, maxsize=1024, ttl=3600, path=None, version=PROMPT_TEMPLATE_VERSION, lease=60):
+        self.version = version
+        self.lease = lease
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'shared_hits': 0, 'evictions': 0, 'upstream_calls': 0,
+                       'coalesced': 0, 'shared_coalesced': 0}
+        self.flight = SingleFlight(on_join=lambda: self._count('coalesced'))
+        self.memory = MemoryBackend(maxsize, ttl, on_evict=self._count_evictions)
+        self.shared = SQLiteBackend(path, ttl, on_evict=self._count_evictions) if path else None
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._stats[name] += n
+        record_cache_event(name, n)
+
+    def _count_evictions(self, n):
+        self._count('evictions', n)
+
+    def key(self, prompt, model_name, prompt_type):
+        return cache_key(prompt, model_name, prompt_type, self.version)
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self._count('shared_hits')
+                self.memory.set(key, value, self.version)
+        self._count('hits' if value is not None else 'misses')
+        return value
+
+    def set(self, key, value):
+        self.memory.set(key, value, self.version)
+        if self.shared is not None:
+            self.shared.set(key, value, self.version)
+
+    def claim_or_wait(self, key):
+        """
+        Cross-worker half of a miss. Returns (value, claimed): the value another worker produced
+        while holding the key's lease, or claimed=True when this worker now holds the lease.
+        Both are falsy without a shared file, or when the other worker gave up without a value.
+        """
+        value = self.memory.get(key)  # filled by a leader that finished since our miss
+        if value is not None or self.shared is None:
+            return value, False
+        if self.shared.claim(key, self.lease):
+            return None, True
+        value = self.shared.wait(key, self.lease)
+        if value is not None:
+            self._count('shared_coalesced')
+            self.memory.set(key, value, self.version)
+        return value, False
+
+    def produce(self, key, fn):
+        """Leader side of a miss: fn() is the upstream call, made only if no other worker has the value"""
+        value, claimed = self.claim_or_wait(key)
+        if value is not None:
+            return value
+        try:
+            self._count('upstream_calls')
+            value = fn()
+            self.set(key, value)
+            return value
+        finally:
+            if claimed:
+                self.shared.release(key)
+
+    def discard(self, key):
+        """Forget one entry, e.g. a response that turned out to be unusable"""
+        self.memory.discard(key)
+        if self.shared is not None:
+            self.shared.discard(key)
+
+    def invalidate_version(self, version):
+        """Drop every entry written under a prompt-template version; returns entries removed"""
+        removed = self.memory.invalidate_version(version)
+        if self.shared is not None:
+            removed += self.shared.invalidate_version(version)
+        return removed
+
+    def clear(self):
+        self.memory.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+def model_name_of(model):
+    return getattr(model, 'model_name', type(model).__name__)
+
+
+def _call_model(model, prompt, prompt_type, **kwargs):
+    """One upstream generate_content call, recorded in the LLM latency and token metrics"""
+    start = time.perf_counter()
+    try:
+        response = model.generate_content(prompt, **kwargs)
+        text = response.text
+    except Exception as e:
+        record_llm_call(prompt_type, time.perf_counter() - start, error=e)
+        raise
+    record_llm_call(prompt_type, time.perf_counter() - start, response)
+    return text
+
+
+def _stream_model(model, prompt, prompt_type, **kwargs):
+    """Streaming _call_model: yields chunk texts; usage is read from the last chunk"""
+    start = time.perf_counter()
+    chunk = None
+    try:
+        for chunk in model.generate_content(prompt, stream=True, **kwargs):
+            yield chunk.text
+    except Exception as e:
+        record_llm_call(prompt_type, time.perf_counter() - start, error=e)
+        raise
+    record_llm_call(prompt_type, time.perf_counter() - start, chunk)
+
+
+def generate_text(model, prompt, prompt_type, cache=None, **kwargs):
+    """Return the model's text for `prompt`, serving and filling `cache` when one is given"""
+    if cache is None:
+        return _call_model(model, prompt, prompt_type, **kwargs)
+
+    key = cache.key(prompt, model_name_of(model), prompt_type)
+    text = cache.get(key)
+    if text is None:
+        text = cache.flight.do(
+            key, lambda: cache.produce(key, lambda: _call_model(model, prompt, prompt_type, **kwargs)),
+            timeout=cache.lease
+        )
+    return text
+
+
+def stream_text(model, prompt, prompt_type, cache=None, **kwargs):
+    """
+    Yield the model's text for `prompt` chunk by chunk via stream=True. A cache hit yields the
+    whole cached text as one chunk; a completed stream is written back to `cache`. Callers that
+    join an identical stream already in flight get its full text as one chunk when it completes.
+    """
+    if cache is None:
+        yield from _stream_model(model, prompt, prompt_type, **kwargs)
+        return
+
+    key = cache.key(prompt, model_name_of(model), prompt_type)
+    cached = cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+
+    call, leader = cache.flight.begin(key)
+    if not leader:
+        yield call.wait(cache.lease)
+        return
+
+    try:
+        text, claimed = cache.claim_or_wait(key)
+        if text is not None:
+            yield text
+        else:
+            try:
+                cache._count('upstream_calls')
+                parts = []
+                for chunk in _stream_model(model, prompt, prompt_type, **kwargs):
+                    parts.append(chunk)
+                    yield chunk
+                text = ''.join(parts)
+                cache.set(key, text)
+            finally:
+                if claimed:
+                    cache.shared.release(key)
+    except BaseException as e:
+        # GeneratorExit when the consumer stops early; waiters still need an error to raise
+        cache.flight.finish(key, call, error=e if isinstance(e, Exception) else RuntimeError("stream abandoned"))
+        raise
+    cache.flight.finish(key, call, text)
@@ -0,0 +1,298 @@
+"""
+Rate-limit-aware wrapper around a GenerativeModel (or anything with generate_content):
+
+- one process-wide token bucket for requests/min and tokens/min, shared by every caller
+- callers wait in priority order: interactive /results before /get_advice before batch work
+- retryable failures (429, 5xx, timeouts) back off exponentially with full jitter, within the
+  call's deadline
+- a circuit breaker fails calls immediately after repeated upstream failures, so pages fall back
+  at once instead of holding workers until the gunicorn timeout
+
+LLMClient has the GenerativeModel surface the rest of the app uses (generate_content and
+model_name), so it drops in wherever a model is passed.
+"""
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+
+from utils.metrics import LLM_CIRCUIT_REJECTIONS, LLM_QUEUE_SECONDS, LLM_RETRIES
+
+INTERACTIVE, ADVICE, BATCH = 0, 1, 2
+PRIORITY_NAMES = ('interactive', 'advice', 'batch')
+
+# HTTP-style status codes (google.api_core exceptions carry one as .code) worth retrying
+RETRYABLE_CODES = frozenset((408, 429, 500, 502, 503, 504))
+
+
+class DeadlineExceeded(TimeoutError):
+    """The call's deadline passed while waiting for quota or between retries"""
+
+
+class CircuitOpenError(RuntimeError):
+    """Upstream is failing; the call was rejected without being sent"""
+
+
+def is_retryable(error):
+    code = getattr(error, 'code', None)
+    code = getattr(code, 'value', code)  # grpc StatusCode-style enums
+    return code in RETRYABLE_CODES or isinstance(error, (TimeoutError, ConnectionError))
+
+
+def estimate_tokens(prompt):
+    """Rough prompt size for the tokens/min bucket, reconciled with usage_metadata afterwards"""
+    return max(1, len(str(prompt)) // 4)
+
+
+class TokenBucket:
+    """
+    Requests/min and tokens/min budgets refilled continuously. A limit of 0 disables that budget.
+    Waiters are served strictly by (priority, arrival): only the head of the queue may take
+    budget, so a batch call never overtakes a waiting interactive one.
+    """
+
+    def __init__(self, rpm, tpm):
+        self.rpm, self.tpm = rpm, tpm
+        self._requests, self._tokens = float(rpm), float(tpm)
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._sequence = itertools.count()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def _shortfall(self, tokens):
+        """Seconds until both budgets cover one request of `tokens` (0 when they already do)"""
+        wait = 0.0
+        if self.rpm and self._requests < 1:
+            wait = (1 - self._requests) * 60 / self.rpm
+        if self.tpm and self._tokens < min(tokens, self.tpm):
+            wait = max(wait, (min(tokens, self.tpm) - self._tokens) * 60 / self.tpm)
+        return wait
+
+    def acquire(self, tokens, priority=INTERACTIVE, deadline=None):
+        """Block until budget is available; raises DeadlineExceeded at monotonic `deadline`"""
+        ticket = (priority, next(self._sequence))
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = None
+                    if self._waiting[0] == ticket:
+                        self._refill(now)
+                        wait = self._shortfall(tokens)
+                        if wait <= 0:
+                            self._requests -= 1
+                            self._tokens -= tokens
+                            return
+                    if deadline is not None:
+                        if now >= deadline:
+                            raise DeadlineExceeded("timed out waiting for LLM quota")
+                        wait = deadline - now if wait is None else min(wait, deadline - now)
+                    self._cond.wait(wait)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+    def adjust(self, tokens):
+        """Charge (or refund, if negative) the difference between estimated and actual tokens"""
+        with self._cond:
+            self._tokens -= tokens
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failed calls and rejects calls for `cooldown` seconds;
+    then lets a single trial call through, which closes it on success or reopens it on failure.
+    """
+
+    def __init__(self, threshold=5, cooldown=30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial_running or time.monotonic() - self._opened_at < self.cooldown:
+                return False
+            self._trial_running = True
+            return True
+
+    def release(self):
+        """End an admitted call that never reached upstream, leaving the breaker as it was"""
+        with self._lock:
+            self._trial_running = False
+
+    def record(self, success):
+        with self._lock:
+            self._trial_running = False
+            if success:
+                self._failures, self._opened_at = 0, None
+                return
+            self._failures += 1
+            if self._opened_at is not None or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return self._opened_at is not None
+
+
+class LLMClient:
+    """
+    `model` behind a shared TokenBucket, retries with jittered backoff and a CircuitBreaker.
+    generate_content takes the model's arguments plus `priority`; the deadline comes from
+    request_options={'timeout': seconds} and defaults to `deadline` seconds.
+    """
+
+    def __init__(self, model, rpm=0, tpm=0, max_retries=3, base_delay=0.5, max_delay=8.0, deadline=50.0,
+                 breaker=None):
+        self.model = model
+        self.model_name = getattr(model, 'model_name', type(model).__name__)
+        self.bucket = TokenBucket(rpm, tpm)
+        self.breaker = breaker or CircuitBreaker()
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    @classmethod
+    def from_env(cls, model):
+        """Limits are per process; divide the account quota by the number of gunicorn workers"""
+        return cls(
+            model,
+            rpm=int(os.getenv('BLOODIQ_LLM_RPM', 0)),
+            tpm=int(os.getenv('BLOODIQ_LLM_TPM', 0)),
+            max_retries=int(os.getenv('BLOODIQ_LLM_RETRIES', 3)),
+            deadline=float(os.getenv('BLOODIQ_LLM_DEADLINE', 50)),
+            breaker=CircuitBreaker(
+                threshold=int(os.getenv('BLOODIQ_BREAKER_THRESHOLD', 5)),
+                cooldown=float(os.getenv('BLOODIQ_BREAKER_COOLDOWN', 30))
+            )
+        )
+
+    def with_priority(self, priority):
+        """A view of this client whose calls queue at `priority`; limits and breaker are shared"""
+        return _PriorityView(self, priority)
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _admit(self, prompt, priority, deadline):
+        if not self.breaker.allow():
+            LLM_CIRCUIT_REJECTIONS.inc()
+            raise CircuitOpenError("LLM circuit open after repeated upstream failures")
+        tokens = estimate_tokens(prompt)
+        start = time.monotonic()
+        try:
+            self.bucket.acquire(tokens, priority, deadline)
+        except DeadlineExceeded:
+            self.breaker.release()  # a local quota wait says nothing about upstream health
+            raise
+        finally:
+            LLM_QUEUE_SECONDS.labels(PRIORITY_NAMES[priority]).observe(time.monotonic() - start)
+        return tokens
+
+    def _settle(self, estimated, response):
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None:
+            self.bucket.adjust((getattr(usage, 'total_token_count', 0) or 0) - estimated)
+
+    def _attempts(self, prompt, priority, kwargs):
+        """Yield (attempt, request kwargs, estimated tokens, deadline) until the caller stops or retries run out"""
+        options = dict(kwargs.pop('request_options', None) or {})
+        deadline = time.monotonic() + options.get('timeout', self.deadline)
+        for attempt in range(self.max_retries + 1):
+            tokens = self._admit(prompt, priority, deadline)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.breaker.release()
+                raise DeadlineExceeded("LLM call deadline passed")
+            yield attempt, dict(kwargs, request_options=dict(options, timeout=remaining)), tokens, deadline
+
+    def _should_retry(self, error, attempt, deadline):
+        """Record a failed attempt; sleep and return True if another attempt fits the deadline"""
+        if not is_retryable(error):
+            self.breaker.release()  # e.g. a rejected prompt: upstream answered, it is not unhealthy
+            return False
+        self.breaker.record(False)
+        if attempt >= self.max_retries:
+            return False
+        delay = self._backoff(attempt)
+        if time.monotonic() + delay >= deadline:
+            return False
+        LLM_RETRIES.labels(type(error).__name__).inc()
+        time.sleep(delay)
+        return True
+
+    def generate_content(self, prompt, stream=False, priority=INTERACTIVE, **kwargs):
+        if stream:
+            return self._stream(prompt, priority, kwargs)
+        for attempt, call_kwargs, tokens, deadline in self._attempts(prompt, priority, kwargs):
+            try:
+                response = self.model.generate_content(prompt, **call_kwargs)
+            except Exception as e:
+                if self._should_retry(e, attempt, deadline):
+                    continue
+                raise
+            self.breaker.record(True)
+            self._settle(tokens, response)
+            return response
+
+    def _stream(self, prompt, priority, kwargs):
+        # Retries only happen before the first chunk; after that the caller already has output
+        for attempt, call_kwargs, tokens, deadline in self._attempts(prompt, priority, kwargs):
+            started = False
+            chunk = None
+            try:
+                for chunk in self.model.generate_content(prompt, stream=True, **call_kwargs):
+                    started = True
+                    yield chunk
+            except Exception as e:
+                if not started and self._should_retry(e, attempt, deadline):
+                    continue
+                if started:
+                    self.breaker.record(False)
+                raise
+            except BaseException:
+                self.breaker.release()  # the consumer stopped reading (GeneratorExit)
+                raise
+            self.breaker.record(True)
+            self._settle(tokens, chunk)
+            return
+
+
+class _PriorityView:
+    __slots__ = ('client', 'priority')
+
+    def __init__(self, client, priority):
+        self.client = client
+        self.priority = priority
+
+    @property
+    def model_name(self):
+        return self.client.model_name
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        return self.client.generate_content(prompt, stream, priority=self.priority, **kwargs)
+
+
+def with_priority(model, priority):
+    """`model` queued at `priority` when it is an LLMClient; any other model is returned as is"""
+    return model.with_priority(priority) if isinstance(model, LLMClient) else model
@@ -0,0 +1,131 @@
+"""
+Combined generation: one structured-output call returns every AI section as a field of a JSON
+object, so the patient block is sent and processed once instead of once per section. Sections
+missing from (or unreadable in) the response are regenerated with the per-section fan-out.
+"""
+import json
+import re
+import time
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from utils.llm_cache import generate_text, model_name_of
+from utils.llm_fanout import AI_SECTIONS, REQUEST_TIMEOUT, _executor, iter_section_events
+from utils.metrics import LLM_COMBINED_MISSING
+from utils.prompt_builder import COMBINED_PROMPT_TYPE, OUTPUT_TOKEN_LIMITS, generate_combined_prompt
+
+_FENCE = re.compile(r'^```(?:json)?\s*|\s*```$')
+
+
+def response_config(sections):
+    """
+    generation_config asking for a JSON object with one required string field per section ({slot:
+    prompt_type}), capped at the 'combined' output limit or, when every section has one, their sum
+    """
+    config = {
+        'response_mime_type': 'application/json',
+        'response_schema': {
+            'type': 'OBJECT',
+            'properties': {slot: {'type': 'STRING'} for slot in sections},
+            'required': list(sections)
+        }
+    }
+    limits = [OUTPUT_TOKEN_LIMITS.get(prompt_type) for prompt_type in sections.values()]
+    limit = OUTPUT_TOKEN_LIMITS.get(COMBINED_PROMPT_TYPE) or (sum(limits) if all(limits) else None)
+    if limit:
+        config['max_output_tokens'] = limit
+    return config
+
+
+def _salvage_fields(text, sections):
+    """Pull each field's string out of JSON that does not parse as a whole (e.g. truncated)"""
+    decoder = json.JSONDecoder()
+    fields = {}
+    for slot in sections:
+        match = re.search(r'"%s"\s*:\s*' % re.escape(slot), text)
+        if not match:
+            continue
+        try:
+            fields[slot], _ = decoder.raw_decode(text, match.end())
+        except ValueError:
+            pass
+    return fields
+
+
+def parse_sections(text, sections=None):
+    """
+    {slot: markdown or None} from a combined response. Code fences and a response that does not
+    parse as a whole are tolerated: every field whose value is a complete non-empty string is kept.
+    """
+    sections = sections or AI_SECTIONS
+    text = _FENCE.sub('', (text or '').strip())
+    try:
+        fields = json.loads(text)
+    except ValueError:
+        fields = _salvage_fields(text, sections)
+    if not isinstance(fields, dict):
+        fields = {}
+
+    parsed = {}
+    for slot in sections:
+        value = fields.get(slot)
+        parsed[slot] = value.strip() if isinstance(value, str) and value.strip() else None
+    return parsed
+
+
+def iter_combined_events(model, user_data, sections=None, section_timeout=None, request_timeout=None,
+                         cache=None, stream_tokens=False, trace=None):
+    """
+    Drop-in for llm_fanout.iter_section_events that makes one combined call. Sections it yields
+    ('done', text) for come from that call; the rest are regenerated one by one with whatever is
+    left of `request_timeout`. Token streaming does not apply; sections arrive whole.
+    """
+    sections = sections or AI_SECTIONS
+    request_timeout = REQUEST_TIMEOUT if request_timeout is None else request_timeout
+    start = time.monotonic()
+
+    prompt = generate_combined_prompt(user_data, sections)
+    texts = dict.fromkeys(sections)
+    try:
+        future = _executor.submit(generate_text, model, prompt, COMBINED_PROMPT_TYPE, cache,
+                                  request_options={'timeout': request_timeout},
+                                  generation_config=response_config(sections))
+        texts = parse_sections(future.result(timeout=request_timeout), sections)
+    except FutureTimeout:
+        print(f"❌ Gemini API timeout (combined) after {time.monotonic() - start:.1f}s")
+    except Exception as e:
+        print(f"❌ Gemini API error (combined): {str(e)}")
+    finally:
+        if trace is not None:
+            trace.add('ai_combined', time.monotonic() - start)
+
+    missing = {slot: prompt_type for slot, prompt_type in sections.items() if texts.get(slot) is None}
+    if missing and cache is not None:
+        # Never serve an incomplete combined response from cache; the next request retries it
+        cache.discard(cache.key(prompt, model_name_of(model), COMBINED_PROMPT_TYPE))
+
+    for slot in sections:
+        if slot not in missing:
+            yield slot, 'done', texts[slot]
+    if not missing:
+        return
+
+    for slot in missing:
+        LLM_COMBINED_MISSING.labels(slot).inc()
+    remaining = request_timeout - (time.monotonic() - start)
+    if remaining <= 0:
+        for slot in missing:
+            yield slot, 'error', None
+        return
+    print(f"⚠️ Combined response missing {', '.join(missing)}; generating separately")
+    yield from iter_section_events(model, user_data, missing, section_timeout, remaining, cache,
+                                   stream_tokens, trace)
+
+
+def generate_combined(model, user_data, sections=None, section_timeout=None, request_timeout=None,
+                      cache=None, trace=None):
+    """generate_sections via one combined call; returns {slot: text or None} in section order"""
+    sections = sections or AI_SECTIONS
+    results = {slot: payload for slot, kind, payload in iter_combined_events(
+        model, user_data, sections, section_timeout, request_timeout, cache, trace=trace
+    ) if kind != 'chunk'}
+    return {slot: results.get(slot) for slot in sections}
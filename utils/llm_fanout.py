@@ -0,0 +1,129 @@
+import os
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.llm_cache import generate_text, stream_text
+from utils.prompt_builder import generate_prompt, generation_config
+
+# Template slot in results.html -> prompt type in generate_prompt
+AI_SECTIONS = {
+    'analysis': 'analysis',
+    'meal_plan': 'meal_plan',
+    'exercise_plan': 'exercise_plan',
+    'supplements': 'supplement_advice',
+    'risks': 'risk_assessment'
+}
+
+FALLBACK_TEXT = "AI insights temporarily unavailable"
+
+SECTION_TIMEOUT = float(os.getenv('BLOODIQ_SECTION_TIMEOUT', 45))
+REQUEST_TIMEOUT = float(os.getenv('BLOODIQ_REQUEST_TIMEOUT', 60))
+MAX_WORKERS = int(os.getenv('BLOODIQ_LLM_WORKERS', 32))
+
+# Shared by every request in the process so concurrent pages cannot spawn unbounded threads.
+# Threads are started lazily on first submit, which keeps this safe under gunicorn --preload.
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='llm')
+
+
+def _run_section(events, slot, model, prompt, prompt_type, timeout, cache, stream_tokens, trace):
+    """Worker body: report a section's chunks and outcome on the request's event queue"""
+    start = time.perf_counter()
+    try:
+        kwargs = {'request_options': {'timeout': timeout}}
+        config = generation_config(prompt_type)
+        if config:
+            kwargs['generation_config'] = config
+        if stream_tokens:
+            parts = []
+            for chunk in stream_text(model, prompt, prompt_type, cache, **kwargs):
+                parts.append(chunk)
+                events.put((slot, 'chunk', chunk))
+            text = ''.join(parts)
+        else:
+            text = generate_text(model, prompt, prompt_type, cache, **kwargs)
+        events.put((slot, 'done', text))
+    except Exception as e:
+        events.put((slot, 'error', e))
+    finally:
+        if trace is not None:
+            trace.add(f'ai_{slot}', time.perf_counter() - start)
+
+
+def _section_deadlines(sections, section_timeout, request_timeout, start):
+    if not isinstance(section_timeout, dict):
+        section_timeout = dict.fromkeys(sections, section_timeout)
+    request_deadline = start + request_timeout
+    return {
+        slot: min(start + section_timeout.get(slot, SECTION_TIMEOUT), request_deadline)
+        for slot in sections
+    }
+
+
+def iter_section_events(model, user_data, sections=None, section_timeout=None, request_timeout=None,
+                        cache=None, stream_tokens=False, trace=None):
+    """
+    Send every section prompt at once and yield (slot, kind, payload) events as they arrive:
+    ('chunk', text) for streamed tokens when `stream_tokens` is set, then exactly one of
+    ('done', full_text) or ('error', None) per section.
+
+    `section_timeout` is seconds for every section or a {slot: seconds} dict; `request_timeout`
+    bounds the whole fan-out. A section that fails or misses its deadline errors out on its own
+    without affecting the others. Responses are read from and written to `cache` when given,
+    and each section's wall time is added to `trace` (a utils.metrics.Trace) as `ai_<slot>`.
+    """
+    sections = sections or AI_SECTIONS
+    section_timeout = SECTION_TIMEOUT if section_timeout is None else section_timeout
+    request_timeout = REQUEST_TIMEOUT if request_timeout is None else request_timeout
+
+    start = time.monotonic()
+    deadlines = _section_deadlines(sections, section_timeout, request_timeout, start)
+    events = queue.Queue()
+
+    pending = set(sections)
+    for slot, prompt_type in sections.items():
+        prompt = generate_prompt(user_data, prompt_type)
+        timeout = deadlines[slot] - start
+        _executor.submit(_run_section, events, slot, model, prompt, prompt_type, timeout, cache,
+                         stream_tokens, trace)
+
+    while pending:
+        now = time.monotonic()
+        for slot in [slot for slot in pending if deadlines[slot] <= now]:
+            pending.discard(slot)
+            print(f"❌ Gemini API timeout ({slot}) after {now - start:.1f}s")
+            yield slot, 'error', None
+        if not pending:
+            break
+
+        next_deadline = min(deadlines[slot] for slot in pending)
+        try:
+            slot, kind, payload = events.get(timeout=max(0, next_deadline - now))
+        except queue.Empty:
+            continue
+        if slot not in pending:
+            continue  # late event from a section that already timed out
+        if kind == 'error':
+            pending.discard(slot)
+            print(f"❌ Gemini API error ({slot}): {str(payload)}")
+            yield slot, 'error', None
+            continue
+        if kind == 'done':
+            pending.discard(slot)
+        yield slot, kind, payload
+
+
+def iter_sections(model, user_data, sections=None, section_timeout=None, request_timeout=None,
+                  cache=None, trace=None):
+    """Yield (slot, text) pairs as sections finish; failed or late sections yield (slot, None)"""
+    for slot, kind, payload in iter_section_events(model, user_data, sections, section_timeout,
+                                                   request_timeout, cache, trace=trace):
+        yield slot, payload
+
+
+def generate_sections(model, user_data, sections=None, section_timeout=None, request_timeout=None,
+                      cache=None, trace=None):
+    """Generate all AI sections concurrently; returns {slot: text or None} in section order"""
+    sections = sections or AI_SECTIONS
+    results = dict(iter_sections(model, user_data, sections, section_timeout, request_timeout, cache, trace))
+    return {slot: results.get(slot) for slot in sections}
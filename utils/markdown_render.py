@@ -0,0 +1,87 @@
+"""
+Markdown -> HTML for AI sections. Each thread reuses one configured markdown2.Markdown (convert()
+resets its per-document state), and rendered HTML is memoized by content hash in a byte-bounded
+LRU, optionally backed by the shared SQLite LLM cache so other workers skip conversion as well.
+"""
+import hashlib
+import threading
+
+import markdown2
+from cachetools import LRUCache
+
+EXTRAS = (
+    'break-on-newline',
+    'tables',
+    'fenced-code-blocks',
+    'header-ids',
+    'strike',
+    'target-blank-links'
+)
+
+# Bump when EXTRAS or the pre-processing in _prepare change, so stale HTML is not served
+RENDER_VERSION = 1
+
+
+def _prepare(text):
+    # First, ensure numbers in bold are properly formatted
+    text = text.replace('**(', '** (')  # Add space after bold start if followed by parenthesis
+    return text.strip()
+
+
+class MarkdownRenderer:
+    """
+    Memoizing renderer. `max_bytes` bounds the in-process memo by the size of the HTML it holds;
+    `shared` is an optional second level with get(key) / set(key, value, version), such as the
+    SQLiteBackend of the app's ResponseCache; entries there are versioned 'html-<RENDER_VERSION>'.
+    """
+
+    def __init__(self, max_bytes=8 * 1024 * 1024, shared=None):
+        self.shared = shared
+        self._memo = LRUCache(maxsize=max_bytes, getsizeof=len)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {'hits': 0, 'shared_hits': 0, 'renders': 0}
+
+    def _converter(self):
+        converter = getattr(self._local, 'converter', None)
+        if converter is None:
+            converter = self._local.converter = markdown2.Markdown(extras=list(EXTRAS))
+        return converter
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def key(self, text):
+        return 'html:' + hashlib.sha256(f'{RENDER_VERSION}\0{text}'.encode('utf-8')).hexdigest()
+
+    def convert(self, text):
+        """Render without memoization, on this thread's converter"""
+        return str(self._converter().convert(_prepare(text)))
+
+    def render(self, text):
+        key = self.key(text)
+        with self._lock:
+            html = self._memo.get(key)
+        if html is not None:
+            self._count('hits')
+            return html
+
+        html = self.shared.get(key) if self.shared is not None else None
+        if html is not None:
+            self._count('shared_hits')
+        else:
+            self._count('renders')
+            html = self.convert(text)
+            if self.shared is not None:
+                self.shared.set(key, html, f'html-{RENDER_VERSION}')
+        with self._lock:
+            try:
+                self._memo[key] = html
+            except ValueError:  # a single document larger than the whole memo
+                pass
+        return html
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
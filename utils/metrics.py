@@ -0,0 +1,113 @@
+"""
+Prometheus metrics and sampled per-request traces for the request hot path.
+
+Every request feeds the histograms and counters below; only a BLOODIQ_TRACE_SAMPLE fraction
+(default 1%) also writes a JSON trace line to the `bloodiq.trace` logger, so the per-request cost
+is a few perf_counter() calls and histogram observations. Under gunicorn, set
+PROMETHEUS_MULTIPROC_DIR to an empty directory so /metrics aggregates every worker.
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+)
+
+TRACE_SAMPLE_RATE = float(os.getenv('BLOODIQ_TRACE_SAMPLE', 0.01))
+
+trace_log = logging.getLogger('bloodiq.trace')
+
+STAGE_SECONDS = Histogram(
+    'bloodiq_stage_seconds', 'Time spent in each stage of a request', ['route', 'stage'],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+)
+LLM_SECONDS = Histogram(
+    'bloodiq_llm_call_seconds', 'Upstream LLM call latency', ['prompt_type', 'outcome'],
+    buckets=(.1, .25, .5, 1, 2, 4, 8, 15, 30, 60)
+)
+LLM_TOKENS = Counter('bloodiq_llm_tokens', 'LLM tokens used', ['prompt_type', 'direction'])
+LLM_RETRIES = Counter('bloodiq_llm_retries', 'LLM calls retried after a failure', ['reason'])
+LLM_QUEUE_SECONDS = Histogram(
+    'bloodiq_llm_queue_seconds', 'Time LLM calls waited for rate-limit budget', ['priority'],
+    buckets=(.001, .01, .05, .1, .25, .5, 1, 2.5, 5, 10, 30)
+)
+LLM_CIRCUIT_REJECTIONS = Counter('bloodiq_llm_circuit_rejections', 'LLM calls rejected by the open circuit breaker')
+LLM_COMBINED_MISSING = Counter(
+    'bloodiq_llm_combined_missing_sections', 'Sections absent or malformed in a combined response', ['section']
+)
+SECTIONS_REUSED = Counter(
+    'bloodiq_ai_sections_reused', "AI sections reused from a patient's previous result", ['section']
+)
+RULE_FALLBACKS = Counter(
+    'bloodiq_ai_sections_rule_fallback', 'AI sections replaced by rule-based advice after the LLM failed', ['section']
+)
+LLM_CACHE_EVENTS = Counter('bloodiq_llm_cache_events', 'LLM response cache outcomes', ['event'])
+
+
+def record_llm_call(prompt_type, seconds, response=None, error=None):
+    """Latency and, when the response carries usage_metadata, token counts of one upstream call"""
+    LLM_SECONDS.labels(prompt_type, 'error' if error is not None else 'ok').observe(seconds)
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is not None:
+        LLM_TOKENS.labels(prompt_type, 'prompt').inc(getattr(usage, 'prompt_token_count', 0) or 0)
+        LLM_TOKENS.labels(prompt_type, 'response').inc(getattr(usage, 'candidates_token_count', 0) or 0)
+
+
+def record_cache_event(event, n=1):
+    LLM_CACHE_EVENTS.labels(event).inc(n)
+
+
+class Trace:
+    """
+    Stage timings for one request. Stages always feed STAGE_SECONDS; a sampled trace also
+    accumulates them (a stage entered twice adds up) and logs one JSON line in finish().
+    Safe to add to from the LLM worker threads.
+    """
+
+    def __init__(self, route, sampled=None):
+        self.route = route
+        self.sampled = random.random() < TRACE_SAMPLE_RATE if sampled is None else sampled
+        self.stages = {}
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        STAGE_SECONDS.labels(self.route, name).observe(seconds)
+        if self.sampled:
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def finish(self, **fields):
+        """Record the request total; log the trace if sampled. `fields` are added to the log line."""
+        total = time.perf_counter() - self._start
+        STAGE_SECONDS.labels(self.route, 'total').observe(total)
+        if self.sampled:
+            with self._lock:
+                stages = {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()}
+            trace_log.info(json.dumps({
+                'route': self.route, 'total_ms': round(total * 1000, 3), 'stages_ms': stages, **fields
+            }))
+        return total
+
+
+def render_metrics():
+    """(body, content type) for /metrics; aggregates all workers in multiprocess mode"""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
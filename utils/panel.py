@@ -0,0 +1,220 @@
+"""
+One parse step from a request (form, JSON body or CSV row) to a Panel: the patient's demographics
+plus a float64 vector of age and marker values in PANEL_COLUMNS order with a missing-value mask.
+Values are validated once and converted to the units of utils.reference (e.g. glucose in mmol/L
+to mg/dL), so code downstream reads floats instead of casting form strings again.
+"""
+import math
+from collections.abc import Mapping
+
+import numpy as np
+
+from utils.reference import REFERENCE
+
+# Order of Panel.values and of the columns scored by the batch functions
+PANEL_COLUMNS = ('age',) + REFERENCE.markers
+_COLUMN_INDEX = {column: i for i, column in enumerate(PANEL_COLUMNS)}
+
+# Accepted units per marker and the factor converting each to the reference unit (listed first)
+UNIT_FACTORS = {
+    'albumin': {'g/dL': 1.0, 'g/L': 0.1},
+    'glucose': {'mg/dL': 1.0, 'mmol/L': 18.016},
+    'crp': {'mg/L': 1.0, 'mg/dL': 10.0},
+    'lymph_pct': {'%': 1.0},
+    'mcv': {'fL': 1.0},
+    'rdw': {'%': 1.0},
+    'wbc': {'K/µL': 1.0, '10^9/L': 1.0, '10^3/µL': 1.0},
+    'alk_phos': {'U/L': 1.0, 'µkat/L': 60.0},
+    'creatinine': {'mg/dL': 1.0, 'µmol/L': 1 / 88.42},
+}
+
+# Form names that differ from the user_data keys
+DEMOGRAPHIC_ALIASES = {'height_cm': ('height_cm', 'height'), 'weight_kg': ('weight_kg', 'weight')}
+
+
+def _unit_key(unit):
+    # 'umol/L', 'µmol/L' (micro sign) and 'μmol/L' (Greek mu) are the same unit
+    return str(unit).strip().lower().replace('µ', 'u').replace('μ', 'u')
+
+
+_FACTORS = {marker: {_unit_key(unit): factor for unit, factor in units.items()} for marker, units in UNIT_FACTORS.items()}
+_UNIT_FIELDS = tuple((marker, f'{marker}_unit') for marker in REFERENCE.markers)
+
+
+class PanelError(ValueError):
+    """A submitted panel failed validation; `errors` maps each bad field to a message"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__('; '.join(f"{field}: {message}" for field, message in errors.items()))
+
+
+class Panel(Mapping):
+    """
+    Read-only mapping of 'age' and every present marker to its float value, in PANEL_COLUMNS
+    order, so it can stand in wherever a biomarker dict was accepted. `values` is the float64
+    vector (NaN where missing) and `missing` its mask; both are read-only.
+    """
+
+    __slots__ = ('values', 'missing', 'sex', 'height_cm', 'weight_kg', '_floats', '_present')
+
+    def __init__(self, values, sex=None, height_cm=None, weight_kg=None):
+        values = np.array(values, dtype=np.float64)
+        if values.shape != (len(PANEL_COLUMNS),):
+            raise ValueError(f"Expected {len(PANEL_COLUMNS)} values in PANEL_COLUMNS order")
+        missing = np.isnan(values)
+        values.flags.writeable = missing.flags.writeable = False
+        self.values, self.missing = values, missing
+        self.sex, self.height_cm, self.weight_kg = sex, height_cm, weight_kg
+        self._floats = values.tolist()
+        self._present = tuple(column for column, value in zip(PANEL_COLUMNS, self._floats) if value == value)
+
+    @property
+    def age(self):
+        return None if self.missing[0] else self._floats[0]
+
+    @property
+    def marker_values(self):
+        """Marker vector in REFERENCE.markers order, as ReferenceTable.values() returns it"""
+        return self.values[1:]
+
+    def __getitem__(self, column):
+        i = _COLUMN_INDEX[column]
+        if self.missing[i]:
+            raise KeyError(column)
+        return self._floats[i]
+
+    def __iter__(self):
+        return iter(self._present)
+
+    def __len__(self):
+        return len(self._present)
+
+    def __repr__(self):
+        return f"Panel({dict(self)!r}, sex={self.sex!r})"
+
+
+def marker_values(biomarkers):
+    """Marker vector of a Panel without copying, or of a biomarker dict via REFERENCE.values"""
+    if isinstance(biomarkers, Panel):
+        return biomarkers.marker_values
+    return REFERENCE.values(biomarkers)
+
+
+def _number(field, raw, errors):
+    """Float from a form/JSON/CSV value; None when blank, and recorded in `errors` when invalid"""
+    if raw is None or raw == '':
+        return None
+    if isinstance(raw, bool):  # float(True) is 1.0; a JSON true is not a measurement
+        errors[field] = f"not a number: {raw!r}"
+        return None
+    try:
+        value = float(raw)
+    except (TypeError, ValueError):
+        if not str(raw).strip():
+            return None
+        errors[field] = f"not a number: {raw!r}"
+        return None
+    if not 0 <= value < math.inf:
+        if value != value:  # NaN: treated as missing, like a blank
+            return None
+        errors[field] = f"out of range: {raw!r}"
+        return None
+    return value
+
+
+def parse_panel(source, units=None, required=('age',)):
+    """
+    Panel from a form, JSON object or CSV row. Markers are read from `source['biomarkers']`
+    when present, else from `source` itself; a marker's unit comes from `units[marker]` or a
+    '<marker>_unit' field and defaults to the reference unit. Blank markers are missing;
+    invalid values, unknown units, blank `required` fields and 'biomarkers' or 'units' that are
+    not objects raise PanelError.
+    """
+    if hasattr(source, 'to_dict'):
+        source = source.to_dict()  # request.form: MultiDict lookups cost several times a dict's
+    markers = source.get('biomarkers') or source
+    units = units or source.get('units') or {}
+    errors = {field: "must be an object" for field, value in (('biomarkers', markers), ('units', units))
+              if not isinstance(value, Mapping)}
+    if errors:
+        raise PanelError(errors)
+
+    values = [_number('age', source.get('age', markers.get('age')), errors)]
+    for marker, unit_field in _UNIT_FIELDS:
+        value = _number(marker, markers.get(marker), errors)
+        unit = units.get(marker) or markers.get(unit_field)
+        if value is not None and unit:
+            factor = _FACTORS[marker].get(_unit_key(unit))
+            if factor is None:
+                errors[f'{marker}_unit'] = f"unsupported unit {unit!r}; use one of {', '.join(UNIT_FACTORS[marker])}"
+            else:
+                value *= factor
+        values.append(value)
+
+    demographics = {}
+    for name, aliases in DEMOGRAPHIC_ALIASES.items():
+        raw = None
+        for alias in aliases:
+            raw = source.get(alias)
+            if raw is not None:
+                break
+        demographics[name] = _number(name, raw, errors)
+    present = {'age': values[0], 'sex': source.get('sex') or None, **demographics}
+    for field in required:
+        if present.get(field) is None and field not in errors:
+            errors[field] = "required"
+    if errors:
+        raise PanelError(errors)
+
+    return Panel([np.nan if value is None else value for value in values], present['sex'], **demographics)
+
+
+def user_data_for(panel, phenotypic_age=None):
+    """The user_data dict the prompts, history and templates read, with `panel` as its biomarkers"""
+    return {
+        "age": None if panel.age is None else int(panel.age),
+        "sex": panel.sex,
+        "height_cm": panel.height_cm,
+        "weight_kg": panel.weight_kg,
+        "biomarkers": panel,
+        "phenotypic_age": phenotypic_age
+    }
+
+
+def _to_float_column(column):
+    """Numeric view of one column; blanks, None and non-numeric strings become NaN"""
+    column = np.asarray(column)
+    if column.dtype.kind in 'fiub':
+        return column.astype(np.float64, copy=False)
+    try:
+        return column.astype(np.float64)
+    except (ValueError, TypeError):
+        out = np.full(column.shape, np.nan)
+        for i, value in enumerate(column):
+            try:
+                out[i] = float(value)
+            except (ValueError, TypeError):
+                pass
+        return out
+
+
+def parse_columns(columns):
+    """
+    (N x PANEL_COLUMNS) matrix from a columnar mapping (dict of lists, DataFrame...), converting
+    markers that come with a '<marker>_unit' column to reference units. Bulk input is lenient:
+    non-numeric, negative and unknown-unit values become NaN (missing) instead of raising.
+    """
+    matrix = np.column_stack([_to_float_column(columns[column]) for column in PANEL_COLUMNS])
+    matrix[matrix < 0] = np.nan
+    for marker, j in ((marker, _COLUMN_INDEX[marker]) for marker in REFERENCE.markers):
+        unit_column = f'{marker}_unit'
+        if unit_column not in columns:
+            continue
+        factors = {}
+        scale = np.array([
+            factors.setdefault(unit, 1.0 if not unit else _FACTORS[marker].get(_unit_key(unit), np.nan))
+            for unit in columns[unit_column]
+        ])
+        matrix[:, j] *= scale
+    return matrix
@@ -0,0 +1,293 @@
+"""
+Population percentiles of each marker and of biological age among peers of the same sex and age
+band. The index is built offline from a reference cohort (a CSV/Parquet file in the bulk format,
+or the panel history) into one sorted float32 segment per (metric, sex, age band), concatenated in
+a single .npy file that a small JSON manifest points into. Workers open it with mmap: the arrays
+live once in the OS page cache however many workers there are, and a lookup is a binary search
+that touches a few pages per metric.
+
+    python -m utils.percentiles build cohort.csv -o percentiles/
+    python -m utils.percentiles update percentiles/ --history history.sqlite
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+import numpy as np
+
+from utils.biological_age import calculate_biological_age_batch
+from utils.bulk_ingest import DEFAULT_CHUNK_SIZE, chunk_matrix, detect_format, iter_chunks
+from utils.panel import parse_columns
+from utils.reference import REFERENCE
+
+METRICS = REFERENCE.markers + ('biological_age',)
+
+AGE_BAND_YEARS = 10
+OLDEST_BAND = 90  # 90 and over share one band
+
+# A peer group needs this many reference rows; smaller ones fall back to a wider group
+MIN_GROUP_ROWS = 100
+
+ALL = 'all'
+MANIFEST = 'manifest.json'
+FORMAT_VERSION = 1
+
+# Seconds between checks for a rebuilt index
+RELOAD_INTERVAL = 30.0
+
+# One loaded index: the manifest, the mmap of the values file it names and the manifest's mtime.
+# A reload swaps the whole snapshot in one assignment, so readers never pair a new manifest with
+# the old values file
+Snapshot = namedtuple('Snapshot', 'manifest values mtime')
+
+
+def sex_group(sex):
+    """'male', 'female' or None from whatever the form, API or cohort file carries"""
+    sex = str(sex or '').strip().lower()
+    return 'male' if sex in ('m', 'male') else 'female' if sex in ('f', 'female') else None
+
+
+def age_bands(ages):
+    """Band label ('40-49', '90+') per age; None where the age is missing"""
+    ages = np.asarray(ages, dtype=np.float64)
+    starts = (np.minimum(ages, OLDEST_BAND) // AGE_BAND_YEARS * AGE_BAND_YEARS).tolist()
+    return [
+        None if start != start else '90+' if start >= OLDEST_BAND else f"{int(start)}-{int(start) + AGE_BAND_YEARS - 1}"
+        for start in starts
+    ]
+
+
+def _group_keys(sex, band):
+    """Peer groups from the narrowest to the widest: (sex, band), (all, band), (all, all)"""
+    keys = []
+    if sex and band:
+        keys.append(f"{sex}|{band}")
+    if band:
+        keys.append(f"{ALL}|{band}")
+    keys.append(f"{ALL}|{ALL}")
+    return keys
+
+
+class PercentileIndex:
+    """Read-only, memory-mapped percentile index; reopened when `update` replaces it on disk"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._checked = 0.0
+        self._snapshot = self._load()
+
+    def _load(self):
+        manifest_path = os.path.join(self.path, MANIFEST)
+        mtime = os.stat(manifest_path).st_mtime_ns
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest['version'] != FORMAT_VERSION:
+            raise ValueError(f"Percentile index format {manifest['version']}, expected {FORMAT_VERSION}")
+        # A plain ndarray view of the mapping: slicing np.memmap costs several times more
+        values = np.load(os.path.join(self.path, manifest['values']), mmap_mode='r').view(np.ndarray)
+        return Snapshot(manifest, values, mtime)
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked < RELOAD_INTERVAL:
+            return
+        with self._lock:
+            self._checked = now
+            if os.stat(os.path.join(self.path, MANIFEST)).st_mtime_ns != self._snapshot.mtime:
+                self._snapshot = self._load()
+
+    @property
+    def manifest(self):
+        return self._snapshot.manifest
+
+    @property
+    def values(self):
+        return self._snapshot.values
+
+    @property
+    def rows(self):
+        return self.manifest['rows']
+
+    def peer_group(self, sex, band, snapshot=None):
+        """Narrowest group with at least MIN_GROUP_ROWS reference rows, e.g. 'male|40-49'"""
+        groups = (snapshot or self._snapshot).manifest['groups']
+        return next(key for key in _group_keys(sex, band) if groups.get(key, 0) >= MIN_GROUP_ROWS
+                    or key == f"{ALL}|{ALL}")
+
+    def segment(self, metric, group, snapshot=None):
+        """Sorted reference values of `metric` in `group` (an mmap view), or None"""
+        snapshot = snapshot or self._snapshot
+        found = snapshot.manifest['segments'].get(f"{metric}|{group}")
+        if found is None:
+            return None
+        offset, length = found
+        return snapshot.values[offset:offset + length]
+
+    def lookup(self, matrix, biological_ages, sexes):
+        """
+        (percentiles, groups) for N panels: a (N x len(METRICS)) array of percentiles in 0-100,
+        NaN where the value is missing or the group has no reference values, and each panel's
+        peer group. `matrix` is in PANEL_COLUMNS order. A value's percentile is the share of
+        reference values below it, counting ties as half. The whole lookup reads one snapshot, so a
+        concurrent reload cannot mix two versions of the index.
+        """
+        self._maybe_reload()
+        snapshot = self._snapshot
+        values = np.column_stack([matrix[:, 1:], biological_ages]).astype(np.float32)
+        groups = [self.peer_group(sex_group(sex), band, snapshot) for sex, band in zip(sexes, age_bands(matrix[:, 0]))]
+        out = np.full(values.shape, np.nan)
+        rows_by_group = {}
+        for i, group in enumerate(groups):
+            rows_by_group.setdefault(group, []).append(i)
+        for group, rows in rows_by_group.items():
+            block = values[rows]
+            result = np.full(block.shape, np.nan)
+            for j, metric in enumerate(METRICS):
+                segment = self.segment(metric, group, snapshot)
+                if segment is not None and len(segment):
+                    column = block[:, j]
+                    result[:, j] = (segment.searchsorted(column, 'left') + segment.searchsorted(column, 'right')) \
+                        * (50.0 / len(segment))
+            result[np.isnan(block)] = np.nan
+            out[rows] = result
+        return out, groups
+
+    def panel_percentiles(self, panel, biological_age=None):
+        """{metric: percentile rounded to 0.1, or None} for one Panel, plus 'peer_group' and its 'peer_label'"""
+        percentiles, groups = self.lookup(panel.values[None, :], [np.nan if biological_age is None else biological_age],
+                                          [panel.sex])
+        result = {metric: None if p != p else round(p, 1) for metric, p in zip(METRICS, percentiles[0].tolist())}
+        result['peer_group'], result['peer_label'] = groups[0], describe_group(groups[0])
+        return result
+
+
+def describe_group(group):
+    """'male|40-49' -> 'men aged 40-49', for display"""
+    sex, band = group.split('|')
+    who = {'male': 'men', 'female': 'women'}.get(sex, 'adults')
+    return who if band == ALL else f"{who} aged {band}"
+
+
+# -- building ------------------------------------------------------------------------------------
+
+def cohort_chunks(path, fmt=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """(matrix, biological ages, sexes) per chunk of a cohort file in the bulk-ingest format"""
+    fmt = fmt or detect_format(path)
+    with open(path, 'rb') as source:
+        for rows in iter_chunks(source, fmt, chunk_size):
+            matrix = chunk_matrix(rows)
+            yield matrix, calculate_biological_age_batch(matrix), [row.get('sex') for row in rows]
+
+
+def history_chunks(store, after_id=0, chunk_size=100000):
+    """(matrix, biological ages, sexes, last panel id) per chunk of panels stored after `after_id`"""
+    for chunk in store.iter_columns(after_id, chunk_size):
+        matrix = parse_columns(chunk)
+        ages = np.array([np.nan if age is None else age for age in chunk['biological_age']], dtype=np.float64)
+        yield matrix, ages, chunk['sex'], chunk['id'][-1]
+
+
+def _grouped_columns(chunks):
+    """{metric|group: [arrays]} of the non-missing values in `chunks`, for every peer-group level"""
+    parts, counts = {}, {}
+    for matrix, biological_ages, sexes in chunks:
+        values = np.column_stack([matrix[:, 1:], biological_ages]).astype(np.float32)
+        labels = np.array([f"{sex_group(sex) or ''}|{band or ''}" for sex, band in zip(sexes, age_bands(matrix[:, 0]))])
+        for label in np.unique(labels).tolist():
+            rows = labels == label
+            sex, band = label.split('|')
+            for group in _group_keys(sex or None, band or None):
+                counts[group] = counts.get(group, 0) + int(rows.sum())
+                for j, metric in enumerate(METRICS):
+                    column = values[rows, j]
+                    parts.setdefault(f"{metric}|{group}", []).append(column[~np.isnan(column)])
+    return parts, counts
+
+
+def build(chunks, path, base=None, **manifest_fields):
+    """
+    Write an index of `chunks` ((matrix, biological ages, sexes) tuples) to directory `path`,
+    merged with the existing PercentileIndex `base` when given. The new values file is written
+    under a fresh name and the manifest replaced last, so open indexes keep reading the old one.
+    """
+    parts, counts = _grouped_columns(chunks)
+    rows = counts.get(f"{ALL}|{ALL}", 0)
+    snapshot = base._snapshot if base is not None else None
+    if snapshot is not None:
+        rows += snapshot.manifest['rows']
+        for group, count in snapshot.manifest['groups'].items():
+            counts[group] = counts.get(group, 0) + count
+        for key in snapshot.manifest['segments']:
+            metric, group = key.split('|', 1)
+            parts.setdefault(key, []).insert(0, np.asarray(base.segment(metric, group, snapshot)))
+
+    os.makedirs(path, exist_ok=True)
+    segments, total = {}, 0
+    for key in sorted(parts):
+        length = sum(len(part) for part in parts[key])
+        segments[key] = [total, length]
+        total += length
+    name = f"values-{uuid.uuid4().hex[:12]}.npy"
+    out = np.lib.format.open_memmap(os.path.join(path, name), mode='w+', dtype=np.float32, shape=(total,))
+    for key, (offset, length) in segments.items():
+        # The base segment is sorted already, so the stable sort (timsort) mostly merges runs
+        out[offset:offset + length] = np.sort(np.concatenate(parts[key]), kind='stable')
+    out.flush()
+    del out
+
+    old = snapshot.manifest['values'] if snapshot is not None else None
+    manifest = dict(snapshot.manifest if snapshot is not None else {}, **manifest_fields)
+    manifest.update(version=FORMAT_VERSION, values=name, rows=rows, groups=counts, segments=segments,
+                    built_at=time.time())
+    tmp = os.path.join(path, MANIFEST + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp, os.path.join(path, MANIFEST))
+    if old and old != name:
+        os.remove(os.path.join(path, old))  # open mmaps keep the old file readable until they close
+    return PercentileIndex(path)
+
+
+def update_from_history(path, store, chunk_size=100000):
+    """Merge panels stored since the last update into the index at `path` (created if absent)"""
+    base = PercentileIndex(path) if os.path.exists(os.path.join(path, MANIFEST)) else None
+    after_id = base.manifest.get('history_through', 0) if base is not None else 0
+    chunks, last_id = [], after_id
+    for matrix, ages, sexes, last_id in history_chunks(store, after_id, chunk_size):
+        chunks.append((matrix, ages, sexes))
+    if not chunks and base is not None:
+        return base
+    return build(chunks, path, base, history_through=last_id)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or update the biomarker percentile index")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_parser = commands.add_parser('build', help="index a reference cohort file (CSV or Parquet)")
+    build_parser.add_argument('input')
+    build_parser.add_argument('-o', '--output', required=True, help="index directory")
+    build_parser.add_argument('--format', choices=('csv', 'parquet'))
+    build_parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    update_parser = commands.add_parser('update', help="merge panels stored in the history since the last update")
+    update_parser.add_argument('index')
+    update_parser.add_argument('--history', required=True, help="BLOODIQ_HISTORY_PATH database")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if args.command == 'build':
+        index = build(cohort_chunks(args.input, args.format, args.chunk_size), args.output, source=args.input)
+    else:
+        from utils.history_store import HistoryStore
+        index = update_from_history(args.index, HistoryStore(args.history))
+    print(f"✅ {index.rows:,} reference rows, {len(index.manifest['segments']):,} segments "
+          f"in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
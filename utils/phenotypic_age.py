@@ -1,52 +1,58 @@
+"""
+Levine PhenoAge (Levine et al., Aging 2018): a Gompertz mortality model on age and nine blood
+markers, converted back to the age with the same expected mortality. Inputs are in the model's
+units (albumin g/L, creatinine µmol/L, glucose mmol/L, CRP mg/dL, ALP U/L, WBC 10^3/µL), so
+callers convert from utils.reference units first; utils.aging_clocks does that once per panel.
+"""
+import math
+
 import numpy as np
 
-def calculate_biological_age(biomarkers):
+# Coefficients of the linear predictor, per model-unit input
+INTERCEPT = -19.9067
+COEFFICIENTS = {
+    'age': 0.0804,
+    'albumin': -0.0336,
+    'creatinine': 0.0095,
+    'glucose': 0.1953,
+    'log_crp': 0.0954,
+    'lymph_pct': -0.0120,
+    'mcv': 0.0268,
+    'rdw': 0.3306,
+    'alk_phos': 0.00188,
+    'wbc': 0.0554,
+}
+GAMMA = 0.0076927
+HORIZON_MONTHS = 120
+
+# CRP below the assay's detection limit would send ln(CRP) to -inf; it is read as this (mg/dL)
+CRP_FLOOR_MG_DL = 0.01
+
+_CUMULATIVE_HAZARD = (math.exp(HORIZON_MONTHS * GAMMA) - 1) / GAMMA
+
+
+def linear_predictor(inputs):
+    """xb from a mapping of the COEFFICIENTS' names to arrays (or floats); 'log_crp' is ln(CRP mg/dL)"""
+    xb = INTERCEPT
+    for name, coefficient in COEFFICIENTS.items():
+        xb = xb + coefficient * inputs[name]
+    return xb
+
+
+def mortality_score(xb):
+    """10-year mortality risk, M = 1 - exp(-exp(xb) (exp(120 γ) - 1) / γ)"""
+    return 1 - np.exp(-np.exp(xb) * _CUMULATIVE_HAZARD)
+
+
+def phenotypic_age_from_predictor(xb):
     """
-    Calculates biological age based on blood work markers and their optimal ranges
+    141.50225 + ln(-0.00553 ln(1 - M)) / 0.090165. Since ln(1 - M) is -exp(xb) times the
+    cumulative hazard, this is linear in xb; computed that way it neither loses precision when M
+    is tiny nor overflows to inf when M rounds to 1.
     """
-    try:
-        age = float(biomarkers['age'])
-        albumin = float(biomarkers['albumin'])
-        creatinine = float(biomarkers['creatinine'])
-        glucose = float(biomarkers['glucose'])
-        crp = float(biomarkers['crp'])
-        lymph_pct = float(biomarkers['lymph_pct'])
-        mcv = float(biomarkers['mcv'])
-        rdw = float(biomarkers['rdw'])
-        alk_phos = float(biomarkers['alk_phos'])
-        wbc = float(biomarkers['wbc'])
-
-        # Define optimal ranges and calculate deviations
-        deviations = [
-            (albumin, 4.3, 5.2),      # weight: 2.0
-            (glucose, 70, 90),        # weight: 1.5
-            (crp, 0, 1),             # weight: 1.5
-            (lymph_pct, 20, 40),     # weight: 1.0
-            (mcv, 80, 96),           # weight: 1.0
-            (rdw, 11.5, 14.5),       # weight: 1.0
-            (wbc, 4.5, 10),          # weight: 1.0
-            (alk_phos, 44, 147),     # weight: 0.5
-            (creatinine, 0.6, 1.2)   # weight: 0.5
-        ]
-
-        weights = [2.0, 1.5, 1.5, 1.0, 1.0, 1.0, 1.0, 0.5, 0.5]
-        total_deviation = 0
-        total_weight = sum(weights)
-
-        for (value, min_val, max_val), weight in zip(deviations, weights):
-            optimal = (min_val + max_val) / 2
-            deviation = abs(value - optimal) / optimal
-            total_deviation += deviation * weight
-
-        # Calculate biological age adjustment
-        avg_deviation = total_deviation / total_weight
-        age_adjustment = avg_deviation * 10  # Scale factor for age impact
-        
-        biological_age = age + (age_adjustment if avg_deviation > 0.1 else -age_adjustment)
-        biological_age = max(0, min(biological_age, 120))
-
-        return round(biological_age, 1)
-
-    except (ValueError, TypeError) as e:
-        print(f"Error calculating biological age: {str(e)}")
-        return None
+    return 141.50225 + (xb + math.log(0.00553 * _CUMULATIVE_HAZARD)) / 0.090165
+
+
+def phenotypic_age(inputs):
+    """PhenoAge from model-unit inputs (see linear_predictor); NaN wherever an input is NaN"""
+    return phenotypic_age_from_predictor(linear_predictor(inputs))
@@ -1,87 +1,250 @@
-def generate_prompt(user_data, prompt_type="analysis"):
-    base_info = f"""Patient Info:
-- Age: {user_data['age']} (Biological Age: {user_data.get('phenotypic_age', 'N/A')})
-- Sex: {user_data['sex']}
-- Height: {user_data['height_cm']} cm
-- Weight: {user_data['weight_kg']} kg
-
-Blood Panel Results:
-{chr(10).join([f'- {marker}: {value}' for marker, value in user_data['biomarkers'].items()])}"""
-
-    prompts = {
-        "analysis": f"""You are an expert health analyst interpreting blood test results. 
-First, note that this person's calculated biological age is {user_data.get('phenotypic_age')} years 
-compared to their chronological age of {user_data['age']} years. 
-Include this in your analysis and what it might mean for their health.
-
-Provide a clear, structured analysis using this format:
-
-🎯 SUMMARY
-• Start with biological age comparison and what it means
-• Give 2-3 sentence overview of general health indicators
-• Mention if any values are notably good or concerning
-
-📊 KEY FINDINGS
-• List 3-4 most important observations
-• Compare values to normal ranges where relevant
-• Use everyday language, not medical jargon
-
-💡 PRACTICAL RECOMMENDATIONS
-• Suggest 3-4 specific lifestyle or dietary changes
-• Keep suggestions realistic and actionable
-• Base recommendations on the actual blood values
-
-{base_info}""",
-
-        "meal_plan": f"""As a nutrition expert, create a personalized 3-day meal plan based on this blood panel:
-
-{base_info}
-
-Consider:
-- Foods that could help improve any out-of-range values
-- The person's age and weight
-- Include specific portions and timing
-- Focus on practical, everyday foods
-- Include scientific reasoning for key recommendations
-
-Format as a clear, day-by-day plan with meals and snacks.""",
-
-        "exercise_plan": f"""As a fitness expert, create a personalized exercise plan based on this health profile:
-
-{base_info}
-
-Consider:
-- Current health markers and any limitations they suggest
-- Age-appropriate activities
-- Progressive difficulty
-- Mix of cardio and strength training
-- Recovery recommendations
+import os
+
+from utils.llm_client import estimate_tokens
+from utils.panel import marker_values
+from utils.reference import ABOVE, BELOW, NORMAL, OPTIMAL, OUTSIDE_RANGE, REFERENCE
+
+# Bump whenever the prompt templates below change so cached responses keyed on the old wording
+# stop being served (see utils.llm_cache)
+PROMPT_TEMPLATE_VERSION = 2
+
+# What each prompt type's advice actually depends on, for utils.incremental: a section is only
+# regenerated when one of these changes materially. Markers change materially when their range
+# status flips or they move by more than MARKER_BUCKET_FRACTION of their normal range; each
+# demographic maps to the bucket width it is compared at (None: any change counts).
+MARKER_BUCKET_FRACTION = 0.1
+PROMPT_DEPENDENCIES = {
+    "analysis": {
+        "markers": REFERENCE.markers,
+        "demographics": {"age": 1, "sex": None, "phenotypic_age": 1}
+    },
+    "meal_plan": {
+        "markers": ("glucose", "crp", "albumin", "alk_phos", "creatinine"),
+        "demographics": {"age": 5, "sex": None, "weight_kg": 2}
+    },
+    "exercise_plan": {
+        "markers": ("glucose", "crp", "wbc", "mcv", "rdw", "creatinine"),
+        "demographics": {"age": 5, "sex": None, "height_cm": 5, "weight_kg": 2}
+    },
+    "supplement_advice": {
+        "markers": ("albumin", "glucose", "crp", "lymph_pct", "mcv", "rdw", "wbc", "alk_phos"),
+        "demographics": {"age": 5, "sex": None}
+    },
+    "risk_assessment": {
+        "markers": REFERENCE.markers,
+        "demographics": {"age": 1, "sex": None, "weight_kg": 2, "phenotypic_age": 1}
+    }
+}
+
+# Each prompt type's task line and instructions; the patient block goes between them. Marker
+# statuses are precomputed, so the instructions do not ask the model to compare against ranges.
+PROMPT_TEMPLATES = {
+    "analysis": (
+        "You are an expert health analyst interpreting a blood panel for the patient, in everyday language.",
+        """Biological age {phenotypic_age} vs chronological age {age}: say what the difference means.
+
+Use this format:
+🎯 SUMMARY: the biological age comparison, then 2-3 sentences on overall health; note values that are notably good or concerning
+📊 KEY FINDINGS: the 3-4 most important observations
+💡 PRACTICAL RECOMMENDATIONS: 3-4 realistic, specific lifestyle or dietary changes based on the values"""
+    ),
+    "meal_plan": (
+        "As a nutrition expert, create a personalized 3-day meal plan for this patient.",
+        """Target the out-of-range and below-optimal markers, suit the patient's age and weight, use everyday foods with portions and timing, and briefly give the reasoning for key choices.
+Format it day by day with meals and snacks."""
+    ),
+    "exercise_plan": (
+        "As a fitness expert, create a personalized weekly exercise plan for this patient.",
+        """Respect any limitations the markers suggest and the patient's age, progress gradually, mix cardio and strength training, and include recovery.
+Give each day's exercises, durations and intensities."""
+    ),
+    "supplement_advice": (
+        "As a nutrition scientist, recommend evidence-based supplements for this patient.",
+        """In order of importance, for each: the marker it addresses, dosage and timing, and interactions or contraindications.
+Separate essential nutrients from optional supplements."""
+    ),
+    "risk_assessment": (
+        "As a preventive health specialist, assess this patient's health risks.",
+        """Cover: current risk factors from the markers; long-term implications if not addressed; early warning signs; preventive measures by priority; which tests to repeat and when."""
+    )
+}
+
+COMBINED_PROMPT_TYPE = "combined"
+
+
+def _token_limits(setting, defaults):
+    """{prompt type: tokens} from `defaults` overridden by a "type=N,type=N" setting; 0 means no limit"""
+    limits = dict(defaults)
+    for part in filter(None, (setting or '').split(',')):
+        prompt_type, _, tokens = part.partition('=')
+        limits[prompt_type.strip()] = int(tokens)
+    return {prompt_type: tokens for prompt_type, tokens in limits.items() if tokens}
+
+
+# Estimated prompt tokens (utils.llm_client.estimate_tokens) per prompt type. Optimal markers are
+# condensed to their names on one line, least relevant first, until the prompt fits; markers that
+# are out of range or short of optimal are what the advice targets, so they are always listed in
+# full, even over budget.
+PROMPT_TOKEN_BUDGETS = _token_limits(os.getenv('BLOODIQ_PROMPT_BUDGETS'), {
+    "analysis": 200,
+    "meal_plan": 135,
+    "exercise_plan": 135,
+    "supplement_advice": 130,
+    "risk_assessment": 135,
+    COMBINED_PROMPT_TYPE: 520,
+})
+
+# Optional cap on response tokens per prompt type (generation_config max_output_tokens); the
+# prompt also asks for a matching length so answers are not cut off mid-sentence
+OUTPUT_TOKEN_LIMITS = _token_limits(os.getenv('BLOODIQ_OUTPUT_TOKENS'), {})
+
+_STATUS_LABELS = {BELOW: "LOW", ABOVE: "HIGH"}
+
+
+def _format_value(value):
+    # Parsed panels hold floats; print 90.0 as 90 like the submitted form did
+    return f'{value:g}' if isinstance(value, float) else value
+
+
+def _range_text(low, high):
+    return f"{_format_value(low)}-{_format_value(high)}"
+
+
+# Per marker: unit, "(normal low-high)", "optimal low-high", optimal low, normal low and width
+_MARKER_TEXT = tuple(
+    (unit, f"(normal {_range_text(low, high)})", f"optimal {_range_text(optimal_low, optimal_high)}",
+     optimal_low, low, high - low)
+    for unit, low, high, optimal_low, optimal_high in zip(
+        REFERENCE.units, REFERENCE.low.tolist(), REFERENCE.high.tolist(), REFERENCE.optimal_low.tolist(),
+        REFERENCE.optimal_high.tolist())
+)
+
+
+def _marker_entries(biomarkers, relevant):
+    """
+    (marker, text, status) per marker with a value, in priority order: out of range (furthest
+    first), then relevant below-optimal, relevant optimal and the other markers
+    """
+    values = marker_values(biomarkers)
+    health = REFERENCE.health_status(values).tolist()
+    ranges = REFERENCE.range_status(values).tolist()
+
+    entries = []
+    for i, (marker, value) in enumerate(zip(REFERENCE.markers, values.tolist())):
+        if value != value:
+            continue
+        unit, normal_range, optimal_range, optimal_low, low, width = _MARKER_TEXT[i]
+        status = health[i]
+        text = f"{marker} {_format_value(value)} {unit}"
+        if status == OUTSIDE_RANGE:
+            text += f" {_STATUS_LABELS[ranges[i]]} {normal_range}"
+            # Furthest outside the range, in range widths, first
+            rank = (0, -(value - low - width if ranges[i] == ABOVE else low - value) / width)
+        elif status == NORMAL:
+            text += f" normal, {'below' if value < optimal_low else 'above'} {optimal_range}"
+            rank = (1 if marker in relevant else 3, i)
+        else:
+            rank = (2 if marker in relevant else 4, i)
+        entries.append((rank, marker, text, status))
+    entries.sort()
+    return [(marker, text, status) for _, marker, text, status in entries]
+
+
+def _patient_line(user_data):
+    about = [f"{user_data['age']} y"]
+    if user_data.get('phenotypic_age') is not None:
+        about[0] += f" (biological {user_data['phenotypic_age']})"
+    about += [f"{_format_value(user_data[key])}{unit}" for key, unit in (('sex', ''), ('height_cm', ' cm'),
+                                                                        ('weight_kg', ' kg'))
+              if user_data.get(key) is not None]
+    return f"Patient: {', '.join(about)}"
+
+
+def _patient_block(patient_line, entries, condensed):
+    """The patient line and markers; those in `condensed` are reduced to their names"""
+    lines = [patient_line, "Markers, most urgent first:"]
+    optimal, names = [], []
+    for marker, text, status in entries:
+        if marker in condensed:
+            names.append(marker)
+        elif status == OPTIMAL:
+            optimal.append(text)
+        else:
+            lines.append(f"- {text}")
+    if optimal:
+        lines.append(f"Optimal: {', '.join(optimal)}")
+    if names:
+        lines.append(f"Also optimal: {', '.join(names)}")
+    return '\n'.join(lines)
+
+
+def _fit(render, user_data, relevant, budget):
+    """
+    render(patient_block) with the patient block compacted until the prompt's estimated tokens
+    fit `budget` (None: no limit): optimal markers are condensed lowest priority first
+    """
+    entries, patient_line = _marker_entries(user_data['biomarkers'], relevant), _patient_line(user_data)
+    prompt = render(_patient_block(patient_line, entries, ()))
+    if budget is None or estimate_tokens(prompt) <= budget:
+        return prompt
+    droppable = [marker for marker, _, status in reversed(entries) if status == OPTIMAL]
+
+    def condensed(count):
+        return render(_patient_block(patient_line, entries, set(droppable[:count])))
+
+    # Once one marker is condensed, each further one only shortens the prompt: binary search for
+    # the fewest that fit, or condense them all
+    low, high = 1, len(droppable)
+    while low < high:
+        middle = (low + high) // 2
+        if estimate_tokens(condensed(middle)) <= budget:
+            high = middle
+        else:
+            low = middle + 1
+    return condensed(low) if droppable else prompt
+
+
+def _length_hint(prompt_type):
+    limit = OUTPUT_TOKEN_LIMITS.get(prompt_type)
+    # ~0.75 words per token, less a margin for markdown
+    return f"\nKeep it under {int(limit * 0.7)} words." if limit else ""
+
+
+def _instructions(user_data, prompt_type):
+    task, instructions = PROMPT_TEMPLATES[prompt_type]
+    return task, instructions.format(age=user_data['age'], phenotypic_age=user_data.get('phenotypic_age')) \
+        + _length_hint(prompt_type)
 
-Provide a weekly plan with specific exercises, durations, and intensities.""",
 
-        "supplement_advice": f"""As a nutrition scientist, recommend evidence-based supplements based on these blood markers:
+def generate_prompt(user_data, prompt_type="analysis"):
+    prompt_type = prompt_type if prompt_type in PROMPT_TEMPLATES else "analysis"
+    task, instructions = _instructions(user_data, prompt_type)
+    return _fit(lambda patient: f"{task}\n\n{patient}\n\n{instructions}", user_data,
+                PROMPT_DEPENDENCIES[prompt_type]["markers"], PROMPT_TOKEN_BUDGETS.get(prompt_type))
 
-{base_info}
 
-For each recommendation:
-- Explain why it's needed based on the blood values
-- Specify dosage and timing
-- Note any interactions or contraindications
-- Prioritize by importance
-- Include both essential nutrients and optional supplements""",
+def generation_config(prompt_type):
+    """generation_config capping the response at OUTPUT_TOKEN_LIMITS[prompt_type], or None"""
+    limit = OUTPUT_TOKEN_LIMITS.get(prompt_type)
+    return {'max_output_tokens': limit} if limit else None
 
-        "risk_assessment": f"""As a preventive health specialist, analyze potential health risks based on:
 
-{base_info}
+def generate_combined_prompt(user_data, sections):
+    """
+    One prompt for several sections ({key: prompt_type}): the patient block is sent once, followed
+    by each section's own instructions, and the model answers with a JSON object keyed by `sections`
+    """
+    parts = []
+    for key, prompt_type in sections.items():
+        task, instructions = _instructions(user_data, prompt_type)
+        parts.append(f'### Field "{key}"\n{task}\n{instructions}')
+    relevant = {marker for prompt_type in sections.values() for marker in PROMPT_DEPENDENCIES[prompt_type]["markers"]}
 
-Provide:
-• Current risk factors based on blood values
-• Long-term health implications if not addressed
-• Early warning signs to watch for
-• Preventive measures prioritized by importance
-• Timeline for recommended follow-up tests"""
-    }
+    return _fit(lambda patient: f"""You are writing every section of one health report for the same patient.
 
-    return prompts.get(prompt_type, prompts["analysis"])
+{patient}
 
+Answer with a single JSON object whose fields are {", ".join(f'"{key}"' for key in sections)}.
+Each field is a string holding that section in Markdown, written by following its instructions below.
 
+{(chr(10) * 2).join(parts)}""", user_data, relevant, PROMPT_TOKEN_BUDGETS.get(COMBINED_PROMPT_TYPE))
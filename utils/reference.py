@@ -0,0 +1,122 @@
+"""
+Single source of biomarker reference data for the marker table, analyze_health and the
+biological-age model. Built once at import into read-only column arrays so a whole panel (or an
+N x markers matrix) is classified with one vectorized comparison.
+"""
+from types import MappingProxyType
+
+import numpy as np
+
+# marker, unit, normal range label, normal low/high, optimal low/high,
+# age-model low/high and weight (see utils.biological_age), description
+_REFERENCE_ROWS = (
+    ('albumin', 'g/dL', '3.4-5.4 g/dL', 3.4, 5.4, 4.3, 5.2, 4.3, 5.2, 2.0,
+     'Protein made by liver; low levels can indicate malnutrition or liver/kidney disease'),
+    ('glucose', 'mg/dL', '70-99 mg/dL', 70, 99, 70, 90, 70, 90, 1.5,
+     'Blood sugar level; high levels indicate diabetes risk or metabolic issues'),
+    ('crp', 'mg/L', '0-3.0 mg/L', 0, 3.0, 0, 1, 0, 1, 1.5,
+     'Inflammation marker; elevated levels indicate systemic inflammation'),
+    ('lymph_pct', '%', '20-40%', 20, 40, 25, 35, 20, 40, 1.0,
+     'Percentage of white blood cells that are lymphocytes; immune system indicator'),
+    ('mcv', 'fL', '80-100 fL', 80, 100, 85, 95, 80, 96, 1.0,
+     'Mean Corpuscular Volume; size of red blood cells, can indicate anemia type'),
+    ('rdw', '%', '11.5-14.5%', 11.5, 14.5, 12.0, 13.5, 11.5, 14.5, 1.0,
+     'Red Cell Distribution Width; variation in red blood cell size'),
+    ('wbc', 'K/µL', '4.5-11.0 K/µL', 4.5, 11.0, 5.0, 8.0, 4.5, 10, 1.0,
+     'White Blood Cell count; immune system activity indicator'),
+    ('alk_phos', 'U/L', '44-147 U/L', 44, 147, 50, 120, 44, 147, 0.5,
+     'Alkaline Phosphatase; enzyme related to liver and bone health'),
+    ('creatinine', 'mg/dL', '0.6-1.3 mg/dL', 0.6, 1.3, 0.7, 1.2, 0.6, 1.2, 0.5,
+     'Kidney function marker; filtered waste product from muscles'),
+)
+
+# Codes returned by ReferenceTable.range_status (marker table) and health_status (analyze_health)
+BELOW, WITHIN, ABOVE = -1, 0, 1
+OPTIMAL, NORMAL, OUTSIDE_RANGE, MISSING = 0, 1, 2, -1
+HEALTH_STATUS_NAMES = ('optimal', 'normal', 'outside_range')
+HEALTH_STATUS_SCORES = (100, 80, 50)
+
+
+def _frozen(values):
+    array = np.array(values, dtype=np.float64)
+    array.flags.writeable = False
+    return array
+
+
+class ReferenceTable:
+    """Immutable column-oriented reference ranges; column i of every array describes markers[i]"""
+
+    __slots__ = ('markers', 'index', 'units', 'range_labels', 'descriptions', 'low', 'high',
+                 'optimal_low', 'optimal_high', 'age_low', 'age_high', 'age_weights')
+
+    def __init__(self, rows):
+        columns = list(zip(*rows))
+        self.markers = columns[0]
+        self.index = MappingProxyType({marker: i for i, marker in enumerate(self.markers)})
+        self.units, self.range_labels = columns[1], columns[2]
+        self.low, self.high = _frozen(columns[3]), _frozen(columns[4])
+        self.optimal_low, self.optimal_high = _frozen(columns[5]), _frozen(columns[6])
+        self.age_low, self.age_high, self.age_weights = _frozen(columns[7]), _frozen(columns[8]), _frozen(columns[9])
+        self.descriptions = columns[10]
+
+    def values(self, biomarkers):
+        """Panel dict (form strings or numbers) -> float64 vector in marker order, NaN where missing"""
+        values = []
+        for marker in self.markers:
+            try:
+                values.append(float(biomarkers[marker]))
+            except (KeyError, ValueError, TypeError):
+                values.append(np.nan)
+        return np.array(values)
+
+    def range_status(self, values):
+        """BELOW/WITHIN/ABOVE the normal range for a vector or (N x markers) matrix; NaN reads as WITHIN"""
+        return (values > self.high).astype(np.int8) - (values < self.low).astype(np.int8)
+
+    def health_status(self, values):
+        """OPTIMAL/NORMAL/OUTSIDE_RANGE with inclusive bounds; NaN reads as OUTSIDE_RANGE"""
+        optimal = (values >= self.optimal_low) & (values <= self.optimal_high)
+        normal = (values >= self.low) & (values <= self.high)
+        return np.where(optimal, OPTIMAL, np.where(normal, NORMAL, OUTSIDE_RANGE)).astype(np.int8)
+
+
+REFERENCE = ReferenceTable(_REFERENCE_ROWS)
+
+
+def reference_table(sex=None, age=None):
+    """
+    Reference table for a patient. Ranges are not yet stratified, so every patient gets REFERENCE;
+    sex/age-specific tables would be built at import alongside it and selected here.
+    """
+    return REFERENCE
+
+
+# Per-marker views in the shapes app.get_marker_info and analyze_health return, built once
+MARKER_INFO = MappingProxyType({
+    marker: MappingProxyType({
+        'range': REFERENCE.range_labels[i],
+        'optimal': (REFERENCE.optimal_low[i].item(), REFERENCE.optimal_high[i].item()),
+        'unit': REFERENCE.units[i],
+        'description': REFERENCE.descriptions[i],
+        'thresholds': MappingProxyType({'low': REFERENCE.low[i].item(), 'high': REFERENCE.high[i].item()})
+    })
+    for i, marker in enumerate(REFERENCE.markers)
+})
+
+UNKNOWN_MARKER_INFO = MappingProxyType({
+    'range': 'N/A',
+    'optimal': (0, 0),
+    'unit': '',
+    'description': 'No reference data available',
+    'thresholds': MappingProxyType({'low': 0, 'high': 999999})
+})
+
+HEALTH_REFERENCE = MappingProxyType({
+    marker: MappingProxyType({
+        'range': (REFERENCE.low[i].item(), REFERENCE.high[i].item()),
+        'optimal': (REFERENCE.optimal_low[i].item(), REFERENCE.optimal_high[i].item()),
+        'unit': REFERENCE.units[i],
+        'description': REFERENCE.descriptions[i]
+    })
+    for i, marker in enumerate(REFERENCE.markers)
+})
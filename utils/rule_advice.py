@@ -0,0 +1,272 @@
+"""
+Deterministic advice for the five AI sections, built from the same per-marker classification as
+analyze_health (optimal / normal / outside range, plus which side of the range a value is on) and
+the biological-age delta. The rule table below is compiled at import into per-section tuples
+indexed by marker and direction, so advising on a panel costs two vectorized comparisons and a few
+string joins: microseconds, no network.
+
+Used as the instant first render while AI sections generate, as the fallback for a section the
+LLM fails or misses its deadline on, and on its own in the 'rules' AI mode.
+"""
+import math
+from html import escape
+
+from utils.llm_fanout import AI_SECTIONS, FALLBACK_TEXT
+from utils.panel import marker_values
+from utils.reference import HEALTH_STATUS_SCORES, NORMAL, OPTIMAL, OUTSIDE_RANGE, REFERENCE
+
+LOW, HIGH = 0, 1
+
+MARKER_LABELS = {
+    'albumin': 'Albumin', 'glucose': 'Glucose', 'crp': 'CRP', 'lymph_pct': 'Lymphocytes', 'mcv': 'MCV',
+    'rdw': 'RDW', 'wbc': 'White blood cells', 'alk_phos': 'Alkaline phosphatase', 'creatinine': 'Creatinine'
+}
+
+# Biological age this many years away from chronological age counts as ahead of or behind it
+AGE_DELTA_YEARS = 2.0
+
+# (marker, direction) -> what the value suggests, and one line per prompt type (absent: nothing to add)
+RULES = {
+    ('albumin', LOW): {
+        'finding': "lower protein reserves than ideal; can reflect diet, liver or kidney function",
+        'meal_plan': "Include a palm-sized portion of protein (fish, eggs, poultry, legumes, dairy) at every meal",
+        'exercise_plan': "Favour resistance training over long endurance sessions until protein intake is up",
+        'supplement_advice': "A protein supplement can close a dietary gap; ask your clinician first if you have kidney disease",
+        'risk_assessment': "Persistently low albumin is linked to frailty and slower recovery; a liver and kidney panel can find the cause",
+    },
+    ('albumin', HIGH): {
+        'finding': "higher than expected, which most often reflects dehydration at the time of the draw",
+        'meal_plan': "Drink water steadily through the day, more on hot days and around exercise",
+        'exercise_plan': "Rehydrate during and after training sessions",
+        'risk_assessment': "Retest when well hydrated before reading much into this value",
+    },
+    ('glucose', LOW): {
+        'finding': "lower than the normal fasting range; can cause shakiness, fatigue or poor concentration",
+        'meal_plan': "Eat regular meals that combine complex carbohydrates with protein; avoid long gaps without food",
+        'exercise_plan': "Have a carbohydrate snack before longer or intense workouts",
+        'risk_assessment': "Repeated low glucose should be reviewed with a clinician, especially if you take glucose-lowering medication",
+    },
+    ('glucose', HIGH): {
+        'finding': "higher blood sugar than ideal, an early sign of reduced insulin sensitivity",
+        'meal_plan': "Swap refined carbohydrates and sugary drinks for whole grains, legumes and vegetables; pair carbohydrates with protein",
+        'exercise_plan': "Walk for 10-15 minutes after meals; muscles take up glucose most readily after eating",
+        'supplement_advice': "Ask your clinician whether soluble fibre such as psyllium suits you; it slows glucose absorption",
+        'risk_assessment': "Sustained high glucose raises the risk of type 2 diabetes and heart disease; an HbA1c test shows the longer trend",
+    },
+    ('crp', HIGH): {
+        'finding': "signs of low-grade inflammation",
+        'meal_plan': "Eat oily fish twice a week and plenty of colourful vegetables, berries, olive oil and nuts; limit processed meat",
+        'exercise_plan': "Build up regular moderate activity; prioritise sleep and recovery between hard sessions",
+        'supplement_advice': "Omega-3 (fish oil) may help lower inflammation; discuss the dose with your clinician",
+        'risk_assessment': "Elevated CRP is associated with cardiovascular risk; retest once any recent infection or injury has passed",
+    },
+    ('lymph_pct', LOW): {
+        'finding': "a lower share of lymphocytes, which can follow stress, poor sleep or a recent illness",
+        'meal_plan': "Cover protein, zinc and vitamin C needs with whole foods",
+        'exercise_plan': "Keep training moderate while recovering; very long, intense sessions temporarily suppress immunity",
+        'risk_assessment': "If it stays low on a repeat test, ask your clinician about a full blood count review",
+    },
+    ('lymph_pct', HIGH): {
+        'finding': "a higher share of lymphocytes, common during or after a viral infection",
+        'exercise_plan': "Ease off intense training if you are fighting an infection",
+        'risk_assessment': "Recheck in a few weeks; a persistently high value should be reviewed by a clinician",
+    },
+    ('mcv', LOW): {
+        'finding': "smaller red blood cells than usual, often a sign of low iron",
+        'meal_plan': "Eat iron-rich foods (red meat, lentils, spinach) with vitamin C; keep tea and coffee away from meals",
+        'exercise_plan': "Expect reduced endurance until iron status improves; build volume gradually",
+        'supplement_advice': "Ask your clinician about a ferritin test before taking iron supplements",
+        'risk_assessment': "Low MCV can indicate iron-deficiency anaemia; ferritin and haemoglobin tests confirm it",
+    },
+    ('mcv', HIGH): {
+        'finding': "larger red blood cells than usual, often linked to low B12 or folate, or to alcohol",
+        'meal_plan': "Include B12 and folate sources (eggs, dairy, fish, leafy greens, legumes) and limit alcohol",
+        'supplement_advice': "Ask your clinician about testing B12 and folate before supplementing",
+        'risk_assessment': "High MCV can indicate B12 or folate deficiency; both are easy to test and correct",
+    },
+    ('rdw', LOW): {
+        'finding': "very uniform red blood cell sizes, which is rarely a concern on its own",
+    },
+    ('rdw', HIGH): {
+        'finding': "more variation in red blood cell size than usual, often an early sign of a nutrient shortfall",
+        'meal_plan': "Cover iron, B12 and folate with a varied diet of meat or legumes, leafy greens and whole grains",
+        'supplement_advice': "Ask your clinician about iron, B12 and folate tests to find which one is short",
+        'risk_assessment': "A high RDW is associated with higher all-cause mortality risk in studies; worth following up",
+    },
+    ('wbc', LOW): {
+        'finding': "a lower white blood cell count than usual",
+        'meal_plan': "Eat enough overall energy and protein; very low-calorie diets can lower white cell counts",
+        'exercise_plan': "Avoid overtraining and schedule rest days",
+        'risk_assessment': "A persistently low count can mean reduced resistance to infection; review it with a clinician",
+    },
+    ('wbc', HIGH): {
+        'finding': "a higher white blood cell count, commonly from infection, inflammation, stress or smoking",
+        'exercise_plan': "Rest until any active infection has cleared",
+        'risk_assessment': "Retest once you are well; a persistently high count needs a clinician's review",
+    },
+    ('alk_phos', LOW): {
+        'finding': "lower than usual, occasionally linked to low zinc or magnesium",
+        'meal_plan': "Include zinc and magnesium sources such as nuts, seeds, whole grains and shellfish",
+    },
+    ('alk_phos', HIGH): {
+        'finding': "higher than usual, which can come from the liver or from bone",
+        'meal_plan': "Limit alcohol and keep saturated fat and added sugar low to support liver health",
+        'risk_assessment': "Ask your clinician whether liver enzymes (ALT, GGT) or a vitamin D test would explain it",
+    },
+    ('creatinine', LOW): {
+        'finding': "lower than usual, which usually reflects lower muscle mass",
+        'meal_plan': "Make sure each meal includes protein to support muscle",
+        'exercise_plan': "Add two or three resistance training sessions a week to build muscle",
+    },
+    ('creatinine', HIGH): {
+        'finding': "higher than usual; can reflect high muscle mass, dehydration or reduced kidney filtration",
+        'meal_plan': "Stay well hydrated and keep salt intake moderate",
+        'supplement_advice': "Pause creatine supplements before a retest; they raise creatinine",
+        'risk_assessment': "Ask your clinician for an eGFR to check kidney filtration",
+    },
+}
+
+# Section headings, lines used when no marker rule applies, and lines for a biological age ahead of chronological
+SECTION_HEADINGS = {
+    'meal_plan': "Nutrition priorities",
+    'exercise_plan': "Exercise priorities",
+    'supplement_advice': "Supplements to discuss with your clinician",
+    'risk_assessment': "Risks to watch",
+}
+BASELINE = {
+    'meal_plan': ("Build meals around vegetables, whole grains, legumes and lean protein",
+                  "Keep added sugar, refined carbohydrates and ultra-processed food occasional"),
+    'exercise_plan': ("Aim for 150 minutes of moderate activity a week",
+                      "Add resistance training for every major muscle group twice a week"),
+    'supplement_advice': ("Your markers do not point to a specific supplement; a varied diet covers most needs",),
+    'risk_assessment': ("No marker is outside its normal range; repeat the panel yearly to track trends",),
+}
+AGE_AHEAD = {
+    'exercise_plan': "Your biological age is ahead of your chronological age: regular aerobic and strength training are the best-supported ways to slow it",
+    'risk_assessment': "Your biological age is ahead of your chronological age, which is associated with higher long-term risk; review the flagged markers with your clinician",
+}
+FOOTER = "Rule-based guidance from your results, not a diagnosis; discuss them with your clinician."
+
+# Lead line of a section the LLM could not deliver, shown above its rule-based stand-in
+FALLBACK_LEAD = f"{FALLBACK_TEXT}; showing rule-based guidance instead."
+
+
+def _compile(field):
+    """Per-marker (low, high) lines of one RULES field, indexed like REFERENCE.markers"""
+    return tuple(
+        (RULES.get((marker, LOW), {}).get(field), RULES.get((marker, HIGH), {}).get(field))
+        for marker in REFERENCE.markers
+    )
+
+
+_LINES = {prompt_type: _compile(prompt_type) for prompt_type in SECTION_HEADINGS}
+_FINDINGS = _compile('finding')
+_LABELS = tuple(MARKER_LABELS.get(marker, marker) for marker in REFERENCE.markers)
+
+
+def _classify(biomarkers):
+    """[(marker index, value, health status, LOW/HIGH side of the optimal range)] for measured markers"""
+    values = marker_values(biomarkers)
+    statuses = REFERENCE.health_status(values).tolist()
+    sides = (values > REFERENCE.optimal_high).tolist()
+    return [
+        (i, value, status, HIGH if side else LOW)
+        for i, (value, status, side) in enumerate(zip(values.tolist(), statuses, sides))
+        if not math.isnan(value)
+    ]
+
+
+def _age_delta(user_data):
+    age, biological_age = user_data.get('age'), user_data.get('phenotypic_age')
+    if age is None or biological_age is None or biological_age != biological_age:
+        return None
+    return float(biological_age) - float(age)
+
+
+def _analysis_blocks(user_data, markers):
+    summary = []
+    delta = _age_delta(user_data)
+    if delta is not None:
+        if abs(delta) < AGE_DELTA_YEARS:
+            comparison = "in line with your chronological age"
+        else:
+            comparison = f"{abs(delta):.1f} years {'older' if delta > 0 else 'younger'} than your chronological age"
+        summary.append(f"Biological age {float(user_data['phenotypic_age']):g}: {comparison} of {user_data['age']}")
+    if markers:
+        counts = [0, 0, 0]
+        for _, _, status, _ in markers:
+            counts[status] += 1
+        score = round(sum(HEALTH_STATUS_SCORES[status] for _, _, status, _ in markers) / len(markers))
+        summary.append(f"{counts[OPTIMAL]} of {len(markers)} measured markers are optimal, {counts[NORMAL]} normal and "
+                       f"{counts[OUTSIDE_RANGE]} outside the normal range (health score {score}/100)")
+
+    outside, suboptimal = [], []
+    for i, value, status, side in markers:
+        if status == OPTIMAL:
+            continue
+        line = f"{_LABELS[i]} {value:g} {REFERENCE.units[i]} (normal {REFERENCE.range_labels[i]})"
+        finding = _FINDINGS[i][side]
+        (outside if status == OUTSIDE_RANGE else suboptimal).append(f"{line}: {finding}" if finding else line)
+
+    blocks = [("Summary", summary)]
+    if outside:
+        blocks.append(("Outside the normal range", outside))
+    if suboptimal:
+        blocks.append(("In range but not optimal", suboptimal))
+    measured = {i for i, *_ in markers}
+    not_measured = [_LABELS[i] for i in range(len(REFERENCE.markers)) if i not in measured]
+    if not_measured:
+        blocks.append(("Not measured", [', '.join(not_measured)]))
+    return blocks
+
+
+def _section_blocks(prompt_type, user_data, markers):
+    lines = _LINES[prompt_type]
+    # Markers outside the normal range first, then those short of optimal
+    flagged = sorted((status != OUTSIDE_RANGE, i, side) for i, _, status, side in markers if status != OPTIMAL)
+    items = []
+    for _, i, side in flagged:
+        line = lines[i][side]
+        if line and line not in items:
+            items.append(line)
+    delta = _age_delta(user_data)
+    if delta is not None and delta >= AGE_DELTA_YEARS and prompt_type in AGE_AHEAD:
+        items.append(AGE_AHEAD[prompt_type])
+    return [(SECTION_HEADINGS[prompt_type], items or list(BASELINE[prompt_type]))]
+
+
+def rule_blocks(user_data, sections=None):
+    """{slot: [(heading, [line, ...])]} for each of `sections` ({slot: prompt_type}, default AI_SECTIONS)"""
+    markers = _classify(user_data['biomarkers'])
+    return {
+        slot: _analysis_blocks(user_data, markers) if prompt_type == 'analysis'
+        else _section_blocks(prompt_type, user_data, markers)
+        for slot, prompt_type in (sections or AI_SECTIONS).items()
+    }
+
+
+def to_markdown(blocks, lead=None):
+    parts = [f"_{lead}_"] if lead else []
+    parts += [f"### {heading}\n\n" + '\n'.join(f"- {line}" for line in lines) for heading, lines in blocks if lines]
+    parts.append(f"_{FOOTER}_")
+    return '\n\n'.join(parts)
+
+
+def to_html(blocks, lead=None):
+    parts = [f"<p><em>{escape(lead)}</em></p>"] if lead else []
+    parts += [
+        f"<h3>{escape(heading)}</h3>\n<ul>\n" + ''.join(f"<li>{escape(line)}</li>\n" for line in lines) + "</ul>"
+        for heading, lines in blocks if lines
+    ]
+    parts.append(f"<p><em>{escape(FOOTER)}</em></p>")
+    return '\n'.join(parts)
+
+
+def rule_sections(user_data, sections=None):
+    """{slot: markdown} of rule-based advice; the drop-in for generate_sections that makes no LLM call"""
+    return {slot: to_markdown(blocks) for slot, blocks in rule_blocks(user_data, sections).items()}
+
+
+def rule_sections_html(user_data, sections=None, lead=None):
+    """{slot: HTML} of rule-based advice, rendered directly without the markdown converter"""
+    return {slot: to_html(blocks, lead) for slot, blocks in rule_blocks(user_data, sections).items()}
@@ -0,0 +1,74 @@
+import threading
+
+
+class _Call:
+    """One in-flight execution; followers block on `done` and read its value or error"""
+
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+    def wait(self, timeout=None):
+        if not self.done.wait(timeout):
+            raise TimeoutError("timed out waiting for an identical in-flight call")
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls that share a key into one execution. The first caller (the
+    leader) runs the work; callers arriving before it finishes wait and receive the same
+    value or exception. Nothing is remembered once the call completes; that is the cache's job.
+    `on_join()` is called each time a caller joins instead of running the work.
+    """
+
+    def __init__(self, on_join=None):
+        self._on_join = on_join or (lambda: None)
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {'leaders': 0, 'coalesced': 0}
+
+    def begin(self, key):
+        """Join the call in flight for `key` or start one; returns (call, is_leader)"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self._stats['coalesced'] += 1
+                joined = True
+            else:
+                call = self._calls[key] = _Call()
+                self._stats['leaders'] += 1
+                joined = False
+        if joined:
+            self._on_join()
+        return call, not joined
+
+    def finish(self, key, call, value=None, error=None):
+        """Leader only: publish the outcome to every waiter and retire the key"""
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.value, call.error = value, error
+        call.done.set()
+
+    def do(self, key, fn, timeout=None):
+        """Return fn() for the leader, or the leader's result for anyone who joined it"""
+        call, leader = self.begin(key)
+        if not leader:
+            return call.wait(timeout)
+        try:
+            value = fn()
+        except BaseException as e:
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,31 @@
+"""
+Per-thread, per-process SQLite connections for the file-backed stores (history, job queue, LLM
+cache). sqlite3 connections must cross neither threads nor a fork, so each thread opens its own on
+first use and reopens it in a forked worker. Connections autocommit (transactions are explicit
+BEGIN/COMMIT) and use WAL with synchronous=NORMAL, so readers never block the single writer.
+"""
+import os
+import sqlite3
+import threading
+
+
+class ThreadConnections:
+    """One connection to `path` per thread and process, opened lazily by connection()"""
+
+    def __init__(self, path, row_factory=None, timeout=5):
+        self.path = path
+        self.row_factory = row_factory
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            if self.row_factory is not None:
+                conn.row_factory = self.row_factory
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
@@ -0,0 +1,67 @@
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+
+class StubResponse:
+    """Minimal stand-in for a GenerateContentResponse"""
+
+    def __init__(self, text, prompt_tokens, output_tokens):
+        self.text = text
+        self.usage_metadata = SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=output_tokens,
+            total_token_count=prompt_tokens + output_tokens
+        )
+
+
+class StubModel:
+    """
+    Offline stand-in for genai.GenerativeModel used by benchmarks, load tests and unit tests.
+    `latency` is either a number of seconds or a callable taking the prompt; prompts
+    containing `fail_on` raise instead of answering. A `generation_config` carrying a
+    `response_schema` is answered with a JSON object filling each of the schema's properties.
+    With `answer_tokens` set, answers are padded to that many tokens (fewer when the
+    generation_config's max_output_tokens is lower), each adding `token_latency` seconds.
+    """
+
+    def __init__(self, latency=0.0, fail_on=None, model_name='models/stub', answer_tokens=None, token_latency=0.0):
+        self.latency = latency
+        self.fail_on = fail_on
+        self.model_name = model_name
+        self.answer_tokens = answer_tokens
+        self.token_latency = token_latency
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self._lock = threading.Lock()
+
+    def _latency_for(self, prompt):
+        return self.latency(prompt) if callable(self.latency) else self.latency
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        with self._lock:
+            self.calls += 1
+
+        config = kwargs.get('generation_config') or {}
+        answer_tokens = self.answer_tokens
+        if answer_tokens is not None and config.get('max_output_tokens'):
+            answer_tokens = min(answer_tokens, config['max_output_tokens'])
+        time.sleep(self._latency_for(prompt) + (answer_tokens or 0) * self.token_latency)
+        if self.fail_on and self.fail_on in prompt:
+            raise RuntimeError("stub model failure")
+
+        text = f"**Stub response**\n\n- Prompt length: {len(prompt)} characters\n- Call: {self.calls}"
+        if answer_tokens:
+            text = (text + "\n\n" + "Stub text. " * answer_tokens)[:answer_tokens * 4]
+        schema = config.get('response_schema')
+        if schema:
+            text = json.dumps({field: f"**Stub {field}**\n\n{text}" for field in schema['properties']})
+        response = StubResponse(text, max(1, len(prompt) // 4), max(1, len(text) // 4))
+        with self._lock:
+            self.prompt_tokens += response.usage_metadata.prompt_token_count
+            self.output_tokens += response.usage_metadata.candidates_token_count
+        if stream:
+            return iter([response])
+        return response